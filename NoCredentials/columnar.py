@@ -0,0 +1,194 @@
+import os
+import glob
+import json
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for output_format "parquet" / "arrow"
+    pa = pq = None
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+ROW_GROUP_POSTS = 1000       # Posts buffered before a row group is written
+ROW_GROUP_COMMENTS = 100000  # ...or comments, whichever fills up first
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+POST_COLUMNS = [
+    ("id", "string"),
+    ("title", "string"),
+    ("content", "string"),
+    ("author", "string"),
+    ("created_utc", "float64"),
+    ("score", "int64"),
+    ("url", "string"),
+    ("num_comments", "int64"),
+    ("permalink", "string")
+]
+COMMENT_COLUMNS = [
+    ("post_id", "string"),
+    ("id", "string"),
+    ("parent_id", "string"),
+    ("depth", "int32"),
+    ("author", "string"),
+    ("content", "string"),
+    ("created_utc", "float64"),
+    ("score", "int64")
+]
+
+def schema(columns):
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in columns])
+
+def flatten_comments(post_id, comments):
+    """
+    Yield one row per comment of a nested comment tree, depth first, with
+    post_id, parent_id (t3_{post_id} for top-level comments) and depth.
+    Comments saved without an id get a position-based one ({post_id}:{n}).
+    """
+    stack = [(comment, f"t3_{post_id}", 0) for comment in reversed(comments)]
+    position = 0
+    while stack:
+        comment, parent_id, depth = stack.pop()
+        comment_id = comment.get("id") or f"{post_id}:{position}"
+        position += 1
+        yield {
+            "post_id": post_id,
+            "id": comment_id,
+            "parent_id": parent_id,
+            "depth": depth,
+            "author": comment.get("author"),
+            "content": comment.get("content"),
+            "created_utc": comment.get("created_utc"),
+            "score": comment.get("score")
+        }
+        stack.extend((reply, comment_id, depth + 1) for reply in reversed(comment.get("replies", [])))
+
+def iter_comment_rows(post):
+    """
+    The flat comment rows of a saved post: from its nested comments or, for a
+    thread spilled to disk, read line by line from its comments_file.
+    """
+    if post.get("comments_file"):
+        with open(post["comments_file"], "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    yield from flatten_comments(post["id"], post.get("comments", []))
+
+class TableFile:
+    """
+    One Parquet or Arrow IPC file written row group by row group.
+    The file is written under a .tmp name and only renamed into place on
+    close, so readers never see a file without its footer.
+    """
+    def __init__(self, filename, columns, fmt):
+        self.filename = filename
+        self.tmp_file = filename + ".tmp"
+        self.columns = columns
+        self.schema = schema(columns)
+        if fmt == "parquet":
+            self.writer = pq.ParquetWriter(self.tmp_file, self.schema, compression="zstd")
+        else:
+            self.sink = pa.OSFile(self.tmp_file, "wb")
+            self.writer = pa.ipc.new_file(self.sink, self.schema)
+        self.fmt = fmt
+        self.rows = {name: [] for name, _ in columns}
+        self.pending = 0
+
+    def add(self, row):
+        for name, values in self.rows.items():
+            values.append(row.get(name))
+        self.pending += 1
+
+    def write_row_group(self):
+        if not self.pending:
+            return
+        self.writer.write_table(pa.Table.from_pydict(self.rows, schema=self.schema))
+        self.rows = {name: [] for name, _ in self.columns}
+        self.pending = 0
+
+    def _close_writer(self):
+        self.writer.close()
+        if self.fmt == "arrow":
+            self.sink.close()
+
+    def close(self):
+        self.write_row_group()
+        self._close_writer()
+        os.replace(self.tmp_file, self.filename)
+
+    def abort(self):
+        self._close_writer()
+        if os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
+
+class ColumnarWriter:
+    """
+    Writes posts and their flattened comments as two tables,
+    {base_name}_posts/ and {base_name}_comments/, in Parquet or Arrow IPC
+    (Feather v2) format. Rows are buffered into row groups and written while
+    the crawl is running. Every run adds one part-NNN file to each folder, so
+    both folders can be read as a dataset (e.g. pyarrow.dataset.dataset(folder)).
+    With append=False the parts of earlier runs are deleted on close;
+    otherwise the new part is added to them.
+    """
+    def __init__(self, folder, base_name, fmt="parquet", append=False):
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet/Arrow output (pip install pyarrow)")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown columnar format: {fmt}")
+        self.append = append
+        self.count = 0
+        self.folders = []
+        self.tables = []
+        for table, columns in (("posts", POST_COLUMNS), ("comments", COMMENT_COLUMNS)):
+            table_folder = os.path.join(folder, f"{base_name}_{table}")
+            os.makedirs(table_folder, exist_ok=True)
+            for leftover in glob.glob(os.path.join(table_folder, "*.tmp")):
+                os.remove(leftover)  # Parts of an interrupted run
+            # Numbering (and, with append=False, cleanup) covers parts of either format
+            parts = sorted(path for ext in FORMATS.values() for path in glob.glob(os.path.join(table_folder, "part-*" + ext)))
+            index = max(int(os.path.basename(path)[5:8]) for path in parts) + 1 if parts else 1
+            filename = os.path.join(table_folder, f"part-{index:03d}{FORMATS[fmt]}")
+            self.folders.append((table_folder, parts))
+            self.tables.append(TableFile(filename, columns, fmt))
+        self.posts, self.comments = self.tables
+
+    def write(self, post):
+        self.posts.add(post)
+        for row in iter_comment_rows(post):
+            self.comments.add(row)
+            if self.comments.pending >= ROW_GROUP_COMMENTS:
+                self.comments.write_row_group()
+        self.count += 1
+        if self.posts.pending >= ROW_GROUP_POSTS:
+            self.posts.write_row_group()
+            self.comments.write_row_group()
+
+    def close(self):
+        for table in self.tables:
+            table.close()
+        if not self.append:
+            for _, parts in self.folders:
+                for filename in parts:
+                    os.remove(filename)
+        logging.info(f"Columnar tables written: {', '.join(table.filename for table in self.tables)}")
+
+    def abort(self):
+        """
+        Drop this run's unfinished parts; earlier parts are left untouched.
+        """
+        for table in self.tables:
+            table.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,197 @@
+import os
+import json
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+SPILL_COMMENTS = 2000        # Comments of one post held in memory; bigger threads are streamed to a thread file
+SPILL_DEPTH = 100            # Reply depth that also sends a thread to a thread file (json nests ~500 replies at most)
+ROW_KEYS = ("post_id", "id", "parent_id", "depth")  # Row keys that place a comment in its thread; never projected away
+
+class CommentRecord:
+    """
+    One comment in flat form. id is the comment's fullname (t1_...) and
+    parent_id the fullname of its parent (t3_... for top-level comments),
+    as Reddit reports them; depth is 0 for top-level comments.
+    """
+    __slots__ = ("id", "parent_id", "depth", "author", "content", "created_utc", "score")
+
+    def __init__(self, id, parent_id, depth, author, content, created_utc, score):
+        self.id = id
+        self.parent_id = parent_id
+        self.depth = depth
+        self.author = author
+        self.content = content
+        self.created_utc = created_utc
+        self.score = score
+
+    @classmethod
+    def from_json(cls, c_data, depth=0):
+        return cls(
+            c_data.get('name'),
+            c_data.get('parent_id'),
+            depth,
+            c_data.get('author', '[deleted]'),
+            c_data.get('body', ''),
+            c_data.get('created_utc', 0),
+            c_data.get('score', 0)
+        )
+
+    def to_row(self, post_id, fields=None):
+        """
+        The comment as a flat row (see columnar.flatten_comments).
+        fields, if given, limits it to those keys (plus ROW_KEYS).
+        """
+        row = {
+            "post_id": post_id,
+            "id": self.id,
+            "parent_id": self.parent_id,
+            "depth": self.depth,
+            "author": self.author,
+            "content": self.content,
+            "created_utc": self.created_utc,
+            "score": self.score
+        }
+        if fields is not None:
+            row = {key: value for key, value in row.items() if key in ROW_KEYS or key in fields}
+        return row
+
+    def to_dict(self, fields=None):
+        """
+        The comment in the nested output format (without its replies).
+        fields, if given, limits it to those keys (plus "replies").
+        """
+        if fields is not None:
+            node = {field: getattr(self, field) for field in fields}
+            node["replies"] = []
+            return node
+        return {
+            "id": self.id,
+            "author": self.author,
+            "content": self.content,
+            "created_utc": self.created_utc,
+            "score": self.score,
+            "replies": []
+        }
+
+def parse_children(children, depth=0):
+    """
+    Flatten a list of listing children (t1 comments and 'more' stubs) with an
+    explicit stack instead of recursion, so reply chains of any depth parse.
+    Returns (records, more_ids): comment records in the same depth-first order
+    as the page, and the child ids of every 'more' stub found.
+    """
+    records = []
+    more_ids = []
+    stack = [(child, depth) for child in reversed(children)]
+    while stack:
+        thing, depth = stack.pop()
+        if thing['kind'] == 'more':
+            more_ids.extend(thing['data'].get('children', []))
+            continue
+        c_data = thing['data']
+        records.append(CommentRecord.from_json(c_data, depth))
+        replies = c_data.get('replies')
+        if replies:
+            stack.extend((reply, depth + 1) for reply in reversed(replies['data']['children']))
+    return records, more_ids
+
+def to_nested(records, fields=None):
+    """
+    Build the nested comment dicts ({..., "replies": [...]}) used in the
+    output files. Records whose parent is not among them become top-level.
+    fields is passed on to CommentRecord.to_dict.
+    """
+    nodes = [record.to_dict(fields) for record in records]
+    by_id = {record.id: node for record, node in zip(records, nodes)}
+    roots = []
+    for record, node in zip(records, nodes):
+        parent = by_id.get(record.parent_id)
+        if parent is not None:
+            parent["replies"].append(node)
+        else:
+            roots.append(node)
+    return roots
+
+class CommentBuffer:
+    """
+    Collects the CommentRecords of one post. Up to `limit` records are held
+    in memory; once a thread grows past that, every record (held or new) is
+    streamed to {folder}/{post_id}.jsonl as a flat row instead, so a
+    mega-thread is never held whole, neither here nor as nested dicts
+    further down the pipeline. A reply chain reaching `max_depth` spills the
+    same way: nested that deep, json.dumps would hit the recursion limit.
+    folder=None never spills. fields, if given, projects the comments onto
+    those keys, nested or spilled (see CommentRecord.to_dict / to_row).
+    """
+    def __init__(self, post_id, folder=None, limit=SPILL_COMMENTS, max_depth=SPILL_DEPTH, fields=None):
+        self.post_id = post_id
+        self.fields = fields
+        self.folder = folder
+        self.limit = limit
+        self.max_depth = max_depth
+        self.records = []
+        self.count = 0
+        self.filename = None
+        self.file = None
+
+    def __len__(self):
+        return self.count
+
+    def append(self, record):
+        self.count += 1
+        if self.file:
+            self._write(record)
+            return
+        self.records.append(record)
+        if self.folder and (len(self.records) > self.limit or record.depth >= self.max_depth):
+            self._spill()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def _spill(self):
+        os.makedirs(self.folder, exist_ok=True)
+        self.filename = os.path.join(self.folder, f"{self.post_id}.jsonl")
+        self.file = open(self.filename + ".tmp", "w", encoding="utf-8")
+        for record in self.records:
+            self._write(record)
+        self.records = []
+
+    def _write(self, record):
+        self.file.write(json.dumps(record.to_row(self.post_id, self.fields), ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def result(self):
+        """
+        The nested comment dicts, or for a spilled thread a reference to its
+        file: {"file": ..., "count": ...} (see with_comments).
+        """
+        if self.file is None:
+            return to_nested(self.records, self.fields)
+        self.file.close()
+        os.replace(self.filename + ".tmp", self.filename)
+        return {"file": self.filename, "count": self.count}
+
+    def abort(self):
+        if self.file:
+            self.file.close()
+            os.remove(self.filename + ".tmp")
+        self.records = []
+
+def with_comments(post, comments):
+    """
+    The output record of a post: nested comments inline, or for a spilled
+    thread an empty list plus comments_file / comments_count.
+    """
+    if isinstance(comments, dict):
+        return dict(post, comments=[], comments_file=comments["file"], comments_count=comments["count"])
+    return dict(post, comments=comments)
+
+def saved_comments(post):
+    """
+    The comments of a saved post in the form with_comments takes (for reuse).
+    """
+    if post.get("comments_file"):
+        return {"file": post["comments_file"], "count": post.get("comments_count")}
+    return post.get("comments", [])
@@ -0,0 +1,233 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from utils import make_request, BASE_URL, MAX_WORKERS
+from fetch_posts import post_record, PAGE_SIZE
+from metrics import registry, propagate
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+TIME_WINDOWS = ("hour", "day", "week", "month", "year", "all")
+SEARCH_QUERIES = ("self:yes", "self:no")  # Disjoint searches, each with its own ~1000-post cap
+MIN_YIELD = 5                # New unique posts per request below which a listing is dropped
+YIELD_WINDOW = 2             # Recent requests the yield is averaged over
+PAGE_RETRIES = 3             # Retries of a failed listing page before its source counts as failed
+RETRY_SECONDS = 5            # Backoff before the first retry, doubled for each further one
+
+class ListingSource:
+    """
+    One listing of a subreddit (new, hot, top?t=week, a search, ...) paged
+    with its own `after` cursor, plus how many of its posts were new.
+    """
+    def __init__(self, sort, time_filter=None, query=None):
+        self.sort = sort
+        self.time_filter = time_filter
+        self.query = query
+        self.after = None
+        self.requests = 0
+        self.listed = 0
+        self.unique = 0
+        self.recent = []
+        self.stopped = None
+
+    @property
+    def name(self):
+        return ":".join(part for part in (self.sort, self.time_filter, self.query) if part)
+
+    @property
+    def time_sorted(self):
+        """
+        True if the listing is newest first, so paging can stop at the cutoff.
+        """
+        return self.sort in ("new", "search")
+
+    def params(self):
+        params = {}
+        if self.time_filter:
+            params["t"] = self.time_filter
+        if self.sort == "search":
+            params.update({"q": self.query, "restrict_sr": 1, "sort": "new"})
+        return params
+
+    def record(self, listed, unique):
+        self.requests += 1
+        self.listed += listed
+        self.unique += unique
+        self.recent = (self.recent + [unique])[-YIELD_WINDOW:]
+        registry.inc("discovery_requests_total", source=self.name)
+        registry.inc("discovery_unique_posts_total", unique, source=self.name)
+
+    def recent_yield(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    def stats(self):
+        return {
+            "source": self.name,
+            "requests": self.requests,
+            "listed": self.listed,
+            "unique": self.unique,
+            "yield": self.unique / self.requests if self.requests else 0.0,
+            "stopped": self.stopped
+        }
+
+def default_sources(search_queries=SEARCH_QUERIES):
+    """
+    new, hot, top and controversial over every time window, and time-sorted searches.
+    """
+    sources = [ListingSource("new"), ListingSource("hot")]
+    for sort in ("top", "controversial"):
+        sources += [ListingSource(sort, window) for window in TIME_WINDOWS]
+    sources += [ListingSource("search", "all", query) for query in search_queries]
+    return sources
+
+class Discovery:
+    """
+    Fan-out post discovery. Every listing stops at ~1000 posts, but new,
+    hot, top/controversial per window and searches each reach a different
+    slice of the subreddit. All active sources are paged at once, one page
+    each per round, and their posts are merged through a set of seen ids,
+    so a post reaches the comment fetchers only once.
+    Each source's yield (new unique posts per request) is tracked; once it
+    stays below min_yield for YIELD_WINDOW requests the source is dropped,
+    so the request budget goes to coverage instead of duplicates.
+    fetch_page(source) returns (posts, next_after) or None on failure; a
+    failed page is retried with backoff before its source is given up.
+    """
+    def __init__(self, fetch_page, sources=None, min_yield=MIN_YIELD, workers=MAX_WORKERS, seen=None):
+        self.fetch_page = fetch_page
+        self.sources = sources or default_sources()
+        self.min_yield = min_yield
+        self.workers = workers
+        self.seen = set(seen or ())
+
+    def fetch(self, source):
+        for attempt in range(PAGE_RETRIES + 1):
+            page = self.fetch_page(source)
+            if page is not None or attempt == PAGE_RETRIES:
+                return page
+            delay = RETRY_SECONDS * 2 ** attempt
+            logging.warning(f"Listing {source.name} failed, retry {attempt + 1}/{PAGE_RETRIES} in {delay}s...")
+            registry.inc("backoff_seconds_total", delay)
+            time.sleep(delay)
+
+    def state(self):
+        """
+        Cursor and stop reason of every source, for the checkpoint journal.
+        """
+        return {source.name: {"after": source.after, "stopped": source.stopped} for source in self.sources}
+
+    def restore(self, state):
+        """
+        Continue from a journaled state(): finished sources stay stopped, the
+        others resume from their cursor, and failed ones are tried again.
+        """
+        for source in self.sources:
+            saved = state.get(source.name)
+            if saved:
+                source.after = saved["after"]
+                source.stopped = saved["stopped"] if saved["stopped"] != "failed" else None
+
+    def discover(self, cutoff, since=None):
+        """
+        Yield lists of unseen posts created after cutoff (and after the since
+        high-water mark, if given), one per page fetched.
+        """
+        def too_old(post):
+            created = post.get("created_utc", 0)
+            return created < cutoff or (since and (post["id"] == since["id"] or created < since["created_utc"]))
+
+        active = [source for source in self.sources if not source.stopped]
+        fetch_page = propagate(self.fetch)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while active:
+                pages = list(executor.map(fetch_page, active))
+                for source, page in zip(active, pages):
+                    if page is None:
+                        source.stopped = "failed"
+                        continue
+                    posts, after = page
+                    fresh = []
+                    for post in posts:
+                        if too_old(post) or post["id"] in self.seen:
+                            continue
+                        self.seen.add(post["id"])
+                        fresh.append(post)
+                    source.record(len(posts), len(fresh))
+                    source.after = after
+                    if not after:
+                        source.stopped = "exhausted"
+                    elif source.time_sorted and posts and too_old(posts[-1]):
+                        source.stopped = "reached cutoff"
+                    elif source.requests >= YIELD_WINDOW and source.recent_yield() < self.min_yield:
+                        source.stopped = "low yield"
+                    if fresh:
+                        yield fresh
+                active = [source for source in active if not source.stopped]
+
+    def report(self):
+        """
+        Log and return the per-source stats.
+        """
+        stats = [source.stats() for source in self.sources]
+        for row in stats:
+            logging.info(f"  {row['source']:<24} {row['requests']:>4} requests, {row['unique']:>5} unique "
+                         f"of {row['listed']:>5} listed ({row['yield']:.1f}/request), {row['stopped'] or 'active'}")
+        return stats
+
+def fetch_listing_page(subreddit_name, source, cache=None):
+    """
+    One page of a listing from the JSON endpoints: (posts, next_after), or None.
+    """
+    params = dict(source.params(), limit=PAGE_SIZE)
+    if source.after:
+        params["after"] = source.after
+    data = make_request(f"{BASE_URL}/r/{subreddit_name}/{source.sort}.json", params, cache=cache)
+    if not data or 'data' not in data or 'children' not in data['data']:
+        logging.warning(f"Listing {source.name} returned no data.")
+        return None
+    posts = [post_record(child['data']) for child in data['data']['children'] if child.get('kind') == 't3']
+    return posts, data['data'].get('after')
+
+def iter_discovered_posts(subreddit_name, start_year, checkpoint=None, since=None, min_yield=MIN_YIELD, workers=MAX_WORKERS,
+                          cache=None):
+    """
+    Like fetch_posts.iter_posts, but discovers posts through every listing
+    at once (see Discovery). A resumed run yields the journaled posts and
+    continues discovery with them marked as seen. Each source's cursor is
+    journaled after the posts it listed, so only unfinished sources are
+    paged again.
+    """
+    if checkpoint and checkpoint.posts_done:
+        logging.info(f"Post discovery already complete in checkpoint ({len(checkpoint.posts)} posts).")
+        yield from list(checkpoint.posts)
+        return
+
+    resumed = list(checkpoint.posts) if checkpoint else []
+    yield from resumed
+    cutoff = int(time.mktime(time.strptime(f"01-01-{start_year}", "%d-%m-%Y")))
+    discovery = Discovery(lambda source: fetch_listing_page(subreddit_name, source, cache), min_yield=min_yield,
+                          workers=workers, seen=(post["id"] for post in resumed))
+    if checkpoint and "discovery" in checkpoint.meta:
+        discovery.restore(checkpoint.meta["discovery"])
+    logging.info(f"Discovering posts from r/{subreddit_name} across {len(discovery.sources)} listings...")
+    count = len(resumed)
+    for page in discovery.discover(cutoff, since):
+        if checkpoint:
+            checkpoint.record_posts(page, None)
+            # Only sources whose posts are journaled have advanced, so a resume never skips a page
+            checkpoint.record_meta("discovery", discovery.state())
+        yield from page
+        count += len(page)
+        logging.info(f"Discovered {count} posts so far...")
+
+    failed = [source.name for source in discovery.sources if source.stopped == "failed"]
+    if checkpoint:
+        checkpoint.record_meta("discovery", discovery.state())
+        if not failed:
+            checkpoint.record_posts_done()
+    logging.info(f"Discovered {count} unique posts:")
+    discovery.report()
+    if failed:
+        # Posts only a failed listing would have found are missing: the run fails and keeps its checkpoint
+        raise RuntimeError(f"Discovery of r/{subreddit_name} incomplete, listings failed: {', '.join(failed)}")
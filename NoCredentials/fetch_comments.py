@@ -1,71 +1,121 @@
+import time
 import logging
-from utils import make_request, safe_sleep
+from utils import make_request, BASE_URL
+from comment_tree import CommentRecord, CommentBuffer, parse_children
+from metrics import registry
 
-def fetch_comments_for_post(post_id, permalink):
+MORE_CHILDREN_URL = f"{BASE_URL}/api/morechildren.json"
+MORE_CHILDREN_BATCH = 100    # Reddit accepts at most 100 ids per morechildren call
+
+def fetch_comment_records(post_id, permalink, limiter=None, expand_more=True, params=None, records=None, cache=None):
     """
-    Fetch comments for a single post using JSON endpoint.
+    Fetch comments for a single post using JSON endpoint, as flat
+    CommentRecords (see comment_tree.py) in depth-first order.
+    'more' stubs are collected and, if expand_more is set, resolved in
+    batched /api/morechildren calls. params (limit / depth / sort) are
+    sent with the request to shrink the returned tree. Records are added
+    to `records` (a list or a CommentBuffer) if given.
+    Returns None if the request failed, so callers can retry it later.
     """
-    url = f"https://www.reddit.com{permalink}.json"
-    data = make_request(url)
-    
-    comments_list = []
+    url = f"{BASE_URL}{permalink}.json"
+    data = make_request(url, params or None, limiter=limiter, cache=cache)
     
-    if not data or len(data) < 2:
-        return comments_list
+    if data is None:
+        return None
+    records = records if records is not None else []
+    if len(data) < 2:
+        return records
         
     # data[0] is the post, data[1] is the comments
-    comments_data = data[1]['data']['children']
-    
-    def parse_comment(comment_dict):
-        if comment_dict['kind'] == 'more':
-            return None
-            
-        c_data = comment_dict['data']
-        parsed = {
-            "author": c_data.get('author', '[deleted]'),
-            "content": c_data.get('body', ''),
-            "created_utc": c_data.get('created_utc', 0),
-            "score": c_data.get('score', 0),
-            "replies": []
-        }
-        
-        if 'replies' in c_data and c_data['replies']:
-            replies_data = c_data['replies']['data']['children']
-            for reply in replies_data:
-                r = parse_comment(reply)
-                if r:
-                    parsed["replies"].append(r)
-                    
-        return parsed
+    start = time.perf_counter()
+    page, more_ids = parse_children(data[1]['data']['children'])
+    registry.inc("comment_parse_seconds_total", time.perf_counter() - start)
+    depths = {record.id: record.depth for record in page}
+    records.extend(page)
 
-    for comment in comments_data:
-        parsed = parse_comment(comment)
-        if parsed:
-            comments_list.append(parsed)
+    if expand_more and more_ids:
+        expand_more_children(post_id, more_ids, records, limiter, depths, cache)
             
-    return comments_list
+    return records
 
-def fetch_comments_sequential(posts):
+def fetch_comments_for_post(post_id, permalink, limiter=None, expand_more=True, profile=None, spill_folder=None, cache=None):
     """
-    Fetch comments for all posts sequentially.
+    Fetch comments for a single post as nested comment dicts (the output format).
+    A CrawlProfile (see profiles.py) supplies the request's limit / depth /
+    sort, whether 'more' stubs are expanded, and the comment fields kept.
+    If spill_folder is set, a thread larger than SPILL_COMMENTS is streamed
+    to a file there as it is fetched, and a {"file", "count"} reference is
+    returned instead (see comment_tree.CommentBuffer). cache (a ResponseCache)
+    is passed on to make_request.
+    Returns None if the request failed, so callers can retry it later.
     """
-    results = {}
-    total = len(posts)
+    buffer = CommentBuffer(post_id, spill_folder, fields=profile.comment_fields if profile else None)
+    try:
+        if profile:
+            records = fetch_comment_records(post_id, permalink, limiter, expand_more and profile.expand_more,
+                                            profile.comment_params(), buffer, cache)
+        else:
+            records = fetch_comment_records(post_id, permalink, limiter, expand_more, records=buffer, cache=cache)
+    except BaseException:
+        buffer.abort()
+        raise
+    if records is None:
+        buffer.abort()
+        return None
+    return buffer.result()
+
+def expand_more_children(post_id, more_ids, records, limiter=None, depths=None, cache=None):
+    """
+    Resolve 'more' stubs with as few requests as possible: child ids are sent
+    to /api/morechildren in batches of MORE_CHILDREN_BATCH, and every returned
+    comment is appended to records under its parent_id (to_nested attaches
+    it there, or at top level if the parent is the post).
+    Nested 'more' stubs in the results are queued for later batches.
+    depths ({id: depth} of the records so far) is built from records if not given.
+    """
+    if depths is None:
+        depths = {record.id: record.depth for record in records}
+    pending = list(more_ids)
+    seen = set()
+    requests_made = 0
     
-    for i, post in enumerate(posts):
-        post_id = post["id"]
-        permalink = post.get("permalink")
+    while pending:
+        batch = [child_id for child_id in pending[:MORE_CHILDREN_BATCH] if child_id not in seen]
+        pending = pending[MORE_CHILDREN_BATCH:]
+        if not batch:
+            continue
+        seen.update(batch)
         
-        if not permalink:
+        params = {
+            "api_type": "json",
+            "link_id": f"t3_{post_id}",
+            "children": ",".join(batch)
+        }
+        data = make_request(MORE_CHILDREN_URL, params, limiter=limiter, cache=cache)
+        requests_made += 1
+        if not data:
+            logging.warning(f"morechildren failed for {post_id}; {len(batch)} comments skipped.")
             continue
             
-        if i % 5 == 0:
-            logging.info(f"Fetching comments for post {i+1}/{total}...")
+        things = data.get('json', {}).get('data', {}).get('things', [])
+        parsed_things = []
+        for thing in things:
+            if thing['kind'] == 'more':
+                pending.extend(thing['data'].get('children', []))
+                continue
+            parsed_things.append(CommentRecord.from_json(thing['data']))
             
-        comments = fetch_comments_for_post(post_id, permalink)
-        results[post_id] = comments
-        
-        # Sleep to avoid rate limits
-        safe_sleep(1.5, 3)
-        
-    return results
+        # Depths are set after the whole batch is registered, so order within it doesn't matter
+        in_batch = {record.id: record for record in parsed_things}
+        for record in parsed_things:
+            depth, parent_id = 0, record.parent_id
+            while parent_id in in_batch:
+                depth += 1
+                parent_id = in_batch[parent_id].parent_id
+            # parent_id is now an earlier comment, the post (-1) or unknown (top-level)
+            record.depth = depths.get(parent_id, -1) + 1 + depth
+        for record in parsed_things:
+            depths[record.id] = record.depth
+            records.append(record)
+                
+    logging.debug(f"Expanded {len(seen)} 'more' comments for {post_id} in {requests_made} requests.")
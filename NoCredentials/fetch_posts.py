@@ -1,14 +1,43 @@
 import time
 import logging
 from datetime import datetime
-from utils import make_request, safe_sleep
+from utils import make_request, BASE_URL
 
-def fetch_posts(subreddit_name, start_year):
+PAGE_SIZE = 100              # Posts per listing request (Reddit's maximum)
+
+def post_record(post_data):
+    return {
+        "id": post_data.get('id'),
+        "title": post_data.get('title'),
+        "content": post_data.get('selftext', ''),
+        "author": post_data.get('author', '[deleted]'),
+        "created_utc": post_data.get('created_utc', 0),
+        "score": post_data.get('score', 0),
+        "url": post_data.get('url', ''),
+        "num_comments": post_data.get('num_comments', 0),
+        "permalink": post_data.get('permalink')
+    }
+
+def iter_posts(subreddit_name, start_year, checkpoint=None, since=None, cache=None):
     """
-    Fetch posts from subreddit JSON endpoint.
+    Yield posts from subreddit JSON endpoint, page by page, as they are listed.
+    If a checkpoint is given, every page is journaled and a resumed run
+    first yields the journaled posts, then continues from the recorded `after` cursor.
+    If since (a {"id", "created_utc"} high-water mark) is given, paging stops
+    as soon as the listing reaches that post, so only newer posts are fetched.
     """
-    posts = []
-    after = None
+    if checkpoint and checkpoint.posts_done:
+        logging.info(f"Post listing already complete in checkpoint ({len(checkpoint.posts)} posts).")
+        yield from list(checkpoint.posts)
+        return
+
+    resumed = list(checkpoint.posts) if checkpoint else []
+    after = checkpoint.after if checkpoint else None
+    if resumed:
+        logging.info(f"Resuming post listing after {after} ({len(resumed)} posts already fetched)...")
+    yield from resumed
+    count = len(resumed)
+    last_created = resumed[-1]["created_utc"] if resumed else None
     
     # Create timestamp for Jan 1st of start_year
     cutoff_timestamp = int(time.mktime(time.strptime(f"01-01-{start_year}", "%d-%m-%Y")))
@@ -16,51 +45,76 @@ def fetch_posts(subreddit_name, start_year):
     logging.info(f"Fetching posts from r/{subreddit_name} (JSON)...")
     
     while True:
-        url = f"https://www.reddit.com/r/{subreddit_name}/new.json"
-        params = {'limit': 100}
+        url = f"{BASE_URL}/r/{subreddit_name}/new.json"
+        params = {'limit': PAGE_SIZE}
         if after:
             params['after'] = after
             
-        data = make_request(url, params)
+        data = make_request(url, params, cache=cache)
         
         if not data or 'data' not in data or 'children' not in data['data']:
-            logging.warning("No data returned or invalid format.")
-            break
+            # A listing cut short must not count as complete: the run fails and keeps its checkpoint
+            raise RuntimeError(f"Listing of r/{subreddit_name} failed after {count} posts: no data returned or invalid format")
             
         children = data['data']['children']
         if not children:
             break
             
+        page = []
+        reached_cutoff = False
         for child in children:
             post_data = child['data']
             created_utc = post_data.get('created_utc', 0)
             
             if created_utc < cutoff_timestamp:
                 logging.info(f"Reached posts from {datetime.fromtimestamp(created_utc).year}. Stopping.")
-                return posts
+                reached_cutoff = True
+                break
+
+            if since and (post_data.get('id') == since["id"] or created_utc < since["created_utc"]):
+                logging.info(f"Reached last seen post {since['id']}. Stopping.")
+                reached_cutoff = True
+                break
                 
-            posts.append({
-                "id": post_data.get('id'),
-                "title": post_data.get('title'),
-                "content": post_data.get('selftext', ''),
-                "author": post_data.get('author', '[deleted]'),
-                "created_utc": created_utc,
-                "score": post_data.get('score', 0),
-                "url": post_data.get('url', ''),
-                "num_comments": post_data.get('num_comments', 0),
-                "permalink": post_data.get('permalink')
-            })
+            page.append(post_record(post_data))
             
         after = data['data']['after']
+        if checkpoint:
+            checkpoint.record_posts(page, after)
+            if reached_cutoff or not after:
+                # Journaled before the last page is handed on: the consumer may not ask
+                # for more until its backlog drains, and a resume must not re-list
+                checkpoint.record_posts_done()
+        yield from page
+        count += len(page)
+        if page:
+            last_created = page[-1]["created_utc"]
+        if reached_cutoff:
+            return
         if not after:
             break
             
-        logging.info(f"Fetched {len(posts)} posts so far...")
-        safe_sleep(1, 2) # Be polite
+        logging.info(f"Fetched {count} posts so far...")
         
+    if checkpoint and not checkpoint.posts_done:
+        checkpoint.record_posts_done()
+
     # Check limit warning
-    if posts and posts[-1]["created_utc"] >= cutoff_timestamp:
+    if count and last_created >= cutoff_timestamp:
          print(f"WARNING: r/{subreddit_name} has more than 1000 posts since {start_year}. Script will NOT fetch all of them due to Reddit limits.")
          logging.warning(f"r/{subreddit_name} has more than 1000 posts since {start_year}. Script will NOT fetch all of them due to Reddit limits.")
-         
-    return posts
+
+def fetch_posts(subreddit_name, start_year, checkpoint=None, since=None):
+    """
+    Fetch posts from subreddit JSON endpoint. Returns the full list (see iter_posts).
+    """
+    return list(iter_posts(subreddit_name, start_year, checkpoint, since))
+
+def fetch_subscribers(subreddit_name):
+    """
+    Return the subreddit's subscriber count (0 if unavailable).
+    """
+    data = make_request(f"{BASE_URL}/r/{subreddit_name}/about.json")
+    if not data or 'data' not in data:
+        return 0
+    return data['data'].get('subscribers') or 0
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from metrics import endpoint_type
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+CACHE_FOLDER = "reddit_cache"
+CACHE_MAX_SIZE_MB = 500
+CACHE_TTL = {                # Seconds a cached response is served without revalidation
+    "listing": 5 * 60,       # /r/{subreddit}/new.json pages change constantly
+    "comments": 60 * 60,     # permalink comment trees
+    "morechildren": 24 * 60 * 60
+}
+
+class ResponseCache:
+    """
+    Content-addressed disk cache for JSON responses, keyed by URL + params.
+
+    Entries older than their endpoint's TTL are revalidated with
+    If-None-Match / If-Modified-Since when Reddit sent an ETag or
+    Last-Modified header. The cache is kept under max_size_mb by evicting
+    the least recently used entries (file mtime is bumped on every hit).
+    In offline mode every cached entry is served regardless of age and
+    misses are never sent to the network.
+    """
+    def __init__(self, folder=CACHE_FOLDER, max_size_mb=CACHE_MAX_SIZE_MB, ttl=None, offline=False):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_size = max_size_mb * 1024 * 1024
+        self.ttl = dict(CACHE_TTL, **(ttl or {}))
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.size = sum(os.path.getsize(path) for path in self._entries())
+
+    def _entries(self):
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def _path(self, url, params):
+        raw = url + "?" + json.dumps(sorted((params or {}).items()), separators=(",", ":"))
+        key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, key[:2], f"{key}.json")
+
+    def get(self, url, params=None):
+        path = self._path(url, params)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] < self.ttl[endpoint_type(entry["url"])]
+
+    def validators(self, entry):
+        """
+        Conditional request headers for a stale entry.
+        """
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url, params, body, headers=None):
+        headers = headers or {}
+        entry = {
+            "url": url,
+            "params": params,
+            "fetched_at": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "body": body
+        }
+        self._write(self._path(url, params), entry)
+
+    def revalidated(self, url, params, entry):
+        """
+        The server answered 304: the stored body is current again.
+        """
+        entry["fetched_at"] = time.time()
+        self._write(self._path(url, params), entry)
+
+    def _write(self, path, entry):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self.lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.size += len(data) - old_size
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """
+        Drop least recently used entries until the cache is back under 90% of its limit.
+        """
+        entries = sorted(self._entries(), key=lambda path: os.path.getmtime(path))
+        target = self.max_size * 0.9
+        for path in entries:
+            if self.size <= target:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                continue
+        logging.info(f"Response cache evicted down to {self.size / (1024 * 1024):.1f} MB")
@@ -1,9 +1,211 @@
 import os
 import logging
-from fetch_posts import fetch_posts
-from fetch_comments import fetch_comments_sequential
-from clean_json import combine_posts_comments, save_chunks
-from utils import setup_logging
+from fetch_posts import iter_posts
+from discovery import iter_discovered_posts
+from fetch_comments import fetch_comments_for_post
+from clean_json import reusable_comments, save_reused, save_unlisted, write_unlisted, remove_chunk_set, open_chunk_writer
+from reader import ChunkReader
+from comment_tree import saved_comments
+from utils import setup_logging, load_json, done_comments, Checkpoint, update_high_water_mark, MAX_WORKERS
+from http_cache import ResponseCache, CACHE_FOLDER
+from pipeline import run_pipeline
+from profiles import get_profile
+from columnar import ColumnarWriter, FORMATS
+from sqlite_store import SQLiteStore
+from dedup import SignatureIndex, Deduplicator, THRESHOLD
+from metrics import Metrics, using, flushing, profiling
+
+DEFAULT_OPTIONS = {
+    "fetch_mode": "concurrent",  # sequential / concurrent
+    "run_mode": "full",          # full / incremental / refresh
+    "refresh_min_age_days": None,  # refresh: posts younger than this are always re-fetched (their comments still change)
+    "crawl_profile": "full",     # full / top (top comments only, 2 levels) / titles (no comments, post metadata only); see profiles.py
+    "discovery": "new",          # new (the /new listing, ~1000 posts max) / fanout (every listing and search at once, deduplicated)
+    "output_format": "jsonl",    # jsonl / parquet / arrow (columnar tables next to the .jsonl chunks; needs pyarrow) / sqlite (instead of chunks)
+    "cache_mode": "off",         # off / on / offline
+    "output_root": None,         # Folder that holds {subreddit}_data_noauth; defaults to the current directory
+    "metrics_format": "prom",    # prom (Prometheus text) / json / off: {subreddit}_metrics file, rewritten during the run
+    "profile": "off",            # off / cpu (cProfile) / memory (tracemalloc) / both: reports written to the output folder
+    "dedup": "off",              # off / mark / remove near-duplicate posts and comments (needs numpy); see dedup.py
+    "dedup_threshold": THRESHOLD # Estimated Jaccard similarity at which a text counts as a near-duplicate
+}
+
+def get_output_folder(subreddit, output_root=None):
+    return os.path.join(output_root or os.getcwd(), f"{subreddit}_data_noauth")
+
+def load_state(output_folder, subreddit, store=None):
+    """
+    The run state of a subreddit (newest, last_run, last_run_posts): kept in
+    its SQLite store for sqlite output, otherwise in {subreddit}_state.json.
+    """
+    if store:
+        return store.load_state()
+    return load_json(os.path.join(output_folder, f"{subreddit}_state.json")) or {}
+
+def run_job(subreddit, start_year, options=None):
+    """
+    Crawl one subreddit without any prompts.
+    options override DEFAULT_OPTIONS. Returns a summary dict.
+    While the job runs, the process-wide metrics (request latency per
+    endpoint, rate-limit waits, bytes, parse/serialize time, queue depths)
+    are flushed to {subreddit}_metrics.prom or .json in the output folder.
+    """
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    output_folder = get_output_folder(subreddit, options["output_root"])
+    os.makedirs(output_folder, exist_ok=True)
+    metrics_file = None
+    if options["metrics_format"] != "off":
+        metrics_file = os.path.join(output_folder, f"{subreddit}_metrics.{options['metrics_format']}")
+    # A registry of its own, so jobs run side by side by batch.py do not mix their metrics
+    with using(Metrics()), flushing(metrics_file), profiling(output_folder, subreddit, options["profile"]):
+        return _run_job(subreddit, start_year, options, output_folder)
+
+def _run_job(subreddit, start_year, options, output_folder):
+    run_mode = options["run_mode"]
+    profile = get_profile(options["crawl_profile"])
+
+    # Handed to every request of this job only, so jobs run side by side keep their own cache mode
+    cache = None
+    if options["cache_mode"] in ("on", "offline"):
+        cache_folder = os.path.join(options["output_root"] or os.getcwd(), CACHE_FOLDER)
+        cache = ResponseCache(cache_folder, offline=options["cache_mode"] == "offline")
+        logging.info(f"Response cache enabled ({options['cache_mode']}).")
+
+    checkpoint = Checkpoint(os.path.join(output_folder, f"{subreddit}_checkpoint.jsonl"))
+    if checkpoint.resumed:
+        print(f"Resuming previous run ({len(checkpoint.posts)} posts, {len(checkpoint.comments)} comment trees already fetched).")
+
+    state_file = os.path.join(output_folder, f"{subreddit}_state.json")
+    store = SQLiteStore(os.path.join(output_folder, f"{subreddit}.db")) if options["output_format"] == "sqlite" else None
+    state = load_state(output_folder, subreddit, store)
+    since = state.get("newest") if run_mode == "incremental" else None
+    if since:
+        logging.info(f"Incremental run: fetching posts newer than {since['id']}...")
+
+    # -----------------------------
+    # Posts to crawl
+    # -----------------------------
+    # Posts stream straight from the listing into the comment fetchers, except in
+    # refresh mode, which needs the whole listing to decide which trees to reuse.
+    master_file = os.path.join(output_folder, f"{subreddit}_master.json")
+    logging.info(f"Fetching posts from r/{subreddit} starting {start_year}...")
+    reuse = set()
+    reused_master = None
+    unlisted_file = None
+    if options["discovery"] == "fanout":
+        post_source = iter_discovered_posts(subreddit, start_year, checkpoint, since, cache=cache)
+    else:
+        post_source = iter_posts(subreddit, start_year, checkpoint, since, cache=cache)
+    if run_mode == "refresh":
+        post_source = list(post_source)
+        min_age_days = options["refresh_min_age_days"]
+        if store:
+            reuse = store.reusable_comments(post_source, min_age_days)
+        else:
+            # The chunk set is rebuilt from the listing: stored posts that left it are set aside and written back,
+            # and the posts whose trees are reused are copied aside, to be read back one at a time
+            unlisted_file = os.path.join(output_folder, f"{subreddit}_unlisted.jsonl")
+            reused_master = os.path.join(output_folder, f"{subreddit}_reused_master.json")
+            if "unlisted" not in checkpoint.meta:
+                checkpoint.record_meta("unlisted", save_unlisted(master_file, post_source, unlisted_file))
+            if "reused" not in checkpoint.meta:
+                reusable = reusable_comments(master_file, post_source, min_age_days)
+                checkpoint.record_meta("reused", save_reused(master_file, reusable, reused_master))
+            reader = ChunkReader(reused_master)
+            reuse = set(reader.index.posts)
+            logging.info(f"Refresh: keeping {checkpoint.meta['unlisted']} stored posts that are no longer listed.")
+        logging.info(f"Refresh: reusing stored comments for {len(reuse)}/{len(post_source)} unchanged posts.")
+    done = done_comments(checkpoint)
+
+    # -----------------------------
+    # Fetch comments + save chunks as posts finish
+    # -----------------------------
+    # Threads too big to hold in memory are written here and referenced from their post
+    spill_folder = os.path.join(output_folder, f"{subreddit}_threads")
+
+    def comments_for(post):
+        if post["id"] in done:
+            # Read back when its post comes up, like reused trees
+            return checkpoint.load_comments(post["id"])
+        if post["id"] in reuse:
+            # Read when its post comes up, so reused trees are never all in memory at once
+            return store.comments(post["id"], spill_folder) if store else saved_comments(reader.get(post["id"]))
+        if not post.get("permalink") or not profile.wants_comments(post):
+            return []
+        return fetch_comments_for_post(post["id"], post["permalink"], profile=profile, spill_folder=spill_folder, cache=cache)
+
+    # Near-duplicates are checked against the signatures of every earlier run
+    deduplicator = None
+    if options["dedup"] != "off":
+        index = SignatureIndex(os.path.join(output_folder, f"{subreddit}_signatures.npz"), options["dedup_threshold"])
+        deduplicator = Deduplicator(index, options["dedup"])
+
+    writers = [store] if store else []
+    seen = []
+
+    def write(records):
+        for record in records:
+            for writer in writers:
+                writer.write(record)
+
+    def save(post, comments):
+        failed = comments is None
+        if failed:
+            comments = []  # Not journaled, so a resumed run retries it
+        elif post["id"] not in done and post["id"] not in reuse:
+            checkpoint.record_comments(post["id"], comments)
+        if not writers:
+            writers.append(open_chunk_writer(output_folder, subreddit, append=bool(since), checkpoint=checkpoint))
+            if options["output_format"] in FORMATS:
+                writers.append(ColumnarWriter(output_folder, subreddit, options["output_format"], append=bool(since)))
+        record = profile.project(post, comments)
+        if failed:
+            record["comments_failed"] = True  # Fetched again by the next refresh, never reused
+        # Near-duplicates are checked in batches: add() returns posts once a batch is full
+        write(deduplicator.add(record) if deduplicator else [record])
+        seen.append({"id": post["id"], "created_utc": post["created_utc"]})
+
+    workers = MAX_WORKERS if options["fetch_mode"] == "concurrent" else 1
+    logging.info("Fetching comments (this may take a while)...")
+    try:
+        run_pipeline(post_source, comments_for, save, workers=workers)
+        if deduplicator:
+            write(deduplicator.flush())
+        if unlisted_file and writers:
+            write_unlisted(unlisted_file, writers)
+        if store:
+            store.flush()
+            store.update_high_water_mark(seen)
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        if reused_master:
+            reader.close()
+        raise
+    for writer in writers:
+        writer.close()
+    if unlisted_file and os.path.exists(unlisted_file):
+        os.remove(unlisted_file)
+    if reused_master:
+        reader.close()
+        remove_chunk_set(reused_master)
+    if deduplicator:
+        deduplicator.index.save()
+        deduplicator.report()
+    logging.info(f"Fetched {len(seen)} posts with comments")
+
+    if not seen:
+        print("No new posts found. Exiting." if since else "No posts found. Exiting.")
+        checkpoint.remove()
+        return {"subreddit": subreddit, "posts": 0, "master_file": None}
+
+    if store:
+        master_file = store.filename
+    else:
+        update_high_water_mark(state_file, seen)
+    checkpoint.remove()
+    logging.info(f"Data saved. Master JSON: {master_file}")
+    return {"subreddit": subreddit, "posts": len(seen), "master_file": master_file}
 
 def main():
     # -----------------------------
@@ -16,42 +218,29 @@ def main():
     
     subreddit = input("Enter subreddit name (without r/): ").strip()
     start_year = int(input("Enter starting year (e.g., 2020): ").strip())
+    fetch_mode = input("Comment fetch mode [sequential/concurrent] (default: concurrent): ").strip().lower()
+    if fetch_mode not in ("sequential", "concurrent"):
+        fetch_mode = "concurrent"
+    run_mode = input("Run mode [full/incremental/refresh] (default: full): ").strip().lower()
+    if run_mode not in ("full", "incremental", "refresh"):
+        run_mode = "full"
+    output_format = input("Output format [jsonl/parquet/arrow/sqlite] (default: jsonl): ").strip().lower()
+    if output_format not in ("jsonl", "parquet", "arrow", "sqlite"):
+        output_format = "jsonl"
+    cache_mode = input("Response cache [off/on/offline] (default: off): ").strip().lower()
+    if cache_mode not in ("off", "on", "offline"):
+        cache_mode = "off"
     
-    output_folder = os.path.join(os.getcwd(), f"{subreddit}_data_noauth")
+    output_folder = get_output_folder(subreddit)
     os.makedirs(output_folder, exist_ok=True)
 
     log_file = os.path.join(output_folder, f"{subreddit}.log")
     setup_logging(log_file)
 
-    # -----------------------------
-    # Fetch posts
-    # -----------------------------
-    logging.info(f"Fetching posts from r/{subreddit} starting {start_year}...")
-    posts = fetch_posts(subreddit, start_year)
-    logging.info(f"Fetched {len(posts)} posts")
-
-    if not posts:
-        print("No posts found. Exiting.")
-        return
-
-    # -----------------------------
-    # Fetch comments
-    # -----------------------------
-    logging.info("Fetching comments (this may take a while)...")
-    comments_dict = fetch_comments_sequential(posts)
-    logging.info("Comments fetching complete.")
-
-    # -----------------------------
-    # Combine posts + comments
-    # -----------------------------
-    combined = combine_posts_comments(posts, comments_dict)
-
-    # -----------------------------
-    # Save chunks + master JSON
-    # -----------------------------
-    master_file = save_chunks(combined, output_folder, subreddit)
-    logging.info(f"Data saved. Master JSON: {master_file}")
-    print(f"Done! Data saved to {output_folder}")
+    options = dict(DEFAULT_OPTIONS, fetch_mode=fetch_mode, run_mode=run_mode, cache_mode=cache_mode, output_format=output_format)
+    summary = run_job(subreddit, start_year, options)
+    if summary["master_file"]:
+        print(f"Done! Data saved to {output_folder}")
 
 if __name__ == "__main__":
     main()
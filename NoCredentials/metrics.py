@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import logging
+import threading
+import tracemalloc
+import pstats
+import cProfile
+from contextlib import contextmanager
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+FLUSH_SECONDS = 15           # How often the metrics file is rewritten during a run
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PROFILE_TOP = 30             # Lines kept in the cProfile / tracemalloc reports
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        }
+
+def metric_key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def endpoint_type(url):
+    """
+    Classify a Reddit URL, for the per-endpoint metrics and cache TTLs.
+    """
+    if "/api/v1/access_token" in url:
+        return "token"
+    if "/api/morechildren" in url:
+        return "morechildren"
+    if "/comments/" in url:
+        return "comments"
+    return "listing"
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and histograms, each keyed by
+    name and labels (e.g. endpoint="comments"). Every job records to its own
+    (see using); code outside a job records to default_registry. Written out as
+    Prometheus text (.prom) or JSON (.json), depending on the file name.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = metric_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[metric_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = metric_key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observe the duration of the with-block in histogram `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+            self.started = time.time()
+
+    def to_dict(self):
+        def entries(metrics, convert=lambda value: value):
+            result = {}
+            for (name, labels), value in sorted(metrics.items()):
+                result.setdefault(name, []).append({"labels": dict(labels), "value": convert(value)})
+            return result
+
+        with self.lock:
+            return {
+                "started": self.started,
+                "updated": time.time(),
+                "counters": entries(self.counters),
+                "gauges": entries(self.gauges),
+                "histograms": entries(self.histograms, Histogram.to_dict)
+            }
+
+    def to_prometheus(self):
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                seen = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    if name not in seen:
+                        lines.append(f"# TYPE {name} {kind}")
+                        seen.add(name)
+                    lines.append(f"{name}{label_text(labels)} {value}")
+            seen = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{label_text(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{label_text(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename):
+        text = json.dumps(self.to_dict(), indent=2) if filename.endswith(".json") else self.to_prometheus()
+        tmp_file = filename + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_file, filename)
+
+default_registry = Metrics()
+_local = threading.local()
+
+def current():
+    """
+    The Metrics the calling thread records to: its job's, or default_registry.
+    """
+    return getattr(_local, "metrics", None) or default_registry
+
+@contextmanager
+def using(metrics):
+    """
+    Record everything the calling thread sends to `registry` during the
+    with-block in `metrics`. Threads started inside inherit it through propagate().
+    """
+    previous = getattr(_local, "metrics", None)
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+
+def propagate(function):
+    """
+    Wrap function (a thread target or executor task) so it records to the
+    Metrics current where it was wrapped, whichever thread runs it.
+    """
+    metrics = current()
+
+    def run(*args, **kwargs):
+        with using(metrics):
+            return function(*args, **kwargs)
+    return run
+
+class CurrentMetrics:
+    """
+    Stands for the current Metrics (see current): registry.inc(...) records
+    to the job the calling thread works for, so concurrent jobs stay apart.
+    """
+    def __getattr__(self, name):
+        return getattr(current(), name)
+
+registry = CurrentMetrics()
+
+@contextmanager
+def flushing(filename, interval=FLUSH_SECONDS):
+    """
+    Rewrite the metrics file every `interval` seconds while the with-block
+    runs, and once more at the end. filename=None disables it. The file
+    holds the Metrics current when the block is entered.
+    """
+    if not filename:
+        yield
+        return
+    metrics = current()
+    stop = threading.Event()
+
+    def flush_loop():
+        while not stop.wait(interval):
+            try:
+                metrics.write(filename)
+            except OSError as e:
+                logging.warning(f"Could not write metrics to {filename}: {e}")
+
+    thread = threading.Thread(target=flush_loop, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        metrics.write(filename)
+        logging.info(f"Metrics written to {filename}")
+
+@contextmanager
+def profiling(output_folder, name, mode="off"):
+    """
+    Optionally profile the with-block: mode "cpu" writes a cProfile dump
+    ({name}.prof, open with pstats or snakeviz) and a text summary, "memory"
+    writes the top tracemalloc allocation sites, "both" does both.
+    cProfile only sees the calling thread (the save stage of the pipeline);
+    tracemalloc covers every thread.
+    """
+    cpu = mode in ("cpu", "both")
+    memory = mode in ("memory", "both")
+    profiler = cProfile.Profile() if cpu else None
+    if memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(output_folder, f"{name}_memory.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Traced memory: current {current / 1048576:.1f} MB, peak {peak / 1048576:.1f} MB\n\n")
+                for stat in snapshot.statistics("lineno")[:PROFILE_TOP]:
+                    f.write(f"{stat}\n")
+        if profiler:
+            profiler.dump_stats(os.path.join(output_folder, f"{name}.prof"))
+            with open(os.path.join(output_folder, f"{name}_profile.txt"), "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP)
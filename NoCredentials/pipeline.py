@@ -0,0 +1,107 @@
+import queue
+import logging
+import threading
+from metrics import registry, propagate
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+QUEUE_SIZE = 50              # Posts buffered between stages; a full queue pauses the stage before it
+POLL_SECONDS = 0.5           # How often a blocked stage checks whether the pipeline was stopped
+
+_DONE = object()
+
+def run_pipeline(post_source, fetch_comments, save, workers=4, queue_size=QUEUE_SIZE):
+    """
+    Run listing, comment fetching and writing at the same time:
+
+        post_source (1 thread) -> [posts queue] -> fetch_comments (workers threads)
+                                -> [results queue] -> save (calling thread)
+
+    post_source is any iterable of posts (e.g. a listing generator), so posts
+    reach the comment fetchers as soon as they are listed. fetch_comments(post)
+    returns the post's comments (None if the fetch failed), and save(post, comments)
+    is called as each post finishes. Both queues are bounded, so a slow stage
+    applies backpressure instead of letting everything pile up in memory.
+    Returns the number of posts saved; an error in the listing is re-raised.
+    If save raises, the other stages are stopped before the error propagates.
+    """
+    posts_queue = queue.Queue(maxsize=queue_size)
+    results_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    stop = threading.Event()
+
+    def put(target, item):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for post in post_source:
+                if not put(posts_queue, post):
+                    return
+        except Exception as e:
+            logging.error(f"Post listing failed: {e}")
+            errors.append(e)
+        finally:
+            for _ in range(workers):
+                put(posts_queue, _DONE)
+
+    def consume():
+        while not stop.is_set():
+            try:
+                post = posts_queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if post is _DONE:
+                put(results_queue, _DONE)
+                return
+            try:
+                with registry.timer("stage_seconds", stage="fetch_comments"):
+                    comments = fetch_comments(post)
+            except Exception as e:
+                logging.error(f"Error fetching comments for {post['id']}: {e}")
+                comments = None
+            put(results_queue, (post, comments))
+
+    threads = [threading.Thread(target=propagate(produce), daemon=True)]
+    threads += [threading.Thread(target=propagate(consume), daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    saved = 0
+    finished = 0
+    try:
+        while finished < workers:
+            item = results_queue.get()
+            if item is _DONE:
+                finished += 1
+                continue
+            post, comments = item
+            with registry.timer("stage_seconds", stage="save"):
+                save(post, comments)
+            saved += 1
+            registry.inc("posts_saved_total")
+            registry.set("queue_depth", posts_queue.qsize(), queue="posts")
+            registry.set("queue_depth", results_queue.qsize(), queue="results")
+            if saved % 10 == 0:
+                logging.info(f"Saved {saved} posts (queued: {posts_queue.qsize()} to fetch, {results_queue.qsize()} to write)...")
+    finally:
+        # Unblock and end every stage, also when save raised, so no thread outlives the run
+        stop.set()
+        for pending in (posts_queue, results_queue):
+            try:
+                while True:
+                    pending.get_nowait()
+            except queue.Empty:
+                pass
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return saved
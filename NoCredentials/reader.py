@@ -0,0 +1,268 @@
+import os
+import sys
+import copy
+import json
+import mmap
+import logging
+import argparse
+from utils import load_json, iter_json_array, parse_chunk_line, ChunkIndex, index_filename
+from columnar import iter_comment_rows
+
+def load_index(master_file, master):
+    """
+    The chunk set's index, or None if it is missing or does not match the
+    master JSON. Chunks written since the index was last saved are scanned
+    (see ChunkIndex.refresh); the result is saved only once the chunk set is
+    complete, so a reader never rewrites the index of a running crawl.
+    """
+    index_file = master.get("index") or index_filename(master_file)
+    if not os.path.exists(index_file):
+        return None
+    index = ChunkIndex(index_file)
+    before = [dict(stats) for stats in index.chunks]
+    if not index.refresh(master.get("chunks", [])):
+        return None
+    if master.get("complete") and index.chunks != before:
+        index.save()
+    return index
+
+def build_index(master_file):
+    """
+    (Re)build the index of a chunk set by scanning its chunks, e.g. for
+    output written before chunk indexes existed. Returns the ChunkIndex.
+    """
+    master = load_json(master_file) or {}
+    index = ChunkIndex(master.get("index") or index_filename(master_file))
+    index.truncate(0)
+    for number, chunk in enumerate(master.get("chunks", [])):
+        index.scan(number, chunk)
+    index.save()
+    return index
+
+class ChunkReader:
+    """
+    Random access to a chunk set through its index ({subreddit}_index.json).
+    get() seeks straight to one post, and posts_between() only opens chunks
+    whose created_utc range overlaps the window. Chunks are memory-mapped,
+    so a lookup reads just the bytes of the post it returns.
+    A missing or outdated index is rebuilt on open.
+    """
+    def __init__(self, master_file):
+        self.master = load_json(master_file)
+        if not self.master:
+            raise FileNotFoundError(f"No master JSON at {master_file}")
+        self.index = load_index(master_file, self.master) or build_index(master_file)
+        self.maps = {}
+
+    def __len__(self):
+        return len(self.index.posts)
+
+    def __contains__(self, post_id):
+        return post_id in self.index.posts
+
+    def _map(self, number):
+        if number not in self.maps:
+            with open(self.index.chunks[number]["file"], "rb") as f:
+                self.maps[number] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[number]
+
+    def get(self, post_id):
+        """
+        The post with this id, or None.
+        """
+        entry = self.index.posts.get(post_id)
+        if entry is None:
+            return None
+        number, offset, length = entry
+        return json.loads(self._map(number)[offset:offset + length])
+
+    def chunks_between(self, start=None, end=None):
+        """
+        Numbers of the chunks that may hold posts created in [start, end].
+        Chunks without stats (older JSON array chunks) are always included.
+        """
+        for number, stats in enumerate(self.index.chunks):
+            if not stats["count"] and stats["file"] and stats["file"].endswith(".jsonl"):
+                continue
+            low, high = stats.get("min_created_utc"), stats.get("max_created_utc")
+            if low is not None and ((start is not None and high < start) or (end is not None and low > end)):
+                continue
+            yield number
+
+    def _chunk_posts(self, number):
+        filename = self.index.chunks[number]["file"]
+        if not filename.endswith(".jsonl"):
+            yield from iter_json_array(filename)
+            return
+        data = self._map(number)
+        offset = 0
+        while offset < len(data):
+            newline = data.find(b"\n", offset)
+            end = len(data) if newline == -1 else newline + 1
+            line = data[offset:end]
+            post = parse_chunk_line(line, filename) if line.strip() else None
+            if post is not None:
+                yield post
+            offset = end
+
+    def posts_between(self, start=None, end=None):
+        """
+        Yield the posts created in [start, end] (unix timestamps, either may be None).
+        """
+        for number in self.chunks_between(start, end):
+            for post in self._chunk_posts(number):
+                created = post.get("created_utc", 0)
+                if (start is None or created >= start) and (end is None or created <= end):
+                    yield post
+
+    def close(self):
+        for data in self.maps.values():
+            data.close()
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# -----------------------------
+# Streaming with filters
+# -----------------------------
+class PostFilter:
+    """
+    Conditions for iter_posts() and iter_comments(). Every bound is
+    inclusive and None leaves it open; authors is a collection of usernames,
+    matched against the post author, or by iter_comments() against each
+    comment's own author.
+    """
+    def __init__(self, since=None, until=None, min_score=None, max_score=None,
+                 min_comments=None, max_comments=None, authors=None):
+        self.ranges = {
+            "created_utc": (since, until),
+            "score": (min_score, max_score),
+            "num_comments": (min_comments, max_comments)
+        }
+        self.ranges = {field: bounds for field, bounds in self.ranges.items() if bounds != (None, None)}
+        self.authors = set(authors) if authors else None
+        # The "author" key as ChunkWriter serializes it, to test raw lines before parsing
+        self.author_keys = [
+            json.dumps({"author": author}, ensure_ascii=False, separators=(",", ":"))[1:-1].encode("utf-8")
+            for author in self.authors
+        ] if self.authors else None
+
+    def skips_chunk(self, stats):
+        """
+        True if a chunk's index stats show that none of its posts can match.
+        """
+        for field, (low, high) in self.ranges.items():
+            chunk_low, chunk_high = stats.get(f"min_{field}"), stats.get(f"max_{field}")
+            if chunk_low is None:
+                continue
+            if (low is not None and chunk_high < low) or (high is not None and chunk_low > high):
+                return True
+        return False
+
+    def skips_line(self, line):
+        """
+        True if a raw NDJSON line cannot match, so it need not be parsed.
+        """
+        return self.author_keys is not None and not any(key in line for key in self.author_keys)
+
+    def __call__(self, post):
+        for field, (low, high) in self.ranges.items():
+            value = post.get(field)
+            if value is None or (low is not None and value < low) or (high is not None and value > high):
+                return False
+        return self.authors is None or post.get("author") in self.authors
+
+    def without_authors(self):
+        """
+        A copy that only keeps the ranges.
+        """
+        ranges = copy.copy(self)
+        ranges.authors = ranges.author_keys = None
+        return ranges
+
+def iter_posts(master_file, post_filter=None):
+    """
+    Stream the posts of a chunk set that pass post_filter, one at a time.
+    NDJSON chunks are read line by line and older JSON array chunks are
+    decoded incrementally, so memory stays flat whatever the dataset size.
+    If the chunk set has an index, chunks whose stats rule out every post
+    are skipped without being opened.
+    """
+    post_filter = post_filter or PostFilter()
+    master = load_json(master_file)
+    if not master:
+        return
+    # The index is only worth loading when there are ranges to check against its chunk stats
+    index = load_index(master_file, master) if post_filter.ranges else None
+    for number, chunk in enumerate(master.get("chunks", [])):
+        if index and post_filter.skips_chunk(index.chunks[number]):
+            continue
+        if not os.path.exists(chunk):
+            logging.warning(f"Chunk listed in {master_file} is missing: {chunk}")
+            continue
+        if not chunk.endswith(".jsonl"):
+            yield from filter(post_filter, iter_json_array(chunk))
+            continue
+        with open(chunk, "rb") as f:
+            for line in f:
+                if not line.strip() or post_filter.skips_line(line):
+                    continue
+                post = parse_chunk_line(line, chunk)
+                if post is not None and post_filter(post):
+                    yield post
+
+def iter_comments(master_file, post_filter=None):
+    """
+    Stream the comments of the matching posts as flat rows with post_id,
+    id, parent_id and depth (see columnar.flatten_comments). Threads spilled
+    to disk are read from their comments_file.
+    The filter's ranges select posts; its authors select comments, whoever
+    wrote the post.
+    """
+    post_filter = post_filter or PostFilter()
+    authors = post_filter.authors
+    for post in iter_posts(master_file, post_filter.without_authors()):
+        for row in iter_comment_rows(post):
+            if authors is None or row.get("author") in authors:
+                yield row
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up posts in a scraped chunk set without loading it.")
+    parser.add_argument("master_file", help="{subreddit}_master.json")
+    parser.add_argument("--id", action="append", default=[], help="Post id to print (repeatable)")
+    parser.add_argument("--since", type=float, help="Print posts created at or after this unix timestamp")
+    parser.add_argument("--until", type=float, help="Print posts created at or before this unix timestamp")
+    parser.add_argument("--min-score", type=int)
+    parser.add_argument("--max-score", type=int)
+    parser.add_argument("--min-comments", type=int, help="Minimum num_comments")
+    parser.add_argument("--max-comments", type=int, help="Maximum num_comments")
+    parser.add_argument("--author", action="append", help="Only posts (with --comments: comments) by this author (repeatable)")
+    parser.add_argument("--comments", action="store_true", help="Print flattened comment rows instead of posts")
+    parser.add_argument("--build-index", action="store_true", help="Only (re)build the index")
+    args = parser.parse_args()
+
+    if args.build_index:
+        index = build_index(args.master_file)
+        print(f"Indexed {len(index.posts)} posts in {len(index.chunks)} chunks: {index.filename}")
+        return
+
+    if args.id:
+        with ChunkReader(args.master_file) as reader:
+            for post_id in args.id:
+                post = reader.get(post_id)
+                if post is not None:
+                    sys.stdout.write(json.dumps(post, ensure_ascii=False) + "\n")
+        return
+
+    post_filter = PostFilter(args.since, args.until, args.min_score, args.max_score,
+                             args.min_comments, args.max_comments, args.author)
+    rows = iter_comments if args.comments else iter_posts
+    for row in rows(args.master_file, post_filter):
+        sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
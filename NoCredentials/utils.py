@@ -3,12 +3,21 @@ import json
 import time
 import random
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from metrics import registry
+from http_cache import endpoint_type
 
 # -------------------------
 # CONFIGURATION
 # -------------------------
 CHUNK_SIZE_MB = 100
+REQUESTS_PER_MINUTE = 30     # Starting request rate, until Reddit's rate-limit headers are seen
+MAX_WORKERS = 4              # Requests kept in flight by the concurrent fetcher
+BACKOFF_BASE = 2             # Seconds; doubled on every retry, with jitter
+BACKOFF_MAX = 120
+BASE_URL = os.environ.get("REDDIT_BASE_URL", "https://www.reddit.com")  # Override to use a mirror or benchmarks/mock_reddit.py
 LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
 
 # -------------------------
@@ -43,28 +52,170 @@ def safe_sleep(min_sec=2, max_sec=5):
     sleep_time = random.uniform(min_sec, max_sec)
     time.sleep(sleep_time)
 
-def make_request(url, params=None):
+class TokenBucket:
     """
-    Make a request with retry logic for 429s.
+    Thread-safe token bucket. Tokens refill continuously at `rate` per second
+    up to `capacity`; acquire() blocks until a token is available.
     """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            registry.inc("rate_limit_wait_seconds_total", wait)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Hold back every caller for at least `seconds` from now (drives the
+        bucket negative). Overlapping pauses do not add up: the longest wins.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+class RateGovernor(TokenBucket):
+    """
+    Token bucket whose rate follows Reddit's rate-limit headers. After every
+    response the remaining budget (x-ratelimit-remaining) is spread evenly over
+    the seconds left in the window (x-ratelimit-reset), so the budget is used
+    up exactly as the window ends instead of being wasted on fixed sleeps.
+    max_rate, if set, caps the rate regardless of what the headers allow.
+    """
+    def __init__(self, rate, capacity=1, max_rate=None):
+        super().__init__(rate, capacity)
+        self.max_rate = max_rate
+
+    def update(self, headers):
+        try:
+            remaining = float(headers["x-ratelimit-remaining"])
+            reset = float(headers["x-ratelimit-reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if remaining < 1:
+            logging.warning(f"Rate limit budget used up. Waiting {reset:.0f}s for the window to reset...")
+            self.pause(reset)
+            return
+        with self.lock:
+            self.rate = remaining / max(reset, 1)
+            if self.max_rate:
+                self.rate = min(self.rate, self.max_rate)
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Jittered exponential backoff shared by all callers. Returns the delay.
+        Callers backing off at once wait out the longest delay, not their sum.
+        """
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+        if retry_after:
+            delay = max(delay, retry_after)
+        registry.inc("backoff_seconds_total", delay)
+        self.pause(delay)
+        return delay
+
+_governor = RateGovernor(REQUESTS_PER_MINUTE / 60.0)
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Shared keep-alive session: one connection pool (sized for the concurrent
+    fetcher) and gzip-compressed responses for every request.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS * 2)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session.headers["Accept-Encoding"] = "gzip, deflate"
+        return _session
+
+def set_request_budget(requests_per_minute):
+    """
+    Cap the global request rate shared by every caller of make_request.
+    """
+    with _governor.lock:
+        _governor.max_rate = requests_per_minute / 60.0
+        _governor.rate = min(_governor.rate, _governor.max_rate)
+
+def make_request(url, params=None, limiter=None, cache=None):
+    """
+    Make a request on the shared session, paced by the rate governor.
+    429s and server errors are retried with jittered exponential backoff.
+    A limiter (TokenBucket) can be passed to pace this call differently.
+    If a cache (ResponseCache, see http_cache.py) is passed, fresh cached
+    responses are served without a request and stale ones are revalidated
+    with a conditional request.
+    Every request asks for raw_json=1, so text is never HTML-escaped by
+    Reddit's legacy JSON (&amp;, &lt;, &gt;), whichever endpoint sent it.
+    """
+    params = dict(params or {}, raw_json=1)
+    cached = cache.get(url, params) if cache else None
+    if cached and (cache.offline or cache.is_fresh(cached)):
+        registry.inc("cache_hits_total", endpoint=endpoint_type(url))
+        return cached["body"]
+    if cache and cache.offline:
+        logging.warning(f"Offline mode: no cached response for {url}")
+        return None
+
+    headers = get_headers()
+    if cached:
+        headers.update(cache.validators(cached))
+
+    limiter = limiter or _governor
+    endpoint = endpoint_type(url)
     retries = 3
-    for i in range(retries):
+    for attempt in range(retries):
         try:
-            response = requests.get(url, headers=get_headers(), params=params, timeout=10)
+            limiter.acquire()
+            start = time.perf_counter()
+            response = get_session().get(url, headers=headers, params=params, timeout=10)
+            registry.observe("request_seconds", time.perf_counter() - start, endpoint=endpoint)
+            registry.inc("requests_total", endpoint=endpoint, status=response.status_code)
+            registry.inc("decoded_bytes_total", len(response.content), endpoint=endpoint)
+            _governor.update(response.headers)
             
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 429:
-                logging.warning("Rate limited (429). Sleeping for 30 seconds...")
-                time.sleep(30)
+            if response.status_code == 304 and cached:
+                cache.revalidated(url, params, cached)
+                return cached["body"]
+            elif response.status_code == 200:
+                start = time.perf_counter()
+                data = response.json()
+                registry.inc("parse_seconds_total", time.perf_counter() - start, endpoint=endpoint)
+                if cache:
+                    cache.put(url, params, data, response.headers)
+                return data
+            elif response.status_code == 429 or response.status_code >= 500:
+                retry_after = response.headers.get("Retry-After")
+                delay = _governor.backoff(attempt, float(retry_after) if retry_after and retry_after.isdigit() else None)
+                logging.warning(f"Request failed ({response.status_code}). Backing off {delay:.1f}s...")
                 continue
             else:
                 logging.error(f"Request failed: {response.status_code} - {url}")
                 return None
                 
         except Exception as e:
-            logging.error(f"Request exception: {e}")
-            time.sleep(5)
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+            logging.error(f"Request exception: {e}. Retrying in {delay:.1f}s...")
+            registry.inc("requests_total", endpoint=endpoint, status="error")
+            registry.inc("backoff_seconds_total", delay)
+            time.sleep(delay)
             
     return None
 
@@ -81,29 +232,490 @@ def load_json(filename):
             return json.load(f)
     return None
 
-def split_json_chunks(data, folder, base_name):
-    os.makedirs(folder, exist_ok=True)
-    filenames = []
-    chunk = []
-    chunk_index = 1
-    approx_size = 0
+def parse_chunk_line(line, filename):
+    """
+    Decode one NDJSON line of a chunk. A last line cut off by a crash (no
+    trailing newline, not valid JSON) is skipped with a warning: None.
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        if line.endswith(b"\n" if isinstance(line, bytes) else "\n"):
+            raise
+        logging.warning(f"Skipping incomplete last line of {filename} ({len(line)} bytes)")
+        return None
+
+def complete_size(filename, block_size=64 * 1024):
+    """
+    Length of an NDJSON file up to the end of its last complete line.
+    """
+    with open(filename, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            end = start
+    return 0
+
+def iter_json_array(filename, block_size=1024 * 1024):
+    """
+    Yield the items of a JSON array file one at a time, reading it in blocks
+    and decoding each item with raw_decode, so memory is bounded by the
+    largest item rather than the file (for the older JSON array chunks).
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (buffer[pos] == "[" and not started)):
+                started = started or buffer[pos] == "["
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    # A number at the very end of the buffer may still continue in the next block
+                    if end < len(buffer) or eof:
+                        yield item
+                        pos = end
+                        continue
+            if eof:
+                return
+            block = f.read(block_size)
+            eof = not block
+            buffer = buffer[pos:] + block
+            pos = 0
+
+def iter_saved_posts(master_file):
+    """
+    Yield the posts of a previous run, chunk by chunk, from its master JSON.
+    Handles NDJSON chunks and the older pretty-printed JSON array chunks,
+    both parsed one post at a time.
+    """
+    master = load_json(master_file)
+    if not master:
+        return
+    for chunk in master.get("chunks", []):
+        if not os.path.exists(chunk):
+            logging.warning(f"Chunk listed in {master_file} is missing: {chunk}")
+            continue
+        if chunk.endswith(".jsonl"):
+            with open(chunk, "r", encoding="utf-8") as f:
+                for line in f:
+                    post = parse_chunk_line(line, chunk) if line.strip() else None
+                    if post is not None:
+                        yield post
+        else:
+            yield from iter_json_array(chunk)
+
+def done_comments(checkpoint=None):
+    """
+    Ids of the posts whose comment trees need no fetching: already completed
+    in the checkpoint journal (read with Checkpoint.load_comments).
+    """
+    return set(checkpoint.comments) if checkpoint else set()
+
+def update_high_water_mark(state_file, posts):
+    """
+    Record the newest post seen (by created_utc) so the next incremental run
+    can stop paging once it reaches it, plus the size of this run (used by
+    the batch scheduler to estimate the next run's cost).
+    """
+    state = load_json(state_file) or {}
+    if posts:
+        newest = max(posts, key=lambda p: p["created_utc"])
+        previous = state.get("newest")
+        if not previous or newest["created_utc"] >= previous["created_utc"]:
+            state["newest"] = {"id": newest["id"], "created_utc": newest["created_utc"]}
+    state["last_run"] = int(time.time())
+    state["last_run_posts"] = len(posts)
+    save_json(state, state_file)
+    return state
+
+class Checkpoint:
+    """
+    Append-only journal of crawl progress ({subreddit}_checkpoint.jsonl).
+    Records each page of listed posts with its `after` cursor, the end of the
+    listing, and every post whose comments are done. It is replayed on start,
+    so a restarted run continues exactly where the previous one stopped.
+    Comment trees are not kept in memory on replay, only where their line
+    starts: load_comments() reads one back when its post is written.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.posts = []
+        self.after = None
+        self.posts_done = False
+        self.comments = {}
+        self.meta = {}
+        self.lock = threading.Lock()
+        self._replay()
+        self.file = open(filename, "ab")
+
+    def _replay(self):
+        if not os.path.exists(self.filename):
+            return
+        good_offset = 0
+        with open(self.filename, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Torn write from a crash; drop it and everything after
+                offset = good_offset
+                good_offset += len(line)
+                if entry["event"] == "posts":
+                    self.posts.extend(entry["posts"])
+                    self.after = entry["after"]
+                elif entry["event"] == "posts_done":
+                    self.posts_done = True
+                elif entry["event"] == "comments":
+                    self.comments[entry["id"]] = offset
+                elif entry["event"] == "meta":
+                    self.meta[entry["key"]] = entry["value"]
+        with open(self.filename, "r+b") as f:
+            f.truncate(good_offset)
+
+    def _append(self, entry):
+        """
+        Write one entry durably. Returns the offset of its line.
+        """
+        line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        return offset
 
+    @property
+    def resumed(self):
+        return bool(self.posts or self.comments)
+
+    def record_posts(self, posts, after):
+        self.posts.extend(posts)
+        self.after = after
+        self._append({"event": "posts", "after": after, "posts": posts})
+
+    def record_posts_done(self):
+        self.posts_done = True
+        self._append({"event": "posts_done"})
+
+    def record_comments(self, post_id, comments):
+        # Only journaled: keeping the tree here would hold every thread of the run in memory
+        self.comments[post_id] = self._append({"event": "comments", "id": post_id, "comments": comments})
+
+    def load_comments(self, post_id):
+        """
+        The comment tree journaled for post_id.
+        """
+        with open(self.filename, "rb") as f:
+            f.seek(self.comments[post_id])
+            return json.loads(f.readline())["comments"]
+
+    def record_meta(self, key, value):
+        self.meta[key] = value
+        self._append({"event": "meta", "key": key, "value": value})
+
+    def remove(self):
+        """
+        Delete the journal once the run's output has been saved.
+        """
+        self.file.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+INDEXED_FIELDS = ("created_utc", "score", "num_comments")
+
+def index_filename(master_file):
+    """
+    {base}_master.json -> {base}_index.json
+    """
+    base = master_file[:-len("_master.json")] if master_file.endswith("_master.json") else os.path.splitext(master_file)[0]
+    return base + "_index.json"
+
+class ChunkIndex:
+    """
+    Where every post of a chunk set is stored: post id -> [chunk number,
+    byte offset, length], plus the post count and min/max created_utc,
+    score and num_comments of each chunk. Readers use it to seek straight
+    to one post or to skip chunks that cannot match (see reader.py).
+    Only NDJSON chunks are indexed; older JSON array chunks get empty stats.
+    Each chunk's stats also hold its size when last indexed, so refresh()
+    can tell which chunks grew after the index was saved.
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        existing = load_json(filename) if filename else None
+        self.chunks = existing.get("chunks", []) if existing else []
+        self.posts = existing.get("posts", {}) if existing else {}
+
+    def add(self, chunk_number, filename, post, offset, length):
+        while len(self.chunks) <= chunk_number:
+            self.chunks.append({"file": None, "count": 0})
+        stats = self.chunks[chunk_number]
+        stats["file"] = filename
+        stats["count"] += 1
+        stats["size"] = offset + length
+        for field in INDEXED_FIELDS:
+            value = post.get(field)
+            if value is None:
+                continue
+            low, high = stats.get(f"min_{field}"), stats.get(f"max_{field}")
+            stats[f"min_{field}"] = value if low is None else min(low, value)
+            stats[f"max_{field}"] = value if high is None else max(high, value)
+        self.posts[post["id"]] = [chunk_number, offset, length]
+
+    def scan(self, chunk_number, filename):
+        """
+        (Re)build the entries of one chunk from the file on disk.
+        """
+        self.truncate(chunk_number)
+        self.chunks.append({"file": filename, "count": 0})
+        if not os.path.exists(filename):
+            return
+        if not filename.endswith(".jsonl"):
+            self.chunks[chunk_number]["size"] = os.path.getsize(filename)
+            return
+        offset = 0
+        with open(filename, "rb") as f:
+            for line in f:
+                post = parse_chunk_line(line, filename) if line.strip() else None
+                if post is not None:
+                    self.add(chunk_number, filename, post, offset, len(line))
+                offset += len(line)
+        self.chunks[chunk_number]["size"] = offset
+
+    def refresh(self, filenames):
+        """
+        Bring the index up to date with the chunk files: every chunk from the
+        first one that is new or changed size since it was indexed is scanned
+        again. Returns False, changing nothing, if the index belongs to a
+        different chunk set.
+        """
+        indexed = [stats["file"] for stats in self.chunks]
+        if indexed != filenames[:len(indexed)]:
+            return False
+        for number, filename in enumerate(filenames):
+            size = os.path.getsize(filename) if os.path.exists(filename) else None
+            if number < len(self.chunks) and self.chunks[number].get("size") == size:
+                continue
+            for later in range(number, len(filenames)):
+                self.scan(later, filenames[later])
+            break
+        return True
+
+    def truncate(self, chunk_count):
+        """
+        Forget every chunk from chunk_count on.
+        """
+        if len(self.chunks) <= chunk_count:
+            return
+        del self.chunks[chunk_count:]
+        self.posts = {post_id: entry for post_id, entry in self.posts.items() if entry[0] < chunk_count}
+
+    def save(self):
+        if not self.filename:
+            return
+        tmp_file = self.filename + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"chunks": self.chunks, "posts": self.posts}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file, self.filename)
+
+class ChunkWriter:
+    """
+    Streams posts to newline-delimited JSON chunks ({base_name}_001.jsonl, ...).
+    Each item is serialized once, compactly, and its byte size is counted as it
+    is written; a new chunk is started once CHUNK_SIZE_MB is reached.
+    If master_file is given it is rewritten on every rotation and on close,
+    so it always lists the chunks that exist on disk, and a ChunkIndex
+    ({base_name}_index.json) is kept next to it. The index is only saved when
+    a chunk is finished and on close, not on every flush; readers catch up
+    on the chunk still being written (see ChunkIndex.refresh). With append=True the
+    chunks already listed in master_file are kept and new posts are added
+    after them, continuing the last chunk if it still has room (cut back first
+    to the size the master recorded, dropping unflushed or torn lines). Otherwise the
+    chunk set is replaced, and leftover chunks of the old set are deleted on close.
+    """
+    def __init__(self, folder, base_name, master_file=None, append=False):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.base_name = base_name
+        self.master_file = master_file
+        self.filenames = []
+        self.chunk_index = 0
+        self.file = None
+        self.size = 0
+        self.count = 0
+
+        existing = load_json(master_file) if master_file else None
+        self.stale = []
+        self.index = ChunkIndex(index_filename(master_file) if master_file else None)
+        if existing and append:
+            self.filenames = list(existing.get("chunks", []))
+            self.count = existing.get("count", 0)
+            self.chunk_index = len(self.filenames)
+            self._reopen_last(existing.get("last_chunk_size"))
+            # The index is saved less often than the chunks grow: catch up on what it missed
+            if not self.index.refresh(self.filenames):
+                self.index.truncate(0)
+                self.index.refresh(self.filenames)
+        else:
+            self.index.truncate(0)
+            self.index.save()  # An index of the old chunk set must not outlive it
+            if existing:
+                self.stale = list(existing.get("chunks", []))
+
+    def _reopen_last(self, good_size=None):
+        """
+        Continue the last chunk if it still has room. With good_size (the size
+        the master last recorded) anything written after it is cut off first:
+        lines never flushed, or torn by a crash, would otherwise be appended to.
+        """
+        if not self.filenames:
+            return
+        last = self.filenames[-1]
+        if last.endswith(".jsonl") and os.path.exists(last):
+            size = os.path.getsize(last)
+            keep = good_size if good_size is not None and good_size <= size else complete_size(last)
+            if keep < size:
+                logging.warning(f"Truncating {last} from {size} to {keep} bytes (unflushed or incomplete writes)")
+                with open(last, "r+b") as f:
+                    f.truncate(keep)
+                size = keep
+            self.size = size
+            if size < CHUNK_SIZE_MB * 1024 * 1024:
+                self.file = open(last, "ab")
+
+    def snapshot(self):
+        """
+        Current end of the chunk set, to undo an interrupted append with restore().
+        """
+        return {"chunks": list(self.filenames), "count": self.count, "size": self.size if self.file else None}
+
+    def restore(self, snapshot):
+        """
+        Drop everything written after snapshot() was taken.
+        """
+        self._close_current()
+        for filename in self.filenames:
+            if filename not in snapshot["chunks"] and os.path.exists(filename):
+                os.remove(filename)
+        self.filenames = list(snapshot["chunks"])
+        self.count = snapshot["count"]
+        self.chunk_index = len(self.filenames)
+        self.index.truncate(len(self.filenames))
+        self.size = os.path.getsize(self.filenames[-1]) if self.filenames and os.path.exists(self.filenames[-1]) else 0
+        if snapshot["size"] is not None and os.path.exists(self.filenames[-1]):
+            with open(self.filenames[-1], "r+b") as f:
+                f.truncate(snapshot["size"])
+            self.index.scan(len(self.filenames) - 1, self.filenames[-1])
+            self._reopen_last()
+
+    def _open_next(self):
+        self.chunk_index += 1
+        filename = os.path.join(self.folder, f"{self.base_name}_{self.chunk_index:03d}.jsonl")
+        self.file = open(filename, "wb")
+        self.filenames.append(filename)
+        self.size = 0
+
+    def _close_current(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def write(self, item):
+        if self.file is None:
+            self._open_next()
+            self.write_master(complete=False)
+
+        start = time.perf_counter()
+        line = (json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        registry.inc("serialize_seconds_total", time.perf_counter() - start)
+        registry.inc("written_bytes_total", len(line))
+        self.file.write(line)
+        if "id" in item:
+            self.index.add(len(self.filenames) - 1, self.filenames[-1], item, self.size, len(line))
+        self.size += len(line)
+        self.count += 1
+
+        if self.size >= CHUNK_SIZE_MB * 1024 * 1024:
+            self._close_current()
+            self.index.save()
+            self.write_master(complete=False)
+
+    def flush(self):
+        """
+        Push everything written so far to disk (e.g. before acknowledging work).
+        """
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.write_master(complete=False)
+
+    def write_master(self, complete):
+        if not self.master_file:
+            return
+        master_json = {
+            "subreddit": self.base_name,
+            "format": "jsonl",
+            "chunks": self.filenames,
+            "index": self.index.filename,
+            "count": self.count,
+            "last_chunk_size": self.size,
+            "complete": complete
+        }
+        tmp_file = self.master_file + ".tmp"
+        save_json(master_json, tmp_file)
+        os.replace(tmp_file, self.master_file)
+
+    def _remove_stale(self):
+        for filename in self.stale:
+            if filename not in self.filenames and os.path.exists(filename):
+                os.remove(filename)
+        self.stale = []
+
+    def close(self):
+        self._close_current()
+        self.index.save()
+        self.write_master(complete=True)
+        self._remove_stale()
+        return self.filenames
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """
+        Close without finishing: the master is left marked incomplete and no chunks are removed.
+        """
+        self._close_current()
+        self.index.save()
+        self.write_master(complete=False)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def split_json_chunks(data, folder, base_name):
+    """
+    Stream an iterable of posts into NDJSON chunk files. Returns the filenames.
+    """
+    writer = ChunkWriter(folder, base_name)
     for item in data:
-        item_size = len(json.dumps(item, ensure_ascii=False).encode('utf-8'))
-        approx_size += item_size
-        chunk.append(item)
-
-        if approx_size >= CHUNK_SIZE_MB * 1024 * 1024:
-            filename = os.path.join(folder, f"{base_name}_{chunk_index:03d}.json")
-            save_json(chunk, filename)
-            filenames.append(filename)
-            chunk_index += 1
-            chunk = []
-            approx_size = 0
-
-    if chunk:
-        filename = os.path.join(folder, f"{base_name}_{chunk_index:03d}.json")
-        save_json(chunk, filename)
-        filenames.append(filename)
-
-    return filenames
+        writer.write(item)
+    return writer.close()
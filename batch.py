@@ -0,0 +1,142 @@
+# batch.py
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from master import run_job, get_output_folder, load_state, build_client_pool, app_bucket, DEFAULT_OPTIONS
+from fetch_posts import fetch_subscribers
+from sqlite_store import SQLiteStore
+from utils import setup_logging, load_json, save_json, TokenBucket
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+JOB_WORKERS = 2              # Subreddits crawled at once
+LISTING_CAP = 1000           # Reddit listings stop at ~1000 posts
+SUBSCRIBERS_PER_POST = 100   # Rough guess used to size subreddits never crawled before
+
+class JobStatus:
+    """
+    Thread-safe per-job status, rewritten to batch_status.json after every change.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def update(self, subreddit, **fields):
+        with self.lock:
+            self.jobs.setdefault(subreddit, {}).update(fields)
+            tmp_file = self.filename + ".tmp"
+            save_json(self.jobs, tmp_file)
+            os.replace(tmp_file, self.filename)
+
+def estimate_cost(reddit, subreddit, output_root=None, output_format=None):
+    """
+    Expected size of a job in posts: the last run's size if the subreddit was
+    crawled before, otherwise a guess from its subscriber count. The state is
+    read where run_job keeps it for the job's output_format.
+    """
+    output_folder = get_output_folder(subreddit, output_root)
+    database = os.path.join(output_folder, f"{subreddit}.db")
+    state = {}
+    if output_format != "sqlite":
+        state = load_state(output_folder, subreddit)
+    elif os.path.exists(database):
+        store = SQLiteStore(database)
+        try:
+            state = load_state(output_folder, subreddit, store)
+        finally:
+            store.abort()
+    if "last_run_posts" in state:
+        return state["last_run_posts"]
+    return min(LISTING_CAP, fetch_subscribers(reddit, subreddit) // SUBSCRIBERS_PER_POST)
+
+def run_batch(jobs, options=None, job_workers=JOB_WORKERS, requests_per_minute=None, output_root=None):
+    """
+    Crawl many subreddits from one process.
+    jobs is a list of {"subreddit", "start_year", "options" (optional), "cost" (optional)}.
+    Jobs run on a pool of job_workers threads, most expensive first, so the
+    long ones start early and the pool stays busy until the end. Jobs that
+    use the same app share its app_requests_per_minute budget, however many
+    run at once. If requests_per_minute is set, every PRAW client of every
+    job also draws from one shared TokenBucket. Returns the per-job status dict.
+    """
+    output_root = output_root or os.getcwd()
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    limiter = TokenBucket(requests_per_minute / 60.0) if requests_per_minute else None
+
+    status = JobStatus(os.path.join(output_root, "batch_status.json"))
+
+    def options_for(job):
+        return dict(options, output_root=output_root, **job.get("options", {}))
+
+    # One bucket per app (client_id), built before any job starts
+    app_limiters = {}
+    for job_options in [options] + [options_for(job) for job in jobs]:
+        if job_options["client_id"] not in app_limiters:
+            app_limiters[job_options["client_id"]] = app_bucket(job_options)
+
+    def app_limiter_for(job_options):
+        return app_limiters[job_options["client_id"]]
+
+    estimates = None
+    for job in jobs:
+        cost = job.get("cost")
+        if cost is None:
+            if estimates is None:
+                # One client is enough: an estimate is at most one subscriber lookup
+                estimates = build_client_pool(dict(options, workers=1), limiter, app_limiter_for(options))
+            with estimates.lease() as client:
+                cost = estimate_cost(client.reddit, job["subreddit"], output_root, options_for(job)["output_format"])
+        status.update(job["subreddit"], status="pending", cost=cost, start_year=job["start_year"])
+    ordered = sorted(jobs, key=lambda job: status.jobs[job["subreddit"]]["cost"], reverse=True)
+
+    def run(job):
+        subreddit = job["subreddit"]
+        status.update(subreddit, status="running", started_at=int(time.time()))
+        job_options = options_for(job)
+        try:
+            summary = run_job(subreddit, job["start_year"], job_options, limiter, app_limiter_for(job_options))
+            status.update(subreddit, status="done", finished_at=int(time.time()), posts=summary["posts"])
+        except Exception as e:
+            logging.exception(f"Job r/{subreddit} failed")
+            status.update(subreddit, status="failed", finished_at=int(time.time()), error=str(e))
+
+    with ThreadPoolExecutor(max_workers=job_workers) as executor:
+        list(executor.map(run, ordered))
+    return status.jobs
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl many subreddits from a job file (PRAW).")
+    parser.add_argument("job_file", help='JSON file: {"jobs": [{"subreddit": "...", "start_year": 2020}], ...}')
+    parser.add_argument("--output", help="Folder for all job outputs (default: current directory)")
+    parser.add_argument("--job-workers", type=int, help="Subreddits crawled at once")
+    args = parser.parse_args()
+
+    config = load_json(args.job_file)
+    if not config or not config.get("jobs"):
+        print(f"No jobs found in {args.job_file}")
+        sys.exit(1)
+
+    output_root = args.output or config.get("output_root") or os.getcwd()
+    os.makedirs(output_root, exist_ok=True)
+    setup_logging(os.path.join(output_root, "batch.log"))
+
+    jobs = run_batch(
+        config["jobs"],
+        options=config.get("options"),
+        job_workers=args.job_workers or config.get("job_workers", JOB_WORKERS),
+        requests_per_minute=config.get("requests_per_minute"),
+        output_root=output_root
+    )
+    failed = [name for name, job in jobs.items() if job["status"] == "failed"]
+    print(f"Done! {len(jobs) - len(failed)}/{len(jobs)} jobs succeeded. Status: {os.path.join(output_root, 'batch_status.json')}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
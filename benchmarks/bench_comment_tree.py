@@ -0,0 +1,147 @@
+# bench_comment_tree.py
+"""
+Compare the iterative comment parser (NoCredentials/comment_tree.py) with the
+recursive parser it replaced, on synthetic comment trees in Reddit's JSON shape.
+
+    python benchmarks/bench_comment_tree.py --comments 100000 --repeat 3
+
+Shapes:
+    wide  - every comment replies to a random earlier one (shallow, bushy)
+    deep  - reply chains of up to --chain-depth comments
+    chain - one single reply chain (the recursive parser hits the recursion limit)
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "NoCredentials"))
+from comment_tree import parse_children, to_nested
+
+# -----------------------------
+# Synthetic trees
+# -----------------------------
+def make_comment(i, parent_name):
+    return {
+        "kind": "t1",
+        "data": {
+            "name": f"t1_{i:x}",
+            "parent_id": parent_name,
+            "author": f"user{i % 997}",
+            "body": "Lorem ipsum dolor sit amet " * (1 + i % 4),
+            "created_utc": 1700000000 + i,
+            "score": i % 50,
+            "replies": ""
+        }
+    }
+
+def make_tree(n, shape, chain_depth=500, seed=0):
+    """
+    Return the top-level children list of a thread with n comments.
+    """
+    rng = random.Random(seed)
+    things = []
+    top_level = []
+    for i in range(n):
+        if shape == "chain":
+            parent = i - 1
+        elif shape == "deep":
+            parent = i - 1 if i % chain_depth else -1
+        else:
+            parent = rng.randrange(-1, i) if i else -1
+        parent_name = things[parent]["data"]["name"] if parent >= 0 else "t3_post"
+        thing = make_comment(i, parent_name)
+        things.append(thing)
+        if parent < 0:
+            top_level.append(thing)
+            continue
+        parent_data = things[parent]["data"]
+        if not parent_data["replies"]:
+            parent_data["replies"] = {"kind": "Listing", "data": {"children": []}}
+        parent_data["replies"]["data"]["children"].append(thing)
+    return top_level
+
+# -----------------------------
+# The recursive parser (before comment_tree.py)
+# -----------------------------
+def legacy_parse(children):
+    def parse_comment(comment_dict):
+        if comment_dict['kind'] == 'more':
+            return None
+        c_data = comment_dict['data']
+        parsed = {
+            "author": c_data.get('author', '[deleted]'),
+            "content": c_data.get('body', ''),
+            "created_utc": c_data.get('created_utc', 0),
+            "score": c_data.get('score', 0),
+            "replies": []
+        }
+        if 'replies' in c_data and c_data['replies']:
+            for reply in c_data['replies']['data']['children']:
+                r = parse_comment(reply)
+                if r:
+                    parsed["replies"].append(r)
+        return parsed
+
+    comments_list = []
+    for comment in children:
+        parsed = parse_comment(comment)
+        if parsed:
+            comments_list.append(parsed)
+    return comments_list
+
+def flat_parse(children):
+    return parse_children(children)[0]
+
+def nested_parse(children):
+    return to_nested(parse_children(children)[0])
+
+PARSERS = {
+    "recursive (nested dicts)": legacy_parse,
+    "iterative (flat records)": flat_parse,
+    "iterative + to_nested": nested_parse
+}
+
+# -----------------------------
+# Measurements
+# -----------------------------
+def measure(parser, children, repeat):
+    """
+    Best wall time of `repeat` runs and peak traced memory of one run, in (s, MB).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parser(children)
+        best = min(best, time.perf_counter() - start)
+        del result
+    tracemalloc.start()
+    result = parser(children)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best, peak / (1024 * 1024)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the comment tree parsers.")
+    parser.add_argument("--comments", type=int, default=100000, help="Comments per synthetic thread")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per parser (best is reported)")
+    parser.add_argument("--chain-depth", type=int, default=500, help="Reply chain length for the 'deep' shape")
+    parser.add_argument("--shapes", default="wide,deep,chain", help="Comma-separated shapes to run")
+    args = parser.parse_args()
+
+    print(f"{'shape':<7} {'parser':<26} {'time (s)':>9} {'peak MB':>9}")
+    for shape in args.shapes.split(","):
+        children = make_tree(args.comments, shape, args.chain_depth)
+        for name, parse in PARSERS.items():
+            try:
+                seconds, peak = measure(parse, children, args.repeat)
+            except RecursionError:
+                print(f"{shape:<7} {name:<26} {'RecursionError':>19}")
+                continue
+            print(f"{shape:<7} {name:<26} {seconds:>9.3f} {peak:>9.1f}")
+
+if __name__ == "__main__":
+    main()
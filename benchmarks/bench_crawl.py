@@ -0,0 +1,192 @@
+# bench_crawl.py
+"""
+End-to-end crawl benchmark against the local mock server (mock_reddit.py),
+so throughput and memory can be tracked without touching reddit.com.
+
+    python benchmarks/bench_crawl.py --backends noauth,praw --posts 500 --comments 50 --latency-ms 20
+
+Each backend crawls the synthetic subreddit with its own run_job in a fresh
+subprocess, which reports wall time, peak RSS and time spent serializing
+output; requests are counted by the mock server. Results are appended to
+benchmarks/results/ as one JSON file per run and compared with the
+previous file that used the same settings.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BENCH_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_FOLDER)
+RESULTS_FOLDER = os.path.join(BENCH_FOLDER, "results")
+SUBREDDIT = "bench"
+
+BACKEND_FOLDERS = {
+    "noauth": os.path.join(REPO_ROOT, "NoCredentials"),
+    "praw": REPO_ROOT
+}
+
+PRAW_INI = """[bench]
+client_id=bench
+client_secret=bench
+oauth_url={base_url}
+reddit_url={base_url}
+check_for_updates=false
+"""
+
+# -----------------------------
+# One crawl (runs inside the subprocess)
+# -----------------------------
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_crawl(backend, output_root, options):
+    sys.path.insert(0, BACKEND_FOLDERS[backend])
+    import utils
+    from master import run_job
+
+    # Time spent turning posts into output lines
+    serialize = {"seconds": 0.0}
+    write = utils.ChunkWriter.write
+
+    def timed_write(self, item):
+        start = time.perf_counter()
+        write(self, item)
+        serialize["seconds"] += time.perf_counter() - start
+    utils.ChunkWriter.write = timed_write
+
+    if backend == "praw":
+        options = dict(options, praw_sites=["bench"] * options.pop("workers", 4), user_agent="bench:scraper:v1.0")
+    start = time.perf_counter()
+    summary = run_job(SUBREDDIT, 2000, dict(options, output_root=output_root))
+    return {
+        "posts": summary["posts"],
+        "seconds": time.perf_counter() - start,
+        "serialize_seconds": serialize["seconds"],
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+# -----------------------------
+# Driver
+# -----------------------------
+def bench_backend(backend, mock, base_url, options):
+    work_folder = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+    try:
+        if backend == "praw":
+            with open(os.path.join(work_folder, "praw.ini"), "w") as f:
+                f.write(PRAW_INI.format(base_url=base_url))
+        env = dict(os.environ, REDDIT_BASE_URL=base_url)
+        before = mock.stats()
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", backend, "--output", work_folder,
+             "--options", json.dumps(options)],
+            cwd=work_folder, env=env, capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"{backend} crawl failed:\n{process.stderr[-2000:]}")
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        after = mock.stats()
+        requests = after["total_requests"] - before["total_requests"]
+        by_endpoint = {key: value - before["requests"].get(key, 0) for key, value in after["requests"].items()}
+        result.update({
+            "backend": backend,
+            "requests": requests,
+            "requests_by_endpoint": {key: value for key, value in by_endpoint.items() if value},
+            "mb_received": (after["bytes_sent"] - before["bytes_sent"]) / (1024 * 1024),
+            "posts_per_sec": result["posts"] / result["seconds"],
+            "requests_per_post": requests / result["posts"] if result["posts"] else 0.0,
+            "kb_received_per_post": (after["bytes_sent"] - before["bytes_sent"]) / 1024 / result["posts"] if result["posts"] else 0.0,
+            "requests_per_sec": requests / result["seconds"]
+        })
+        return result
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+def previous_results(settings):
+    """
+    The most recent saved run with the same settings, or None.
+    """
+    for filename in sorted(glob.glob(os.path.join(RESULTS_FOLDER, "crawl-*.json")), reverse=True):
+        with open(filename, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("settings") == settings:
+            return filename, saved
+    return None
+
+def report(results, previous):
+    old = {result["backend"]: result for result in previous[1]["results"]} if previous else {}
+    print(f"{'backend':<8} {'posts':>6} {'secs':>8} {'posts/s':>9} {'req/s':>8} {'req/post':>9} {'KB/post':>8} "
+          f"{'RSS MB':>8} {'serialize s':>12}  vs previous")
+    for result in results:
+        change = ""
+        if result["backend"] in old:
+            before = old[result["backend"]]["posts_per_sec"]
+            change = f"{(result['posts_per_sec'] - before) / before * 100:+.1f}% posts/s"
+        rss = f"{result['peak_rss_mb']:.1f}" if result["peak_rss_mb"] is not None else "n/a"
+        print(f"{result['backend']:<8} {result['posts']:>6} {result['seconds']:>8.2f} {result['posts_per_sec']:>9.1f} "
+              f"{result['requests_per_sec']:>8.1f} {result['requests_per_post']:>9.2f} {result['kb_received_per_post']:>8.1f} "
+              f"{rss:>8} {result['serialize_seconds']:>12.3f}  {change}")
+    if previous:
+        print(f"Compared with {os.path.basename(previous[0])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full crawls against a local mock Reddit server.")
+    parser.add_argument("--backends", default="noauth,praw", help="Comma-separated: noauth, praw")
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--comments", type=int, default=50, help="Comments per post")
+    parser.add_argument("--depth", type=int, default=5, help="Maximum reply depth")
+    parser.add_argument("--more", type=int, default=2, help="Top-level threads per post behind a 'more' stub")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Server-side delay per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--workers", type=int, default=4, help="Comment workers (PRAW clients for the praw backend)")
+    parser.add_argument("--discovery", choices=("new", "fanout"), default="new", help="Post discovery mode (see discovery.py)")
+    parser.add_argument("--crawl-profile", choices=("full", "top", "titles"), default="full", help="Crawl profile (see profiles.py)")
+    parser.add_argument("--no-save", action="store_true", help="Do not write the results file")
+    # Internal: run a single crawl in this process
+    parser.add_argument("--run", choices=sorted(BACKEND_FOLDERS), help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    parser.add_argument("--options", default="{}", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_crawl(args.run, args.output, json.loads(args.options))))
+        return
+
+    sys.path.insert(0, BENCH_FOLDER)
+    from mock_reddit import MockReddit, start_server
+
+    settings = {key: getattr(args, key) for key in ("posts", "comments", "depth", "more", "latency_ms", "error_rate", "workers", "discovery", "crawl_profile")}
+    mock = MockReddit(args.posts, args.comments, args.depth, args.more, args.latency_ms, args.error_rate)
+    server, base_url = start_server(mock)
+    results = []
+    try:
+        for backend in args.backends.split(","):
+            options = {"workers": args.workers} if backend == "praw" else {}
+            options.update(discovery=args.discovery, crawl_profile=args.crawl_profile)
+            print(f"Crawling {args.posts} synthetic posts with the {backend} backend...")
+            results.append(bench_backend(backend, mock, base_url, options))
+    finally:
+        server.shutdown()
+
+    previous = previous_results(settings)
+    report(results, previous)
+    if not args.no_save:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        filename = os.path.join(RESULTS_FOLDER, f"crawl-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "created": int(time.time()), "python": sys.version.split()[0],
+                       "results": results}, f, indent=2)
+        print(f"Results saved to {filename}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# mock_reddit.py
+"""
+Local stand-in for the parts of reddit.com the scrapers use, serving
+synthetic data so crawls can be benchmarked offline:
+
+    /r/{subreddit}/new(.json)          listings, newest first, paged with `after`
+    /r/{subreddit}/hot|top|controversial|search(.json)
+                                       other orderings (`t` time windows, `q=self:yes|no`)
+    /r/{subreddit}/about(.json)        subscriber count
+    /comments/{id}/ and permalinks     [post listing, comment listing] (honours limit, depth, sort=top)
+    /api/morechildren(.json)           comments hidden behind 'more' stubs
+    /api/v1/access_token               OAuth token for PRAW
+
+Like Reddit's, every listing ends after LISTING_CAP posts. Every response
+carries x-ratelimit headers; a share of requests can be answered with 429
+instead. Run it on its own with
+`python benchmarks/mock_reddit.py --port 8080`, then point
+REDDIT_BASE_URL (NoCredentials) or praw.ini's oauth_url / reddit_url at it.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PAGE_SIZE = 100
+LISTING_CAP = 1000           # Posts reachable through any one listing, as on reddit.com
+THREAD_CACHE_SIZE = 8        # Generated comment threads kept for follow-up requests
+COMMENT_PAGE_LIMIT = 200     # Comments on a comment page without `limit`; the rest sit behind a 'more' stub
+EPOCH = 1700000000           # created_utc of the newest post; older posts are one minute apart
+WINDOWS = {"hour": 3600, "day": 86400, "week": 7 * 86400, "month": 30 * 86400, "year": 365 * 86400}
+
+class MockReddit:
+    """
+    Deterministic synthetic subreddit: `posts` posts, each with `comments`
+    comments nested up to `depth` levels, of which the last `more` top-level
+    threads are hidden behind a 'more' stub. Requests sleep `latency_ms`
+    and a share `error_rate` of them get a 429.
+    """
+    def __init__(self, posts=500, comments=50, depth=5, more=0, latency_ms=0, error_rate=0.0, seed=0, cap=LISTING_CAP):
+        self.post_count = posts
+        self.cap = cap
+        self.comment_count = comments
+        self.depth = depth
+        self.more = more
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.bytes_sent = 0
+        self.thread_cache = {}
+
+    def count(self, endpoint, size=0):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes_sent += size
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(self.requests), "total_requests": sum(self.requests.values()), "bytes_sent": self.bytes_sent}
+
+    def should_fail(self):
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    # -------------------------
+    # Synthetic data
+    # -------------------------
+    def post_id(self, index):
+        return f"p{index:x}"
+
+    def post_data(self, subreddit, index):
+        post_id = self.post_id(index)
+        return {
+            "id": post_id,
+            "name": f"t3_{post_id}",
+            "title": f"Synthetic post {index}",
+            "selftext": "Lorem ipsum dolor sit amet. " * (1 + index % 8),
+            "author": f"author{index % 101}",
+            "created_utc": float(EPOCH - index * 60),
+            "score": index % 97,
+            "url": f"https://example.com/{post_id}",
+            "num_comments": self.comment_count,
+            "permalink": f"/r/{subreddit}/comments/{post_id}/synthetic_post_{index}/",
+            "subreddit": subreddit
+        }
+
+    def comments(self, subreddit, post_id):
+        """
+        (top-level comment things with nested replies, things hidden behind 'more').
+        The last few threads are cached, so paging through a big one stays cheap.
+        """
+        key = (subreddit, post_id)
+        with self.lock:
+            if key in self.thread_cache:
+                return self.thread_cache[key]
+        threads = self.build_comments(subreddit, post_id)
+        with self.lock:
+            self.thread_cache[key] = threads
+            while len(self.thread_cache) > THREAD_CACHE_SIZE:
+                self.thread_cache.pop(next(iter(self.thread_cache)))
+        return threads
+
+    def build_comments(self, subreddit, post_id):
+        rng = random.Random(f"{self.seed}:{post_id}")
+        things = []
+        depths = []
+        top_level = []
+        for i in range(self.comment_count):
+            parents = [j for j in range(max(0, i - 20), i) if depths[j] < self.depth - 1]
+            parent = rng.choice(parents) if parents and rng.random() < 0.7 else None
+            comment_id = f"{post_id}c{i:x}"
+            data = {
+                "id": comment_id,
+                "name": f"t1_{comment_id}",
+                "parent_id": things[parent]["data"]["name"] if parent is not None else f"t3_{post_id}",
+                "link_id": f"t3_{post_id}",
+                "author": f"user{rng.randrange(1000)}",
+                "body": "Synthetic comment text. " * rng.randint(1, 12),
+                "created_utc": float(EPOCH + i),
+                "score": rng.randint(-5, 100),
+                "subreddit": subreddit,
+                "replies": ""
+            }
+            thing = {"kind": "t1", "data": data}
+            things.append(thing)
+            depths.append(depths[parent] + 1 if parent is not None else 0)
+            if parent is None:
+                top_level.append(thing)
+            else:
+                parent_data = things[parent]["data"]
+                if not parent_data["replies"]:
+                    parent_data["replies"] = {"kind": "Listing", "data": {"after": None, "children": []}}
+                parent_data["replies"]["data"]["children"].append(thing)
+        hidden = top_level[len(top_level) - self.more:] if self.more else []
+        return top_level[:len(top_level) - len(hidden)], hidden
+
+    def trim(self, things, limit=None, depth=None):
+        """
+        Copy of a comment listing cut to `depth` reply levels and, at the
+        next top-level comment, to about `limit` comments. Returns (things,
+        ids of the top-level comments cut by the limit).
+        """
+        result, cut = [], []
+        kept = 0
+        stack = [(thing, 0, result) for thing in reversed(things)]
+        while stack:
+            thing, level, siblings = stack.pop()
+            if limit is not None and kept >= limit and level == 0:
+                cut.append(thing["data"]["id"])
+                continue
+            data = dict(thing["data"], replies="")
+            siblings.append({"kind": "t1", "data": data})
+            kept += 1
+            replies = thing["data"]["replies"]
+            if replies and (depth is None or level + 1 < depth):
+                children = []
+                data["replies"] = {"kind": "Listing", "data": {"after": None, "children": children}}
+                stack.extend((reply, level + 1, children) for reply in reversed(replies["data"]["children"]))
+        return result, cut
+
+    def comment_page(self, subreddit, post_id, limit=None, depth=None, sort=None):
+        index = int(post_id[1:], 16)
+        visible, hidden = self.comments(subreddit, post_id)
+        if sort == "top":
+            visible = sorted(visible, key=lambda thing: -thing["data"]["score"])
+        children = list(visible)
+        ids = [thing["data"]["id"] for thing in hidden]
+        if limit is None and self.comment_count > COMMENT_PAGE_LIMIT:
+            limit = COMMENT_PAGE_LIMIT
+        if limit is not None or depth is not None:
+            children, cut = self.trim(visible, limit, depth)
+            ids = cut + ids
+        if ids:
+            children.append({"kind": "more", "data": {
+                "id": ids[0], "name": f"t1_{ids[0]}", "parent_id": f"t3_{post_id}", "depth": 0,
+                "count": len(ids), "children": ids
+            }})
+        return [
+            {"kind": "Listing", "data": {"after": None, "children": [{"kind": "t3", "data": self.post_data(subreddit, index)}]}},
+            {"kind": "Listing", "data": {"after": None, "children": children}}
+        ]
+
+    def more_children(self, subreddit, link_id, children):
+        """
+        The requested hidden threads, flattened as /api/morechildren returns them.
+        """
+        wanted = set(children)
+        visible, hidden = self.comments(subreddit, link_id[3:])
+        things = []
+        stack = [thing for thing in reversed(visible + hidden) if thing["data"]["id"] in wanted]
+        while stack:
+            thing = stack.pop()
+            replies = thing["data"]["replies"]
+            things.append({"kind": "t1", "data": dict(thing["data"], replies="")})
+            if replies:
+                stack.extend(reversed(replies["data"]["children"]))
+        return {"json": {"errors": [], "data": {"things": things}}}
+
+    def ordering(self, sort, window=None, query=None):
+        """
+        Post indices in the order a listing returns them, capped at self.cap.
+        """
+        indices = range(self.post_count)
+        if sort == "hot":
+            indices = sorted(indices, key=lambda i: (i * 2654435761) % 2 ** 32)
+        elif sort in ("top", "controversial"):
+            # Posts are one minute apart, so a window holds the newest window/60 posts
+            newest = indices[:WINDOWS[window] // 60 + 1] if window in WINDOWS else indices
+            key = (lambda i: -(i % 97)) if sort == "top" else (lambda i: (i * 31) % 89)
+            indices = sorted(newest, key=key)
+        elif sort == "search":
+            indices = [i for i in indices if (i % 2 == 0) == (query == "self:yes")]
+        return list(indices)[:self.cap]
+
+    def listing(self, subreddit, sort="new", after=None, limit=PAGE_SIZE, window=None, query=None):
+        indices = self.ordering(sort, window, query)
+        start = 0
+        if after:
+            index = int(after[4:], 16)
+            start = indices.index(index) + 1 if index in indices else len(indices)
+        page = indices[start:start + min(limit, PAGE_SIZE)]
+        children = [{"kind": "t3", "data": self.post_data(subreddit, i)} for i in page]
+        next_after = f"t3_{self.post_id(page[-1])}" if page and start + len(page) < len(indices) else None
+        return {"kind": "Listing", "data": {"after": next_after, "dist": len(children), "children": children}}
+
+    # -------------------------
+    # Routing
+    # -------------------------
+    def respond(self, method, path, query, form):
+        """
+        Returns (status, endpoint name, body) for one request.
+        """
+        params = {key: values[-1] for key, values in dict(query, **form).items()}
+        if path.startswith("/api/v1/access_token"):
+            return 200, "token", {"access_token": "mock", "token_type": "bearer", "expires_in": 86400, "scope": "*"}
+        if self.should_fail():
+            return 429, "rate_limited", {"message": "Too Many Requests", "error": 429}
+        match = re.match(r"^/r/([^/]+)/(new|hot|top|controversial|search)(?:\.json|/)?$", path)
+        if match:
+            return 200, "listing", self.listing(match.group(1), match.group(2), params.get("after"),
+                                                int(params.get("limit", PAGE_SIZE)), params.get("t"), params.get("q"))
+        match = re.match(r"^/r/([^/]+)/about(?:\.json|/)?$", path)
+        if match:
+            return 200, "about", {"kind": "t5", "data": {"display_name": match.group(1), "subscribers": self.post_count * 100}}
+        if path.startswith("/api/morechildren"):
+            children = [child for child in params.get("children", "").split(",") if child]
+            return 200, "morechildren", self.more_children("bench", params.get("link_id", "t3_"), children)
+        match = re.search(r"/comments/([0-9a-z]+)", path)
+        if match:
+            subreddit = re.match(r"^/r/([^/]+)/", path)
+            limit, depth = params.get("limit"), params.get("depth")
+            return 200, "comments", self.comment_page(subreddit.group(1) if subreddit else "bench", match.group(1),
+                                                      int(limit) if limit else None, int(depth) if depth else None,
+                                                      params.get("sort"))
+        return 404, "not_found", {"message": "Not Found", "error": 404}
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def handle_request(self, method):
+            url = urlparse(self.path)
+            form = {}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                form = parse_qs(self.rfile.read(length).decode("utf-8"))
+            if mock.latency:
+                time.sleep(mock.latency)
+            status, endpoint, body = mock.respond(method, url.path, parse_qs(url.query), form)
+            data = json.dumps(body, separators=(",", ":")).encode("utf-8")
+            mock.count(endpoint, len(data))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("x-ratelimit-remaining", "100000")
+            self.send_header("x-ratelimit-used", "0")
+            self.send_header("x-ratelimit-reset", "600")
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+def start_server(mock, host="127.0.0.1", port=0):
+    """
+    Serve `mock` from a background thread. Returns (server, base_url).
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic subreddit for offline runs.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--comments", type=int, default=50, help="Comments per post")
+    parser.add_argument("--depth", type=int, default=5, help="Maximum reply depth")
+    parser.add_argument("--more", type=int, default=0, help="Top-level threads per post hidden behind a 'more' stub")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--cap", type=int, default=LISTING_CAP, help="Posts reachable through any one listing")
+    args = parser.parse_args()
+
+    mock = MockReddit(args.posts, args.comments, args.depth, args.more, args.latency_ms, args.error_rate, cap=args.cap)
+    server, base_url = start_server(mock, port=args.port)
+    print(f"Mock Reddit serving at {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
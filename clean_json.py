@@ -1,25 +1,110 @@
 # clean_json.py
-from utils import split_json_chunks, save_json
+from utils import ChunkWriter, iter_saved_posts, load_json, index_filename
 import os
+import json
+import time
 
-def combine_posts_comments(posts, comments_dict):
+def reusable_comments(master_file, posts, min_age_days=None):
     """
-    Merge comments into post dicts
-    Returns list of dicts ready for AI training
+    Compare posts with the previous run's chunks and return the ids of the
+    posts whose num_comments has not changed, so their stored comment trees
+    can be reused instead of fetched again. A tree that was never fetched
+    (comments_failed, or empty although the post has comments) is never reused.
+    If min_age_days is set, posts younger than that are always re-fetched
+    (their comment scores are still moving).
     """
-    combined = []
-    for post in posts:
-        post_copy = post.copy()
-        post_copy["comments"] = comments_dict.get(post["id"], [])
-        combined.append(post_copy)
-    return combined
+    current = {post["id"]: post for post in posts}
+    age_cutoff = time.time() - min_age_days * 86400 if min_age_days else None
+    reused = set()
+    for old in iter_saved_posts(master_file):
+        post = current.get(old.get("id"))
+        if not post or "comments" not in old:
+            continue
+        if age_cutoff is not None and post["created_utc"] > age_cutoff:
+            continue
+        if old.get("comments_failed") or old.get("num_comments") != post.get("num_comments"):
+            continue
+        if old["comments"] or old.get("comments_file") or not old.get("num_comments"):
+            reused.add(post["id"])
+    return reused
 
-def save_chunks(combined_data, output_folder, subreddit):
+def save_reused(master_file, reuse, reused_master):
     """
-    Split combined data into chunks (~100MB) and create master JSON referencing them
+    Copy the stored posts whose comments are reused to a chunk set of their
+    own (reused_master), before a refresh replaces the chunk set, so each
+    tree can be read back by id when its post comes up (reader.ChunkReader)
+    instead of all of them being held in memory. Returns the number of posts copied.
+    """
+    folder = os.path.dirname(reused_master)
+    base_name = os.path.basename(reused_master)[:-len("_master.json")]
+    with ChunkWriter(folder, base_name, reused_master) as writer:
+        for old in iter_saved_posts(master_file):
+            if old.get("id") in reuse:
+                writer.write(old)
+    return writer.count
+
+def remove_chunk_set(master_file):
+    """
+    Delete a chunk set: its chunks, index and master JSON.
+    """
+    master = load_json(master_file) or {}
+    for filename in master.get("chunks", []) + [master.get("index") or index_filename(master_file), master_file]:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+def save_unlisted(master_file, posts, filename):
+    """
+    Copy the stored posts that are not in `posts` (the current listing) to an
+    NDJSON file, before a refresh replaces the chunk set, so posts that have
+    left the listing window can be written again afterwards (see write_unlisted).
+    Returns the number of posts copied.
+    """
+    listed = {post["id"] for post in posts}
+    count = 0
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        for old in iter_saved_posts(master_file):
+            if old.get("id") not in listed:
+                f.write(json.dumps(old, ensure_ascii=False, separators=(",", ":")) + "\n")
+                count += 1
+    os.replace(tmp_file, filename)
+    return count
+
+def write_unlisted(filename, writers):
+    """
+    Write the posts saved by save_unlisted to every writer.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                post = json.loads(line)
+                for writer in writers:
+                    writer.write(post)
+
+def open_chunk_writer(output_folder, subreddit, append=False, checkpoint=None):
+    """
+    Open the ChunkWriter for a streaming run. When appending under a checkpoint,
+    the end of the existing chunk set is journaled first, so a resumed run can
+    roll back whatever the interrupted run had already appended.
+    """
+    master_file = os.path.join(output_folder, f"{subreddit}_master.json")
+    writer = ChunkWriter(output_folder, subreddit, master_file, append=append)
+    if append and checkpoint:
+        snapshot = checkpoint.meta.get("append_snapshot")
+        if snapshot:
+            writer.restore(snapshot)
+        else:
+            checkpoint.record_meta("append_snapshot", writer.snapshot())
+    return writer
+
+def save_chunks(combined_data, output_folder, subreddit, append=False):
+    """
+    Stream combined data (any iterable of posts) into NDJSON chunks (~100MB)
+    and keep the master JSON referencing them up to date.
+    With append=True the posts are merged into the existing chunk set.
     """
-    chunk_files = split_json_chunks(combined_data, output_folder, subreddit)
-    master_json = {"subreddit": subreddit, "chunks": chunk_files}
     master_file = os.path.join(output_folder, f"{subreddit}_master.json")
-    save_json(master_json, master_file)
+    with ChunkWriter(output_folder, subreddit, master_file, append=append) as writer:
+        for post in combined_data:
+            writer.write(post)
     return master_file
@@ -0,0 +1,136 @@
+# client_pool.py
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import praw
+from utils import load_json
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+MAX_FAILURES = 3             # Consecutive failures before a client is benched
+BENCH_SECONDS = 120          # How long a failing client is left out of rotation
+
+class PooledClient:
+    """
+    One PRAW client (one OAuth app) plus its health state.
+    PRAW tracks each client's own rate budget from the x-ratelimit headers.
+    """
+    def __init__(self, name, reddit):
+        self.name = name
+        self.reddit = reddit
+        self.busy = False
+        self.failures = 0
+        self.benched_until = 0
+
+    def remaining(self):
+        """
+        Requests left in this client's current rate window (inf if unknown or reset).
+        """
+        limits = self.reddit.auth.limits
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+        if remaining is None or (reset_timestamp and reset_timestamp <= time.time()):
+            return float("inf")
+        return remaining
+
+    def healthy(self):
+        return time.time() >= self.benched_until
+
+    def record(self, ok):
+        """
+        Report the outcome of a call made with this client.
+        """
+        if ok:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= MAX_FAILURES:
+            self.benched_until = time.time() + BENCH_SECONDS
+            self.failures = 0
+            logging.warning(f"Client {self.name} benched for {BENCH_SECONDS}s after repeated failures.")
+
+class ClientPool:
+    """
+    Pool of PRAW clients, usually one per registered OAuth app.
+    lease() hands out the idle, healthy client with the most rate budget
+    left, so throughput grows with the number of apps. A client is only
+    ever used by one thread at a time, because PRAW is not thread-safe.
+    """
+    def __init__(self, clients):
+        if not clients:
+            raise ValueError("ClientPool needs at least one client")
+        self.clients = clients
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.clients)
+
+    @classmethod
+    def from_praw_ini(cls, site_names, **reddit_kwargs):
+        """
+        One client per praw.ini section.
+        """
+        return cls([PooledClient(site, praw.Reddit(site, **reddit_kwargs)) for site in site_names])
+
+    @classmethod
+    def from_config(cls, filename, user_agent, **reddit_kwargs):
+        """
+        One client per entry of a JSON file:
+        [{"name": "...", "client_id": "...", "client_secret": "...", "user_agent": "..."}]
+        """
+        entries = load_json(filename)
+        if not entries:
+            raise ValueError(f"No credentials found in {filename}")
+        clients = []
+        for i, entry in enumerate(entries):
+            reddit = praw.Reddit(
+                client_id=entry["client_id"],
+                client_secret=entry["client_secret"],
+                user_agent=entry.get("user_agent", user_agent),
+                **reddit_kwargs
+            )
+            clients.append(PooledClient(entry.get("name", f"app{i + 1}"), reddit))
+        return cls(clients)
+
+    @classmethod
+    def single(cls, reddit):
+        """
+        Wrap one existing client, for code paths that take a pool.
+        """
+        return cls([PooledClient("default", reddit)])
+
+    @classmethod
+    def from_factory(cls, factory, size):
+        """
+        `size` clients of the same app, e.g. to run several workers on one credential set.
+        """
+        return cls([PooledClient(f"client{i + 1}", factory()) for i in range(size)])
+
+    def _pick(self):
+        candidates = [c for c in self.clients if not c.busy and c.healthy()]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda c: c.remaining())
+
+    @contextmanager
+    def lease(self):
+        """
+        Borrow the best available client; blocks while all are busy or benched.
+        """
+        with self.condition:
+            client = self._pick()
+            while client is None:
+                self.condition.wait(timeout=1)
+                client = self._pick()
+            client.busy = True
+        try:
+            yield client
+        except Exception:
+            client.record(False)
+            raise
+        finally:
+            with self.condition:
+                client.busy = False
+                self.condition.notify()
@@ -0,0 +1,428 @@
+# dedup.py
+import os
+import json
+import logging
+import argparse
+from utils import ChunkWriter, iter_saved_posts
+from postprocess import normalize_text
+
+try:
+    import numpy as np
+except ImportError:  # Only needed for deduplication
+    np = None
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+NUM_PERM = 128               # MinHash permutations per signature
+THRESHOLD = 0.8              # Estimated Jaccard similarity at which a text counts as a near-duplicate
+SHINGLE_CHARS = 5            # Bytes per shingle: windows over the UTF-8 encoding, so fewer characters in non-ASCII text
+MIN_CHARS = 40               # Shorter texts ("thanks!", "this") are never checked
+BATCH_ITEMS = 5000           # Texts checked against the index at once
+BATCH_SHINGLES = 262144      # Shingles hashed per NumPy pass (bounds the temporary arrays)
+PERM_BLOCK = 16              # Permutations computed per pass
+MERGE_ITEMS = 50000          # Newly indexed texts kept in a small side index before it is merged
+SEED = 1
+
+MODES = ("mark", "remove")
+
+def choose_bands(threshold, num_perm=NUM_PERM):
+    """
+    LSH bands for num_perm permutations: the split whose collision threshold
+    (1/b)^(1/r) is the highest one at or below `threshold`, so near-duplicates
+    almost always share a bucket. Candidates are then verified on the full signature.
+    """
+    splits = [bands for bands in range(1, num_perm + 1) if num_perm % bands == 0]
+    below = [bands for bands in splits if (1 / bands) ** (bands / num_perm) <= threshold]
+    return min(below) if below else max(splits)
+
+class MinHasher:
+    """
+    MinHash signatures of byte shingles (every window of shingle_chars bytes
+    of the UTF-8 text), computed in NumPy batches. Shingles are hashed with
+    a rolling polynomial and permuted with multiply-shift hashing, one block
+    of permutations at a time.
+    """
+    def __init__(self, num_perm=NUM_PERM, shingle_chars=SHINGLE_CHARS, seed=SEED):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_chars = shingle_chars
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self.powers = np.uint64(1099511628211) ** np.arange(shingle_chars - 1, -1, -1, dtype=np.uint64)
+
+    def shingles(self, text):
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        if len(data) < self.shingle_chars:
+            data = np.pad(data, (0, self.shingle_chars - len(data)))
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.shingle_chars)
+        hashes = windows @ self.powers
+        hashes ^= hashes >> np.uint64(29)
+        return np.unique(hashes)
+
+    def signatures(self, texts):
+        """
+        (len(texts), num_perm) uint32 signatures. Every text must be non-empty.
+        """
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            # Take texts until the shingle budget is used (always at least one)
+            hashes, end, total = [], start, 0
+            while end < len(texts) and (not hashes or total < BATCH_SHINGLES):
+                hashes.append(self.shingles(texts[end]))
+                total += len(hashes[-1])
+                end += 1
+            flat = np.concatenate(hashes)
+            offsets = np.cumsum([0] + [len(h) for h in hashes[:-1]])
+            for block in range(0, self.num_perm, PERM_BLOCK):
+                a, b = self.a[block:block + PERM_BLOCK, None], self.b[block:block + PERM_BLOCK, None]
+                permuted = ((a * flat[None, :] + b) >> np.uint64(32)).astype(np.uint32)
+                result[start:end, block:block + PERM_BLOCK] = np.minimum.reduceat(permuted, offsets, axis=1).T
+            start = end
+        return result
+
+def band_keys(signatures, bands):
+    """
+    (n, bands) uint64 bucket keys: each band of rows folded into one number.
+    """
+    rows = signatures.shape[1] // bands
+    multipliers = np.random.default_rng(SEED).integers(1, 2 ** 63, rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    grouped = signatures[:, :bands * rows].reshape(len(signatures), bands, rows).astype(np.uint64)
+    return (grouped * multipliers).sum(axis=2, dtype=np.uint64)
+
+class BandIndex:
+    """
+    LSH buckets as one sorted key array per band, so a batch of keys is
+    looked up with searchsorted instead of a Python dict per bucket.
+    """
+    def __init__(self, bands):
+        self.keys = [np.empty(0, dtype=np.uint64) for _ in range(bands)]
+        self.rows = [np.empty(0, dtype=np.int64) for _ in range(bands)]
+
+    def __len__(self):
+        return len(self.rows[0])
+
+    def add(self, keys, rows):
+        for band in range(len(self.keys)):
+            order = np.argsort(keys[:, band], kind="stable")
+            new_keys, new_rows = keys[order, band], rows[order]
+            at = np.searchsorted(self.keys[band], new_keys, side="right")
+            self.keys[band] = np.insert(self.keys[band], at, new_keys)
+            self.rows[band] = np.insert(self.rows[band], at, new_rows)
+
+    def merge(self, other):
+        for band in range(len(self.keys)):
+            keys = np.concatenate([self.keys[band], other.keys[band]])
+            rows = np.concatenate([self.rows[band], other.rows[band]])
+            order = np.argsort(keys, kind="stable")
+            self.keys[band], self.rows[band] = keys[order], rows[order]
+
+    def candidates(self, keys):
+        """
+        (query, row) pairs of every indexed row sharing a bucket with a query key.
+        """
+        queries, rows = [], []
+        for band in range(len(self.keys)):
+            low = np.searchsorted(self.keys[band], keys[:, band], side="left")
+            high = np.searchsorted(self.keys[band], keys[:, band], side="right")
+            counts = high - low
+            if not counts.any():
+                continue
+            starts = np.repeat(low - np.cumsum(counts) + counts, counts)
+            queries.append(np.repeat(np.arange(len(keys)), counts))
+            rows.append(self.rows[band][starts + np.arange(counts.sum())])
+        if not queries:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(queries), np.concatenate(rows)
+
+class SignatureIndex:
+    """
+    MinHash signatures of every text kept so far, bucketed with LSH, and
+    stored in an .npz file (ids + signatures) so a later run can check new
+    texts against the whole corpus without rehashing it. The bands are
+    derived from the threshold when the file is loaded, so the threshold
+    can change between runs; num_perm and the shingle size cannot.
+    """
+    def __init__(self, filename=None, threshold=THRESHOLD, num_perm=NUM_PERM):
+        if np is None:
+            raise ImportError("numpy is required for deduplication (pip install numpy)")
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Threshold must be in (0, 1], got {threshold}")
+        self.filename = filename
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = choose_bands(threshold, num_perm)
+        self.ids = []
+        self.known = set()
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.count = 0
+        self.main = BandIndex(self.bands)
+        self.recent = BandIndex(self.bands)
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        with np.load(self.filename) as data:
+            if int(data["num_perm"]) != self.hasher.num_perm or int(data["shingle_chars"]) != self.hasher.shingle_chars:
+                raise ValueError(f"{self.filename} was built with different MinHash settings")
+            ids, signatures = data["ids"].tolist(), data["signatures"]
+        self._append(ids, signatures)
+        self.main.merge(self.recent)
+        self.recent = BandIndex(self.bands)
+        logging.info(f"Loaded {len(ids)} signatures from {self.filename}")
+
+    def save(self):
+        if not self.filename:
+            return
+        tmp_file = self.filename + ".tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, ids=np.array(self.ids, dtype=str), signatures=self.signatures[:self.count],
+                     num_perm=self.hasher.num_perm, shingle_chars=self.hasher.shingle_chars)
+        os.replace(tmp_file, self.filename)
+
+    def _append(self, ids, signatures):
+        if self.count + len(ids) > len(self.signatures):
+            grown = np.empty((max(2 * len(self.signatures), self.count + len(ids)), self.hasher.num_perm), dtype=np.uint32)
+            grown[:self.count] = self.signatures[:self.count]
+            self.signatures = grown
+        rows = np.arange(self.count, self.count + len(ids))
+        self.signatures[rows] = signatures
+        self.count += len(ids)
+        self.ids.extend(ids)
+        self.known.update(ids)
+        self.recent.add(band_keys(signatures, self.bands), rows)
+        if len(self.recent) > max(MERGE_ITEMS, len(self.main) // 8):
+            self.main.merge(self.recent)
+            self.recent = BandIndex(self.bands)
+
+    def check(self, items):
+        """
+        Check (id, text) pairs, in order, against the index and each other.
+        Returns {id: id of the earlier text it near-duplicates}. Texts that
+        are not duplicates are added to the index. Ids already in the index
+        and texts shorter than MIN_CHARS are skipped.
+        """
+        ids, texts = [], []
+        for item_id, text in items:
+            text = " ".join(normalize_text(text).lower().split())
+            if item_id not in self.known and len(text) >= MIN_CHARS:
+                ids.append(item_id)
+                texts.append(text)
+        if not ids:
+            return {}
+        signatures = self.hasher.signatures(texts)
+        keys = band_keys(signatures, self.bands)
+
+        # Earlier texts: the indexed corpus (earliest row wins) ...
+        matches = {}
+        for index in (self.main, self.recent):
+            queries, rows = index.candidates(keys)
+            similar = (signatures[queries] == self.signatures[rows]).mean(axis=1) >= self.threshold
+            for query, row in zip(queries[similar].tolist(), rows[similar].tolist()):
+                matches[query] = min(matches.get(query, row), row)
+        duplicates = {ids[query]: self.ids[row] for query, row in matches.items()}
+
+        # ... then earlier texts of this batch. A text whose signature repeats an
+        # earlier one is paired with that text alone (so a flood of copies stays
+        # linear); the others with every earlier text they share a bucket with.
+        _, first, inverse = np.unique(signatures, axis=0, return_index=True, return_inverse=True)
+        same = first[inverse.reshape(-1)]
+        positions = np.arange(len(ids))
+        pairs = set(zip(positions[same != positions].tolist(), same[same != positions].tolist()))
+        distinct = positions[same == positions]
+        for band in range(self.bands):
+            order = distinct[np.argsort(keys[distinct, band], kind="stable")]
+            sorted_keys = keys[order, band]
+            bounds = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1], True])
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                bucket = order[start:end].tolist()  # In batch order: the sort is stable
+                pairs.update((later, earlier) for i, later in enumerate(bucket) for earlier in bucket[:i])
+        if pairs:
+            queries, earlier = (np.array(side) for side in zip(*sorted(pairs)))
+            similar = (signatures[queries] == signatures[earlier]).mean(axis=1) >= self.threshold
+            for query, row in zip(queries[similar].tolist(), earlier[similar].tolist()):
+                if ids[query] not in duplicates:
+                    duplicates[ids[query]] = duplicates.get(ids[row], ids[row])
+
+        kept = [position for position, item_id in enumerate(ids) if item_id not in duplicates]
+        if kept:
+            self._append([ids[position] for position in kept], signatures[kept])
+        return duplicates
+
+# -----------------------------
+# Applying the result to posts
+# -----------------------------
+def iter_comment_dicts(comments):
+    stack = list(reversed(comments))
+    while stack:
+        comment = stack.pop()
+        yield comment
+        stack.extend(reversed(comment.get("replies", [])))
+
+def post_text(post):
+    return "\n\n".join(part for part in (post.get("title"), post.get("content")) if part)
+
+class Deduplicator:
+    """
+    Marks or removes near-duplicate posts and comments, checking them in
+    batches against a SignatureIndex. mode="mark" adds "duplicate_of" (the
+    id of the earlier text) to duplicates; mode="remove" drops duplicate
+    posts, and duplicate comments together with their replies.
+    Threads spilled to disk (comments_file) are rewritten, into thread_folder
+    if given, otherwise in place (and deleted with their post on removal).
+    """
+    def __init__(self, index, mode="mark", thread_folder=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown dedup mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.index = index
+        self.mode = mode
+        self.thread_folder = thread_folder
+        self.posts = 0
+        self.duplicates = {"post": 0, "comment": 0}
+        self.pending = []
+        self.pending_items = []
+
+    def items(self, post):
+        yield post["id"], post_text(post)
+        if post.get("comments_file"):
+            with open(post["comments_file"], "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        yield row["id"], row.get("content")
+        else:
+            for comment in iter_comment_dicts(post.get("comments", [])):
+                if comment.get("id"):
+                    yield comment["id"], comment.get("content")
+
+    def add(self, post):
+        """
+        Queue one post. Once about BATCH_ITEMS texts are queued they are
+        checked together and the finished posts are returned (duplicates
+        marked, removed posts left out); until then the result is [].
+        """
+        self.pending.append(post)
+        self.pending_items.extend(self.items(post))
+        if len(self.pending_items) < BATCH_ITEMS:
+            return []
+        return self.flush()
+
+    def flush(self):
+        """
+        Check the posts still queued by add() and return them.
+        """
+        posts, items = self.pending, self.pending_items
+        self.pending, self.pending_items = [], []
+        return list(self._apply_batch(posts, items))
+
+    def process(self, posts):
+        """
+        Yield the posts with duplicates marked or removed, checking
+        about BATCH_ITEMS texts per batch.
+        """
+        for post in posts:
+            yield from self.add(post)
+        yield from self.flush()
+
+    def _apply_batch(self, posts, items):
+        duplicates = self.index.check(items)
+        for post in posts:
+            self.posts += 1
+            if post["id"] in duplicates:
+                self.duplicates["post"] += 1
+                if self.mode == "remove":
+                    if post.get("comments_file") and not self.thread_folder:
+                        os.remove(post["comments_file"])
+                    continue
+                post["duplicate_of"] = duplicates[post["id"]]
+            if post.get("comments_file"):
+                self._apply_thread_file(post, duplicates)
+            else:
+                post["comments"] = self._apply_comments(post.get("comments", []), duplicates)
+            yield post
+
+    def _apply_comments(self, comments, duplicates):
+        def keep(replies):
+            kept = []
+            for comment in replies:
+                if comment.get("id") in duplicates:
+                    self.duplicates["comment"] += 1
+                    if self.mode == "remove":
+                        continue
+                    comment["duplicate_of"] = duplicates[comment["id"]]
+                kept.append(comment)
+            return kept
+
+        comments = keep(comments)
+        for comment in iter_comment_dicts(comments):
+            if comment.get("replies"):
+                comment["replies"] = keep(comment["replies"])
+        return comments
+
+    def _apply_thread_file(self, post, duplicates):
+        folder = self.thread_folder or os.path.dirname(post["comments_file"])
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, os.path.basename(post["comments_file"]))
+        tmp_file = filename + ".tmp"
+        removed = set()
+        count = 0
+        with open(post["comments_file"], "r", encoding="utf-8") as source, open(tmp_file, "w", encoding="utf-8") as f:
+            for line in source:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if row["id"] in duplicates:
+                    self.duplicates["comment"] += 1
+                    if self.mode == "remove":
+                        removed.add(row["id"])
+                        continue
+                    row["duplicate_of"] = duplicates[row["id"]]
+                elif row["parent_id"] in removed:
+                    removed.add(row["id"])
+                    continue
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+        os.replace(tmp_file, filename)
+        post["comments_file"] = filename
+        post["comments_count"] = count
+
+    def report(self):
+        logging.info(f"Dedup ({self.mode}): {self.duplicates['post']} duplicate posts and "
+                     f"{self.duplicates['comment']} duplicate comments in {self.posts} posts; "
+                     f"{self.index.count} texts indexed.")
+
+def signature_filename(master_file):
+    """
+    {subreddit}_signatures.npz next to a {subreddit}_master.json.
+    """
+    base = master_file[:-len("_master.json")] if master_file.endswith("_master.json") else os.path.splitext(master_file)[0]
+    return base + "_signatures.npz"
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark or remove near-duplicate posts and comments in a chunk set.")
+    parser.add_argument("master_file", help="{subreddit}_master.json")
+    parser.add_argument("--mode", choices=MODES, default="mark")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Estimated Jaccard similarity of near-duplicates")
+    parser.add_argument("--signatures", help="Signature file to check against and extend (default: {subreddit}_signatures.npz)")
+    parser.add_argument("--output", help="Output folder (default: next to the master JSON)")
+    parser.add_argument("--name", help="Base name of the output files (default: {subreddit}_dedup)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    base = os.path.basename(args.master_file)
+    base = base[:-len("_master.json")] if base.endswith("_master.json") else os.path.splitext(base)[0]
+    output_folder = args.output or os.path.dirname(args.master_file) or "."
+    name = args.name or f"{base}_dedup"
+    index = SignatureIndex(args.signatures or signature_filename(args.master_file), args.threshold)
+    deduplicator = Deduplicator(index, args.mode, thread_folder=os.path.join(output_folder, f"{name}_threads"))
+    master_file = os.path.join(output_folder, f"{name}_master.json")
+    with ChunkWriter(output_folder, name, master_file) as writer:
+        for post in deduplicator.process(iter_saved_posts(args.master_file)):
+            writer.write(post)
+    index.save()
+    deduplicator.report()
+    print(f"Wrote {master_file}")
+
+if __name__ == "__main__":
+    main()
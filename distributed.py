@@ -0,0 +1,128 @@
+# distributed.py
+import os
+import glob
+import time
+import socket
+import logging
+import argparse
+from fetch_posts import fetch_posts
+from fetch_comments import fetch_comments_for_post
+from clean_json import save_chunks
+from master import get_output_folder, build_client_pool, DEFAULT_OPTIONS
+from comment_tree import with_comments
+from utils import setup_logging, ChunkWriter, iter_saved_posts, update_high_water_mark
+from work_queue import WorkQueue
+
+POLL_SECONDS = 10            # Idle workers re-check the queue this often
+
+def queue_file(output_folder, subreddit):
+    return os.path.join(output_folder, f"{subreddit}_queue.db")
+
+def discover(pool, subreddit, start_year, output_folder):
+    """
+    List the subreddit's posts and enqueue them batch by batch.
+    """
+    queue = WorkQueue(queue_file(output_folder, subreddit))
+    with pool.lease() as client:
+        posts = fetch_posts(client.reddit, subreddit, start_year, checkpoint=queue)
+    logging.info(f"Discovery complete: {len(posts)} posts queued. {queue.counts()}")
+    queue.close()
+
+def work(pool, subreddit, output_folder, worker):
+    """
+    Lease batches of posts, fetch their comments and write them to this
+    worker's own shard. A post is acknowledged only after its shard is flushed.
+    """
+    queue = WorkQueue(queue_file(output_folder, subreddit))
+    base_name = f"{subreddit}_shard_{worker}"
+    shard_master = os.path.join(output_folder, f"{base_name}_master.json")
+    # Per worker, so two workers holding the same post (expired lease) never share a thread file
+    spill_folder = os.path.join(output_folder, f"{base_name}_threads")
+    processed = 0
+
+    with ChunkWriter(output_folder, base_name, shard_master, append=True) as writer:
+        while True:
+            batch = queue.lease(worker)
+            if not batch:
+                if queue.finished():
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+
+            done, failed = [], []
+            for post in batch:
+                with pool.lease() as client:
+                    comments = fetch_comments_for_post(client.reddit, post["id"], spill_folder=spill_folder)
+                    client.record(comments is not None)
+                if comments is None:
+                    failed.append(post["id"])
+                    continue
+                writer.write(with_comments(post, comments))
+                done.append(post["id"])
+
+            writer.flush()
+            queue.complete(done)
+            queue.release(worker, failed)
+            processed += len(done)
+            logging.info(f"Worker {worker}: {processed} posts done. Queue: {queue.counts()}")
+
+    queue.close()
+
+def merge(subreddit, output_folder, force=False):
+    """
+    Combine all worker shards into the usual chunks + master JSON, dropping
+    posts that more than one worker wrote (after an expired lease).
+    """
+    queue = WorkQueue(queue_file(output_folder, subreddit))
+    if not queue.finished() and not force:
+        print(f"Queue not finished yet: {queue.counts()}. Use --force to merge anyway.")
+        return None
+    queue.close()
+
+    shard_masters = sorted(glob.glob(os.path.join(output_folder, f"{subreddit}_shard_*_master.json")))
+    seen = set()
+    markers = []
+
+    def unique_posts():
+        for shard_master in shard_masters:
+            for post in iter_saved_posts(shard_master):
+                if post["id"] in seen:
+                    continue
+                seen.add(post["id"])
+                markers.append({"id": post["id"], "created_utc": post["created_utc"]})
+                yield post
+
+    master_file = save_chunks(unique_posts(), output_folder, subreddit)
+    update_high_water_mark(os.path.join(output_folder, f"{subreddit}_state.json"), markers)
+    logging.info(f"Merged {len(seen)} posts from {len(shard_masters)} shards into {master_file}")
+    return master_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl one subreddit with several worker processes sharing a queue.")
+    parser.add_argument("command", choices=["discover", "work", "merge"])
+    parser.add_argument("subreddit")
+    parser.add_argument("start_year", type=int, nargs="?", help="Required for discover")
+    parser.add_argument("--output", help="Folder that holds {subreddit}_data (default: current directory)")
+    parser.add_argument("--credentials-file", help="JSON credentials pool (see client_pool.py); default: praw.ini / env vars")
+    parser.add_argument("--worker", default=f"{socket.gethostname()}-{os.getpid()}", help="Unique worker name")
+    parser.add_argument("--force", action="store_true", help="Merge even if the queue is not finished")
+    args = parser.parse_args()
+
+    output_folder = get_output_folder(args.subreddit, args.output)
+    os.makedirs(output_folder, exist_ok=True)
+    setup_logging(os.path.join(output_folder, f"{args.subreddit}.log"))
+    options = dict(DEFAULT_OPTIONS, credentials_file=args.credentials_file, workers=1)
+
+    if args.command == "discover":
+        if args.start_year is None:
+            parser.error("discover needs a start_year")
+        discover(build_client_pool(options), args.subreddit, args.start_year, output_folder)
+    elif args.command == "work":
+        work(build_client_pool(options), args.subreddit, output_folder, args.worker)
+    else:
+        master_file = merge(args.subreddit, output_folder, args.force)
+        if master_file:
+            print(f"Done! Data saved to {output_folder}")
+
+if __name__ == "__main__":
+    main()
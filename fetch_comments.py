@@ -1,68 +1,147 @@
 # fetch_comments.py
+import time
 import logging
-from praw.models import MoreComments
+import threading
+from comment_tree import CommentBuffer, parse_forest
+from metrics import registry
 
-def fetch_comments_for_post(reddit, post_id):
+# -------------------------
+# CONFIGURATION
+# -------------------------
+MAX_WORKERS = 4              # Submissions fetched/expanded at once (single-app runs)
+MORE_BUDGET_PER_POST = None  # MoreComments expansions (~1 request each) per submission; None = unlimited (the full tree)
+MORE_BUDGET_PER_RUN = None   # MoreComments expansions across the whole run; None = unlimited
+MORE_THRESHOLD = 0           # Skip MoreComments stubs hiding fewer than this many comments
+
+class ExpansionBudget:
+    """
+    Thread-safe pool of MoreComments expansions shared by all workers of a run.
+    """
+    def __init__(self, total=None):
+        self.remaining = total
+        self.lock = threading.Lock()
+
+    def take(self, wanted):
+        """
+        Reserve up to `wanted` expansions (None = as many as needed). Returns the grant.
+        """
+        with self.lock:
+            if self.remaining is None:
+                return wanted
+            granted = self.remaining if wanted is None else min(wanted, self.remaining)
+            self.remaining -= granted
+            return granted
+
+    def refund(self, unused):
+        with self.lock:
+            if self.remaining is not None:
+                self.remaining += unused
+
+    @property
+    def limited(self):
+        return self.remaining is not None
+
+class RunBudgetLimit:
+    """
+    The `limit` handed to replace_more when the run budget is limited.
+    replace_more checks `limit <= 0` before each expansion and subtracts 1
+    after it; here that check takes the expansion from the run budget (and
+    never more than post_budget in all), so concurrent posts draw on the
+    run budget one request at a time instead of the first taking all of it.
+    """
+    def __init__(self, run_budget, post_budget=None):
+        self.run_budget = run_budget
+        self.post_budget = post_budget
+        self.left = 0
+        self.drawn = 0
+
+    def __le__(self, other):
+        if self.left <= 0 and (self.post_budget is None or self.drawn < self.post_budget):
+            granted = self.run_budget.take(1)
+            self.left += granted
+            self.drawn += granted
+        return self.left <= other
+
+    def __sub__(self, other):
+        self.left -= other
+        return self
+
+_requests = threading.local()
+
+def count_request():
+    """
+    Count one HTTP request made by the calling thread. Called by
+    master.RateLimitedRequestor; PRAW runs every request on the caller's thread.
+    """
+    _requests.count = getattr(_requests, "count", 0) + 1
+
+def requests_made():
+    return getattr(_requests, "count", 0)
+
+def expand_comments(submission, post_budget=MORE_BUDGET_PER_POST, run_budget=None):
+    """
+    Replace MoreComments in a single replace_more call, limited to
+    post_budget expansions and, if the run budget is limited, to what is
+    left of it as each expansion is made (see RunBudgetLimit). Every replaced
+    MoreComments costs about one request, so the budgets bound request cost
+    rather than depth; whatever is left over is dropped from the tree by
+    PRAW. run_budget is charged the requests replace_more actually made
+    (see count_request), and the rest of what was drawn is given back.
+    Returns the number of 'more' stubs left unexpanded.
+    """
+    # Loads the submission first, so its own request is not charged as an expansion
+    comments = submission.comments
+    if post_budget == 0:
+        return len(comments.replace_more(limit=0))
+    if not (run_budget and run_budget.limited):
+        skipped = comments.replace_more(limit=post_budget, threshold=MORE_THRESHOLD)
+    else:
+        limit = RunBudgetLimit(run_budget, post_budget)
+        before = requests_made()
+        skipped = comments.replace_more(limit=limit, threshold=MORE_THRESHOLD)
+        run_budget.refund(max(0, limit.drawn - (requests_made() - before)))
+    if skipped:
+        logging.info(f"Expansion budget reached for {submission.id}: {len(skipped)} 'more' stubs left unexpanded.")
+    return len(skipped)
+
+def fetch_comments_for_post(reddit, post_id, post_budget=MORE_BUDGET_PER_POST, run_budget=None, profile=None, spill_folder=None,
+                            truncated=None):
     """
     Fetch comments for a single post using PRAW.
-    Returns list of comment dicts.
+    MoreComments are expanded within post_budget and the shared run_budget,
+    then the tree is flattened without recursion (see comment_tree.py).
+    A CrawlProfile (see profiles.py) sets the comment sort and limit of the
+    request, whether MoreComments are expanded, and the depth and fields kept
+    (PRAW cannot send `depth`, so deeper replies are dropped after parsing).
+    If spill_folder is set, a thread larger than SPILL_COMMENTS is written to
+    a file there and a {"file", "count"} reference is returned instead of
+    nested dicts (see comment_tree.CommentBuffer).
+    If an expansion budget left 'more' stubs unexpanded, post_id is added to
+    the `truncated` set (if given), so the partial tree can be marked.
+    Returns list of nested comment dicts, or None if the fetch failed.
     """
-    comments_list = []
     try:
         submission = reddit.submission(id=post_id)
-        
-        # This line expands the "MoreComments" objects. 
-        # limit=0 removes all MoreComments (fetches everything), but can be slow.
-        # limit=None fetches all.
-        # For performance, we might want to set a threshold or leave some unexpanded.
-        # Let's try to get a reasonable amount.
-        submission.comments.replace_more(limit=None)
-        
-        def parse_comment(comment):
-            if isinstance(comment, MoreComments):
-                return None
-                
-            c_data = {
-                "author": str(comment.author) if comment.author else "[deleted]",
-                "content": comment.body,
-                "created_utc": comment.created_utc,
-                "score": comment.score,
-                "replies": []
-            }
-            
-            for reply in comment.replies:
-                r = parse_comment(reply)
-                if r:
-                    c_data["replies"].append(r)
-            return c_data
-
-        for top_level_comment in submission.comments:
-            parsed = parse_comment(top_level_comment)
-            if parsed:
-                comments_list.append(parsed)
-                
+        if profile:
+            if profile.sort:
+                submission.comment_sort = profile.sort
+            if profile.limit:
+                submission.comment_limit = profile.limit
+            if not profile.expand_more:
+                post_budget = 0
+        left = expand_comments(submission, post_budget, run_budget)
+        # A profile that skips expansion asks for a partial tree; only budget cuts are marked
+        if left and truncated is not None and (profile is None or profile.expand_more):
+            truncated.add(post_id)
+        start = time.perf_counter()
+        records = parse_forest(submission.comments)
+        if profile and profile.depth:
+            records = [record for record in records if record.depth < profile.depth]
+        buffer = CommentBuffer(post_id, spill_folder, fields=profile.comment_fields if profile else None)
+        buffer.extend(records)
+        comments = buffer.result()
+        registry.inc("comment_parse_seconds_total", time.perf_counter() - start)
+        return comments
     except Exception as e:
         logging.error(f"Error fetching comments for {post_id}: {e}")
-        
-    return comments_list
-
-def fetch_comments_multithreaded(reddit, posts):
-    """
-    Fetch comments for all posts.
-    Note: PRAW is not thread-safe if sharing the same session aggressively in complex ways,
-    but read-only access is often fine. However, to be safe and simple, 
-    we will iterate sequentially or use a simple loop. 
-    Given the API limits and rate limits, sequential is safer to avoid 429s.
-    """
-    results = {}
-    total = len(posts)
-    
-    for i, post in enumerate(posts):
-        post_id = post["id"]
-        if i % 10 == 0:
-            logging.info(f"Fetching comments for post {i+1}/{total}...")
-            
-        comments = fetch_comments_for_post(reddit, post_id)
-        results[post_id] = comments
-        
-    return results
+        return None
@@ -2,48 +2,111 @@
 import time
 import logging
 from datetime import datetime
+from client_pool import ClientPool
 
-def fetch_posts(reddit, subreddit_name, start_year):
+PAGE_SIZE = 100              # Posts per listing request (Reddit's maximum)
+
+def post_record(submission):
+    return {
+        "id": submission.id,
+        "title": submission.title,
+        "content": submission.selftext,
+        "author": str(submission.author) if submission.author else "[deleted]",
+        "created_utc": submission.created_utc,
+        "score": submission.score,
+        "url": submission.url,
+        "num_comments": submission.num_comments
+    }
+
+def iter_posts(pool, subreddit_name, start_year, checkpoint=None, since=None):
     """
-    Fetch posts from subreddit starting from start_year using PRAW.
-    Returns a list of post dicts with metadata.
+    Yield posts from subreddit starting from start_year using PRAW, page by
+    page as they are listed. Every page is one request made with a client
+    leased from the ClientPool, so listing never holds a client while the
+    consumer is busy.
+    If a checkpoint is given, every page is journaled and a resumed run
+    first yields the journaled posts, then continues after the last one.
+    If since (a {"id", "created_utc"} high-water mark) is given, paging stops
+    as soon as the listing reaches that post, so only newer posts are fetched.
     Note: Reddit API limits listing to ~1000 items.
     """
-    subreddit = reddit.subreddit(subreddit_name)
-    posts = []
+    if checkpoint and checkpoint.posts_done:
+        logging.info(f"Post listing already complete in checkpoint ({len(checkpoint.posts)} posts).")
+        yield from list(checkpoint.posts)
+        return
+
+    resumed = list(checkpoint.posts) if checkpoint else []
+    after = checkpoint.after if checkpoint else None
+    if resumed:
+        logging.info(f"Resuming post listing after {after} ({len(resumed)} posts already fetched)...")
+    yield from resumed
+    count = len(resumed)
+    last_created = resumed[-1]["created_utc"] if resumed else None
     
     # Create timestamp for Jan 1st of start_year
     cutoff_timestamp = int(time.mktime(time.strptime(f"01-01-{start_year}", "%d-%m-%Y")))
     
     logging.info(f"Fetching posts from r/{subreddit_name} via PRAW (Newest first)...")
     
-    try:
-        # Fetch new posts. Limit=None fetches as many as possible (approx 1000)
-        for submission in subreddit.new(limit=None):
+    reached_end = False
+    reached_known = False
+    while not reached_end:
+        params = {"after": after} if after else {}
+        try:
+            with pool.lease() as client:
+                submissions = list(client.reddit.subreddit(subreddit_name).new(limit=PAGE_SIZE, params=params))
+        except Exception as e:
+            # A listing cut short must not count as complete: the run fails and keeps its checkpoint
+            raise RuntimeError(f"Listing of r/{subreddit_name} failed after {count} posts: {e}") from e
+
+        if len(submissions) < PAGE_SIZE:
+            reached_end = True
+        page = []
+        for submission in submissions:
             if submission.created_utc < cutoff_timestamp:
                 logging.info(f"Reached posts from {datetime.fromtimestamp(submission.created_utc).year}. Stopping.")
+                reached_end = True
+                break
+
+            if since and (submission.id == since["id"] or submission.created_utc < since["created_utc"]):
+                logging.info(f"Reached last seen post {since['id']}. Stopping.")
+                reached_end = reached_known = True
                 break
             
-            posts.append({
-                "id": submission.id,
-                "title": submission.title,
-                "content": submission.selftext,
-                "author": str(submission.author) if submission.author else "[deleted]",
-                "created_utc": submission.created_utc,
-                "score": submission.score,
-                "url": submission.url,
-                "num_comments": submission.num_comments
-            })
-            
-            if len(posts) % 100 == 0:
-                logging.info(f"Fetched {len(posts)} posts so far...")
-                
-    except Exception as e:
-        logging.error(f"Error fetching posts: {e}")
+            page.append(post_record(submission))
+            after = submission.fullname
+
+        if checkpoint:
+            checkpoint.record_posts(page, after)
+            if reached_end:
+                # Journaled before the last page is handed on: the consumer may not ask
+                # for more until its backlog drains, and a resume must not re-list
+                checkpoint.record_posts_done()
+        yield from page
+        count += len(page)
+        if page:
+            last_created = page[-1]["created_utc"]
+            logging.info(f"Fetched {count} posts so far...")
 
     # Check if we reached the start year
-    if posts and posts[-1]["created_utc"] >= cutoff_timestamp:
+    if count and not reached_known and last_created >= cutoff_timestamp:
          print(f"WARNING: r/{subreddit_name} has more than 1000 posts since {start_year}. Script will NOT fetch all of them due to Reddit API limits.")
          logging.warning(f"r/{subreddit_name} has more than 1000 posts since {start_year}. Script will NOT fetch all of them due to Reddit API limits.")
 
-    return posts
+def fetch_posts(reddit, subreddit_name, start_year, checkpoint=None, since=None):
+    """
+    Fetch posts from subreddit starting from start_year using PRAW.
+    Returns a list of post dicts with metadata (see iter_posts).
+    """
+    pool = ClientPool.single(reddit)
+    return list(iter_posts(pool, subreddit_name, start_year, checkpoint, since))
+
+def fetch_subscribers(reddit, subreddit_name):
+    """
+    Return the subreddit's subscriber count (0 if unavailable).
+    """
+    try:
+        return reddit.subreddit(subreddit_name).subscribers or 0
+    except Exception as e:
+        logging.warning(f"Could not read subscribers for r/{subreddit_name}: {e}")
+        return 0
@@ -1,13 +1,340 @@
 # master.py
 import os
 import json
+import time
 import logging
 import praw
+import prawcore
+from prawcore.rate_limit import RateLimiter
 from datetime import datetime
-from fetch_posts import fetch_posts
-from fetch_comments import fetch_comments_multithreaded
-from clean_json import combine_posts_comments, save_chunks
-from utils import setup_logging, safe_sleep, load_json, save_json
+from fetch_posts import iter_posts
+from discovery import iter_discovered_posts
+from fetch_comments import fetch_comments_for_post, count_request, ExpansionBudget, MAX_WORKERS, MORE_BUDGET_PER_POST, MORE_BUDGET_PER_RUN
+from clean_json import reusable_comments, save_reused, save_unlisted, write_unlisted, remove_chunk_set, open_chunk_writer
+from reader import ChunkReader
+from comment_tree import saved_comments
+from utils import setup_logging, safe_sleep, load_json, save_json, done_comments, Checkpoint, update_high_water_mark, TokenBucket
+from pipeline import run_pipeline
+from profiles import get_profile
+from columnar import ColumnarWriter, FORMATS
+from sqlite_store import SQLiteStore
+from client_pool import ClientPool, PooledClient
+from dedup import SignatureIndex, Deduplicator, THRESHOLD
+from metrics import registry, Metrics, using, flushing, profiling, endpoint_type
+
+DEFAULT_OPTIONS = {
+    "run_mode": "full",          # full / incremental / refresh
+    "refresh_min_age_days": None,  # refresh: posts younger than this are always re-fetched (their comments still change)
+    "crawl_profile": "full",     # full / top (top comments only, 2 levels) / titles (no comments, post metadata only); see profiles.py
+    "discovery": "new",          # new (the /new listing, ~1000 posts max) / fanout (every listing and search at once, deduplicated)
+    "output_format": "jsonl",    # jsonl / parquet / arrow (columnar tables next to the .jsonl chunks; needs pyarrow) / sqlite (instead of chunks)
+    "client_id": "",             # Leave blank to use praw.ini or env vars
+    "client_secret": "",
+    "user_agent": "script:my_scraper:v1.0 (by /u/unknown)",
+    "workers": MAX_WORKERS,      # Comment workers for a single app (each with its own PRAW client)
+    "more_budget_per_post": MORE_BUDGET_PER_POST,  # Cap on "load more comments" expansions per post; None = the full tree
+    "app_requests_per_minute": 100,  # Request budget of one app, shared by all of its workers' clients (Reddit's OAuth limit)
+    "credentials_file": None,    # JSON list of {client_id, client_secret, ...}: one pooled client per app
+    "praw_sites": [],            # Or praw.ini section names: one pooled client per section
+    "output_root": None,         # Folder that holds {subreddit}_data; defaults to the current directory
+    "metrics_format": "prom",    # prom (Prometheus text) / json / off: {subreddit}_metrics file, rewritten during the run
+    "profile": "off",            # off / cpu (cProfile) / memory (tracemalloc) / both: reports written to the output folder
+    "dedup": "off",              # off / mark / remove near-duplicate posts and comments (needs numpy); see dedup.py
+    "dedup_threshold": THRESHOLD # Estimated Jaccard similarity at which a text counts as a near-duplicate
+}
+
+class TimedRateLimiter(RateLimiter):
+    """
+    prawcore RateLimiter whose sleeps (taken when a client's x-ratelimit
+    headers say its window is spent) are counted in
+    rate_limit_wait_seconds_total, along with the TokenBucket waits.
+    """
+    def delay(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().delay(*args, **kwargs)
+        finally:
+            registry.inc("rate_limit_wait_seconds_total", time.perf_counter() - start)
+
+def time_rate_limit_waits(reddit):
+    """
+    Give the prawcore sessions of a PRAW client a TimedRateLimiter. PRAW
+    builds its sessions itself, so their limiters are swapped afterwards,
+    keeping their state; a client without them is left as it is.
+    """
+    for attribute in ("_read_only_core", "_authorized_core"):
+        session = getattr(reddit, attribute, None)
+        limiter = getattr(session, "_rate_limiter", None)
+        if isinstance(limiter, RateLimiter) and not isinstance(limiter, TimedRateLimiter):
+            timed = TimedRateLimiter.__new__(TimedRateLimiter)
+            timed.__dict__.update(limiter.__dict__)
+            session._rate_limiter = timed
+
+class RateLimitedRequestor(prawcore.Requestor):
+    """
+    prawcore requestor that takes a token from a shared TokenBucket (if any)
+    before every HTTP request, so any number of PRAW clients stay under one
+    budget. app_limiter is the bucket of the client's app, shared by every
+    client built from the same credentials. It also records each request's latency, status and size in the
+    metrics registry. Requests are also counted per thread for the
+    expansion budget (see fetch_comments.count_request).
+    """
+    def __init__(self, *args, limiter=None, app_limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiters = [bucket for bucket in (app_limiter, limiter) if bucket]
+
+    def request(self, *args, **kwargs):
+        for bucket in self.limiters:
+            bucket.acquire()
+        count_request()
+        url = kwargs.get("url") or (args[1] if len(args) > 1 else "")
+        endpoint = endpoint_type(url)
+        start = time.perf_counter()
+        try:
+            response = super().request(*args, **kwargs)
+        except prawcore.RequestException:
+            registry.inc("requests_total", endpoint=endpoint, status="error")
+            raise
+        registry.observe("request_seconds", time.perf_counter() - start, endpoint=endpoint)
+        registry.inc("requests_total", endpoint=endpoint, status=response.status_code)
+        registry.inc("decoded_bytes_total", len(response.content), endpoint=endpoint)
+        return response
+
+def requestor_kwargs(limiter=None, app_limiter=None):
+    return {"requestor_class": RateLimitedRequestor, "requestor_kwargs": {"limiter": limiter, "app_limiter": app_limiter}}
+
+def app_bucket(options):
+    """
+    A TokenBucket holding the request budget of the options' app.
+    """
+    return TokenBucket(options["app_requests_per_minute"] / 60.0)
+
+def reddit_factory(options, limiter=None, app_limiter=None):
+    """
+    Return a function that builds a new PRAW client from the job options.
+    All clients it builds use the same app, so they share one TokenBucket of
+    app_requests_per_minute: prawcore only paces each client on its own.
+    Pass app_limiter to share that budget with clients built elsewhere
+    (e.g. the other jobs of a batch); by default the factory makes its own.
+    """
+    app_limiter = app_limiter or app_bucket(options)
+
+    def make_reddit():
+        kwargs = dict(requestor_kwargs(limiter, app_limiter), user_agent=options["user_agent"])
+        if options["client_id"] and options["client_secret"]:
+            return praw.Reddit(
+                client_id=options["client_id"],
+                client_secret=options["client_secret"],
+                **kwargs
+            )
+        # Fallback to praw.ini or env vars if empty
+        return praw.Reddit(**kwargs)
+    return make_reddit
+
+def build_client_pool(options, limiter=None, app_limiter=None):
+    """
+    One client per registered app if a credential pool is configured (plus
+    one for client_id / client_secret, if those are set too), otherwise
+    `workers` clients of the single app in the options, which share its
+    request budget (app_limiter, see reddit_factory).
+    """
+    if options["credentials_file"] or options["praw_sites"]:
+        if options["credentials_file"]:
+            pool = ClientPool.from_config(options["credentials_file"], options["user_agent"], **requestor_kwargs(limiter))
+        else:
+            pool = ClientPool.from_praw_ini(options["praw_sites"], user_agent=options["user_agent"], **requestor_kwargs(limiter))
+        if options["client_id"] and options["client_secret"]:
+            # The pool holds the extra apps; the one in the options is used as well
+            pool.clients.append(PooledClient("default", reddit_factory(options, limiter, app_limiter)()))
+    else:
+        pool = ClientPool.from_factory(reddit_factory(options, limiter, app_limiter), options["workers"])
+    for client in pool.clients:
+        time_rate_limit_waits(client.reddit)
+    return pool
+
+def get_output_folder(subreddit, output_root=None):
+    return os.path.join(output_root or os.getcwd(), f"{subreddit}_data")
+
+def load_state(output_folder, subreddit, store=None):
+    """
+    The run state of a subreddit (newest, last_run, last_run_posts): kept in
+    its SQLite store for sqlite output, otherwise in {subreddit}_state.json.
+    """
+    if store:
+        return store.load_state()
+    return load_json(os.path.join(output_folder, f"{subreddit}_state.json")) or {}
+
+def run_job(subreddit, start_year, options=None, limiter=None, app_limiter=None):
+    """
+    Crawl one subreddit without any prompts.
+    options override DEFAULT_OPTIONS; limiter is an optional TokenBucket
+    shared with other jobs, and app_limiter the budget of the options' app
+    when other jobs use the same app (see reddit_factory). Returns a summary dict.
+    While the job runs, the process-wide metrics (request latency per
+    endpoint, rate-limit waits, bytes, parse/serialize time, queue depths)
+    are flushed to {subreddit}_metrics.prom or .json in the output folder.
+    """
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    output_folder = get_output_folder(subreddit, options["output_root"])
+    os.makedirs(output_folder, exist_ok=True)
+    metrics_file = None
+    if options["metrics_format"] != "off":
+        metrics_file = os.path.join(output_folder, f"{subreddit}_metrics.{options['metrics_format']}")
+    # A registry of its own, so jobs run side by side by batch.py do not mix their metrics
+    with using(Metrics()), flushing(metrics_file), profiling(output_folder, subreddit, options["profile"]):
+        return _run_job(subreddit, start_year, options, limiter, app_limiter, output_folder)
+
+def _run_job(subreddit, start_year, options, limiter, app_limiter, output_folder):
+    run_mode = options["run_mode"]
+    profile = get_profile(options["crawl_profile"])
+    pool = build_client_pool(options, limiter, app_limiter)
+    logging.info(f"Using {len(pool)} PRAW client(s).")
+
+    checkpoint = Checkpoint(os.path.join(output_folder, f"{subreddit}_checkpoint.jsonl"))
+    if checkpoint.resumed:
+        print(f"Resuming previous run ({len(checkpoint.posts)} posts, {len(checkpoint.comments)} comment trees already fetched).")
+
+    state_file = os.path.join(output_folder, f"{subreddit}_state.json")
+    store = SQLiteStore(os.path.join(output_folder, f"{subreddit}.db")) if options["output_format"] == "sqlite" else None
+    state = load_state(output_folder, subreddit, store)
+    since = state.get("newest") if run_mode == "incremental" else None
+    if since:
+        logging.info(f"Incremental run: fetching posts newer than {since['id']}...")
+
+    # -----------------------------
+    # Posts to crawl
+    # -----------------------------
+    # Posts stream straight from the listing into the comment fetchers, except in
+    # refresh mode, which needs the whole listing to decide which trees to reuse.
+    master_file = os.path.join(output_folder, f"{subreddit}_master.json")
+    logging.info(f"Fetching posts from r/{subreddit} starting {start_year}...")
+    reuse = set()
+    reused_master = None
+    unlisted_file = None
+    if options["discovery"] == "fanout":
+        post_source = iter_discovered_posts(pool, subreddit, start_year, checkpoint, since)
+    else:
+        post_source = iter_posts(pool, subreddit, start_year, checkpoint, since)
+    if run_mode == "refresh":
+        post_source = list(post_source)
+        min_age_days = options["refresh_min_age_days"]
+        if store:
+            reuse = store.reusable_comments(post_source, min_age_days)
+        else:
+            # The chunk set is rebuilt from the listing: stored posts that left it are set aside and written back,
+            # and the posts whose trees are reused are copied aside, to be read back one at a time
+            unlisted_file = os.path.join(output_folder, f"{subreddit}_unlisted.jsonl")
+            reused_master = os.path.join(output_folder, f"{subreddit}_reused_master.json")
+            if "unlisted" not in checkpoint.meta:
+                checkpoint.record_meta("unlisted", save_unlisted(master_file, post_source, unlisted_file))
+            if "reused" not in checkpoint.meta:
+                reusable = reusable_comments(master_file, post_source, min_age_days)
+                checkpoint.record_meta("reused", save_reused(master_file, reusable, reused_master))
+            reader = ChunkReader(reused_master)
+            reuse = set(reader.index.posts)
+            logging.info(f"Refresh: keeping {checkpoint.meta['unlisted']} stored posts that are no longer listed.")
+        logging.info(f"Refresh: reusing stored comments for {len(reuse)}/{len(post_source)} unchanged posts.")
+    done = done_comments(checkpoint)
+
+    # -----------------------------
+    # Fetch comments + save chunks as posts finish
+    # -----------------------------
+    run_budget = ExpansionBudget(MORE_BUDGET_PER_RUN)
+    truncated = set()
+
+    # Threads too big to hold in memory are written here and referenced from their post
+    spill_folder = os.path.join(output_folder, f"{subreddit}_threads")
+
+    def comments_for(post):
+        if post["id"] in done:
+            # Read back when its post comes up, like reused trees
+            return checkpoint.load_comments(post["id"])
+        if post["id"] in reuse:
+            # Read when its post comes up, so reused trees are never all in memory at once
+            return store.comments(post["id"], spill_folder) if store else saved_comments(reader.get(post["id"]))
+        if not profile.wants_comments(post):
+            return []
+        # PRAW clients are not thread-safe: each fetch leases its own client
+        with pool.lease() as client:
+            comments = fetch_comments_for_post(client.reddit, post["id"], options["more_budget_per_post"], run_budget, profile,
+                                               spill_folder, truncated)
+            client.record(comments is not None)
+            return comments
+
+    # Near-duplicates are checked against the signatures of every earlier run
+    deduplicator = None
+    if options["dedup"] != "off":
+        index = SignatureIndex(os.path.join(output_folder, f"{subreddit}_signatures.npz"), options["dedup_threshold"])
+        deduplicator = Deduplicator(index, options["dedup"])
+
+    writers = [store] if store else []
+    seen = []
+
+    def write(records):
+        for record in records:
+            for writer in writers:
+                writer.write(record)
+
+    def save(post, comments):
+        failed = comments is None
+        if failed:
+            comments = []  # Not journaled, so a resumed run retries it
+        elif post["id"] not in done and post["id"] not in reuse:
+            checkpoint.record_comments(post["id"], comments)
+        if not writers:
+            writers.append(open_chunk_writer(output_folder, subreddit, append=bool(since), checkpoint=checkpoint))
+            if options["output_format"] in FORMATS:
+                writers.append(ColumnarWriter(output_folder, subreddit, options["output_format"], append=bool(since)))
+        record = profile.project(post, comments)
+        if failed:
+            record["comments_failed"] = True  # Fetched again by the next refresh, never reused
+        elif post["id"] in truncated:
+            record["comments_truncated"] = True  # An expansion budget left part of the thread unfetched
+        # Near-duplicates are checked in batches: add() returns posts once a batch is full
+        write(deduplicator.add(record) if deduplicator else [record])
+        seen.append({"id": post["id"], "created_utc": post["created_utc"]})
+
+    logging.info("Fetching comments...")
+    # One comment worker per pooled client
+    try:
+        run_pipeline(post_source, comments_for, save, workers=len(pool))
+        if deduplicator:
+            write(deduplicator.flush())
+        if unlisted_file and writers:
+            write_unlisted(unlisted_file, writers)
+        if store:
+            store.flush()
+            store.update_high_water_mark(seen)
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        if reused_master:
+            reader.close()
+        raise
+    for writer in writers:
+        writer.close()
+    if unlisted_file and os.path.exists(unlisted_file):
+        os.remove(unlisted_file)
+    if reused_master:
+        reader.close()
+        remove_chunk_set(reused_master)
+    if deduplicator:
+        deduplicator.index.save()
+        deduplicator.report()
+    logging.info(f"Fetched {len(seen)} posts with comments")
+
+    if not seen:
+        print("No new posts found. Exiting." if since else "No posts found. Exiting.")
+        checkpoint.remove()
+        return {"subreddit": subreddit, "posts": 0, "master_file": None}
+
+    if store:
+        master_file = store.filename
+    else:
+        update_high_water_mark(state_file, seen)
+    checkpoint.remove()
+    logging.info(f"Data saved. Master JSON: {master_file}")
+    return {"subreddit": subreddit, "posts": len(seen), "master_file": master_file}
 
 def main():
     # -----------------------------
@@ -16,28 +343,32 @@ def main():
     print("--- Reddit Scraper (PRAW) ---")
     subreddit = input("Enter subreddit name (without r/): ").strip()
     start_year = int(input("Enter starting year (e.g., 2020): ").strip())
+    run_mode = input("Run mode [full/incremental/refresh] (default: full): ").strip().lower()
+    if run_mode not in ("full", "incremental", "refresh"):
+        run_mode = "full"
+    output_format = input("Output format [jsonl/parquet/arrow/sqlite] (default: jsonl): ").strip().lower()
+    if output_format not in ("jsonl", "parquet", "arrow", "sqlite"):
+        output_format = "jsonl"
     
     print("\n--- API Credentials ---")
     print("If you have a praw.ini file, you can leave these blank.")
     client_id = input("Client ID: ").strip()
     client_secret = input("Client Secret: ").strip()
     user_agent = input("User Agent (default: 'script:my_scraper:v1.0'): ").strip()
+    pool_source = input("Extra apps: credentials JSON file or comma-separated praw.ini sections (blank: none): ").strip()
     
-    if not user_agent:
-        user_agent = "script:my_scraper:v1.0 (by /u/unknown)"
+    options = dict(DEFAULT_OPTIONS, run_mode=run_mode, output_format=output_format, client_id=client_id, client_secret=client_secret)
+    if user_agent:
+        options["user_agent"] = user_agent
+    if pool_source.endswith(".json"):
+        options["credentials_file"] = pool_source
+    elif pool_source:
+        options["praw_sites"] = [site.strip() for site in pool_source.split(",") if site.strip()]
 
     # -----------------------------
     # Setup PRAW
     # -----------------------------
-    if client_id and client_secret:
-        reddit = praw.Reddit(
-            client_id=client_id,
-            client_secret=client_secret,
-            user_agent=user_agent
-        )
-    else:
-        # Fallback to praw.ini or env vars if empty
-        reddit = praw.Reddit(user_agent=user_agent)
+    reddit = reddit_factory(options)()
 
     # Verify credentials
     try:
@@ -46,43 +377,15 @@ def main():
         print(f"Warning: Authentication issue: {e}")
         print("Proceeding in read-only mode (if possible)...")
 
-    output_folder = os.path.join(os.getcwd(), f"{subreddit}_data")
+    output_folder = get_output_folder(subreddit)
     os.makedirs(output_folder, exist_ok=True)
 
     log_file = os.path.join(output_folder, f"{subreddit}.log")
     setup_logging(log_file)
 
-    # -----------------------------
-    # Fetch posts
-    # -----------------------------
-    logging.info(f"Fetching posts from r/{subreddit} starting {start_year}...")
-    posts = fetch_posts(reddit, subreddit, start_year)
-    logging.info(f"Fetched {len(posts)} posts")
-
-    if not posts:
-        print("No posts found. Exiting.")
-        return
-
-    # -----------------------------
-    # Fetch comments
-    # -----------------------------
-    logging.info("Fetching comments...")
-    # Note: We renamed the function in fetch_comments.py but kept the import name for compatibility
-    # logic inside fetch_comments_multithreaded was updated to be sequential/PRAW-safe
-    comments_dict = fetch_comments_multithreaded(reddit, posts)
-    logging.info("Comments fetching complete.")
-
-    # -----------------------------
-    # Combine posts + comments
-    # -----------------------------
-    combined = combine_posts_comments(posts, comments_dict)
-
-    # -----------------------------
-    # Save chunks + master JSON
-    # -----------------------------
-    master_file = save_chunks(combined, output_folder, subreddit)
-    logging.info(f"Data saved. Master JSON: {master_file}")
-    print(f"Done! Data saved to {output_folder}")
+    summary = run_job(subreddit, start_year, options)
+    if summary["master_file"]:
+        print(f"Done! Data saved to {output_folder}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,288 @@
+# postprocess.py
+import os
+import re
+import gzip
+import html
+import json
+import time
+import logging
+import argparse
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from utils import setup_logging, load_json, save_json, iter_json_array, parse_chunk_line
+from columnar import iter_comment_rows
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+TASK_MB = 16                 # Bytes of NDJSON chunk handed to one worker task (one output shard each)
+REMOVED = ("[deleted]", "[removed]")
+MIN_LENGTH = 1               # Characters a comment needs after normalization
+MIN_MESSAGES = 2             # Messages a record needs (the post plus at least one reply)
+SHARD_PATTERN = "part-{:05d}.jsonl.gz"
+COMPRESS_LEVEL = 6
+
+ZERO_WIDTH = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+SPACES = re.compile(r"[ \t\f\v\u00a0]+")
+BLANK_LINES = re.compile(r"\n{3,}")
+
+class Filters:
+    """
+    What a comment or post needs to make it into the training records.
+    Every bound is inclusive and None leaves it open. A comment that fails is
+    dropped together with its replies, since they lose their context.
+    """
+    def __init__(self, min_score=None, min_post_score=None, min_length=MIN_LENGTH,
+                 max_length=None, min_messages=MIN_MESSAGES):
+        self.min_score = min_score
+        self.min_post_score = min_post_score
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_messages = min_messages
+
+    def keeps_post(self, post):
+        return self.min_post_score is None or (post.get("score") or 0) >= self.min_post_score
+
+    def keeps_comment(self, text, score):
+        if not text:
+            return False
+        if self.min_score is not None and (score or 0) < self.min_score:
+            return False
+        if self.min_length is not None and len(text) < self.min_length:
+            return False
+        return self.max_length is None or len(text) <= self.max_length
+
+    def to_dict(self):
+        return dict(vars(self))
+
+def normalize_text(text):
+    """
+    Text as it goes into a record: HTML entities decoded, NFKC-normalized,
+    zero-width characters removed, runs of spaces collapsed, at most one
+    blank line in a row, trimmed. Deleted or removed text becomes "".
+    """
+    if not text or text.strip() in REMOVED:
+        return ""
+    text = unicodedata.normalize("NFKC", html.unescape(text))
+    text = ZERO_WIDTH.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+    text = "\n".join(SPACES.sub(" ", line).strip() for line in text.split("\n"))
+    return BLANK_LINES.sub("\n\n", text).strip()
+
+def post_message(post):
+    title = normalize_text(post.get("title"))
+    content = normalize_text(post.get("content"))
+    return {
+        "id": post["id"],
+        "author": None if post.get("author") in REMOVED else post.get("author"),
+        "text": f"{title}\n\n{content}" if title and content else title or content,
+        "score": post.get("score")
+    }
+
+def comment_messages(post, filters, stats):
+    """
+    The kept comments of a post as (message, parent_id) pairs in depth-first
+    order. Works on flat rows (columnar.iter_comment_rows), so threads
+    spilled to disk are read from their comments_file like any other.
+    """
+    children = defaultdict(list)
+    ids = set()
+    for row in iter_comment_rows(post):
+        ids.add(row["id"])
+        children[row["parent_id"]].append(row)
+    roots = [row for parent_id, rows in children.items() if parent_id not in ids for row in rows]
+
+    stack = list(reversed(roots))
+    while stack:
+        row = stack.pop()
+        text = normalize_text(row.get("content"))
+        if not filters.keeps_comment(text, row.get("score")):
+            stats["dropped_comments"] += 1 + count_replies(row["id"], children)
+            continue
+        author = row.get("author")
+        message = {"id": row["id"], "author": None if author in REMOVED else author, "text": text, "score": row.get("score")}
+        yield message, row["parent_id"]
+        stack.extend(reversed(children.pop(row["id"], [])))
+
+def count_replies(comment_id, children):
+    count = 0
+    stack = [comment_id]
+    while stack:
+        replies = children.pop(stack.pop(), [])
+        count += len(replies)
+        stack.extend(reply["id"] for reply in replies)
+    return count
+
+def conversation_records(post, filters, stats):
+    """
+    One record per post: the post followed by every kept comment in
+    depth-first order, each with the index of the message it replies to.
+    """
+    messages = [dict(post_message(post), reply_to=None)]
+    position = {post["id"]: 0}
+    for message, parent_id in comment_messages(post, filters, stats):
+        position[message["id"]] = len(messages)
+        messages.append(dict(message, reply_to=position.get(parent_id, 0)))
+    if len(messages) >= filters.min_messages:
+        yield {"id": post["id"], "post_id": post["id"], "created_utc": post.get("created_utc"), "messages": messages}
+
+def path_records(post, filters, stats):
+    """
+    One record per root-to-leaf path through the kept comments: the post,
+    then each reply down to a comment with no kept replies.
+    """
+    # Only parent pointers are kept; each path is built once, for its leaf,
+    # so deep reply chains cost O(depth) per path instead of per comment
+    found = {post["id"]: post_message(post)}
+    parents = {}
+    for message, parent_id in comment_messages(post, filters, stats):
+        parents[message["id"]] = parent_id if parent_id in found else post["id"]
+        found[message["id"]] = message
+    replied_to = set(parents.values())
+    leaves = [comment_id for comment_id in parents if comment_id not in replied_to] or [post["id"]]
+    for leaf in leaves:
+        messages = []
+        message_id = leaf
+        while message_id is not None:
+            messages.append(found[message_id])
+            message_id = parents.get(message_id)
+        messages.reverse()
+        if len(messages) >= filters.min_messages:
+            yield {"id": f"{post['id']}:{leaf}", "post_id": post["id"], "created_utc": post.get("created_utc"), "messages": messages}
+
+RECORD_BUILDERS = {
+    "conversations": conversation_records,
+    "paths": path_records
+}
+
+# -----------------------------
+# Tasks (run in the worker processes)
+# -----------------------------
+def plan_tasks(master_file, task_mb=TASK_MB):
+    """
+    Split a chunk set into (chunk, start, end) byte ranges of about task_mb
+    each. Older JSON array chunks cannot be split and are one task (end=None).
+    The task order is the chunk order, which fixes the output order.
+    """
+    master = load_json(master_file) or {}
+    step = max(1, int(task_mb * 1024 * 1024))
+    tasks = []
+    for chunk in master.get("chunks", []):
+        if not os.path.exists(chunk):
+            logging.warning(f"Chunk listed in {master_file} is missing: {chunk}")
+            continue
+        if not chunk.endswith(".jsonl"):
+            tasks.append((chunk, 0, None))
+            continue
+        size = os.path.getsize(chunk)
+        tasks.extend((chunk, start, min(start + step, size)) for start in range(0, size, step))
+    return tasks
+
+def iter_task_posts(chunk, start, end):
+    """
+    The posts whose lines begin in [start, end) of an NDJSON chunk, so
+    adjacent ranges split the chunk without overlap; or every post of a
+    JSON array chunk when end is None.
+    """
+    if end is None:
+        yield from iter_json_array(chunk)
+        return
+    with open(chunk, "rb") as f:
+        if start > 0:
+            # Finish the line that straddles start; it belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            post = parse_chunk_line(line, chunk) if line.strip() else None
+            if post is not None:
+                yield post
+
+def process_task(task):
+    """
+    Turn one range of a chunk into a gzip shard of records. Runs in a worker
+    process; the shard is written under a .tmp name and renamed when done.
+    gzip's header timestamp is zeroed so identical input gives identical bytes.
+    """
+    number, chunk, start, end, output_folder, mode, filters = task
+    build = RECORD_BUILDERS[mode]
+    stats = {"posts": 0, "records": 0, "dropped_posts": 0, "dropped_comments": 0}
+    filename = os.path.join(output_folder, SHARD_PATTERN.format(number))
+    tmp_file = filename + ".tmp"
+    with open(tmp_file, "wb") as raw, \
+         gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0, compresslevel=COMPRESS_LEVEL) as f:
+        for post in iter_task_posts(chunk, start, end):
+            stats["posts"] += 1
+            if not filters.keeps_post(post):
+                stats["dropped_posts"] += 1
+                continue
+            for record in build(post, filters, stats):
+                f.write((json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+                stats["records"] += 1
+    os.replace(tmp_file, filename)
+    return dict(stats, file=filename)
+
+# -----------------------------
+# Driver
+# -----------------------------
+def postprocess(master_file, output_folder, mode="paths", filters=None, workers=None, task_mb=TASK_MB):
+    """
+    Build training records from a chunk set across a process pool, one
+    gzip JSONL shard per task. Shards are numbered in input order and each
+    keeps its posts in chunk order, so reading part-00000, part-00001, ...
+    in order gives the same records on every run, whatever the worker count.
+    Writes {output_folder}/manifest.json and returns it.
+    """
+    if mode not in RECORD_BUILDERS:
+        raise ValueError(f"Unknown record mode {mode!r}; expected one of {', '.join(RECORD_BUILDERS)}")
+    filters = filters or Filters()
+    os.makedirs(output_folder, exist_ok=True)
+    # Shards from an earlier run with more tasks would otherwise be left behind
+    for name in os.listdir(output_folder):
+        if name.startswith("part-") and (name.endswith(".jsonl.gz") or name.endswith(".tmp")):
+            os.remove(os.path.join(output_folder, name))
+
+    tasks = [(number, chunk, start, end, output_folder, mode, filters)
+             for number, (chunk, start, end) in enumerate(plan_tasks(master_file, task_mb))]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    logging.info(f"Post-processing {master_file}: {len(tasks)} tasks on {workers} processes...")
+    start_time = time.time()
+    shards = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for stats in executor.map(process_task, tasks):
+            shards.append(dict(stats, file=os.path.basename(stats["file"])))
+            logging.info(f"  {shards[-1]['file']}: {stats['records']} records from {stats['posts']} posts")
+
+    totals = {key: sum(shard[key] for shard in shards) for key in ("posts", "records", "dropped_posts", "dropped_comments")}
+    manifest = dict(totals, source=master_file, mode=mode, filters=filters.to_dict(), shards=shards)
+    save_json(manifest, os.path.join(output_folder, "manifest.json"))
+    logging.info(f"Wrote {totals['records']} {mode} records from {totals['posts']} posts "
+                 f"to {len(shards)} shards in {time.time() - start_time:.1f}s.")
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Turn a scraped chunk set into sharded, gzip-compressed training JSONL.")
+    parser.add_argument("master_file", help="{subreddit}_master.json")
+    parser.add_argument("--output", help="Output folder (default: {subreddit}_training next to the master JSON)")
+    parser.add_argument("--mode", choices=sorted(RECORD_BUILDERS), default="paths",
+                        help="paths: one record per root-to-leaf reply chain; conversations: one record per post")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--min-score", type=int, help="Minimum comment score")
+    parser.add_argument("--min-post-score", type=int, help="Minimum post score")
+    parser.add_argument("--min-length", type=int, default=MIN_LENGTH, help="Minimum comment length in characters")
+    parser.add_argument("--max-length", type=int, help="Maximum comment length in characters")
+    parser.add_argument("--min-messages", type=int, default=MIN_MESSAGES, help="Minimum messages per record, post included")
+    parser.add_argument("--task-mb", type=float, default=TASK_MB, help="Chunk megabytes per task / shard")
+    args = parser.parse_args()
+
+    base = args.master_file[:-len("_master.json")] if args.master_file.endswith("_master.json") else os.path.splitext(args.master_file)[0]
+    output_folder = args.output or base + "_training"
+    os.makedirs(output_folder, exist_ok=True)
+    setup_logging(os.path.join(output_folder, "postprocess.log"))
+    filters = Filters(args.min_score, args.min_post_score, args.min_length, args.max_length, args.min_messages)
+    postprocess(args.master_file, output_folder, args.mode, filters, args.workers, args.task_mb)
+
+if __name__ == "__main__":
+    main()
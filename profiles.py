@@ -0,0 +1,67 @@
+# profiles.py
+from comment_tree import with_comments
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+TOP_COMMENTS = 20            # Comments requested per post by the "top" profile
+TOP_DEPTH = 2                # Reply levels kept by the "top" profile (top-level comments + direct replies)
+
+REQUIRED_POST_FIELDS = ("id", "created_utc")  # Needed for the index, high-water mark and dedup
+TITLE_FIELDS = ("id", "title", "author", "created_utc", "score", "url", "num_comments")
+
+class CrawlProfile:
+    """
+    How much of each post a crawl fetches and keeps.
+    comments=False skips comment requests entirely; limit / depth / sort are
+    sent with the comment request so Reddit returns a smaller tree;
+    expand_more=False leaves 'more' stubs unexpanded (no extra requests).
+    post_fields / comment_fields project the output onto the listed keys
+    (None keeps everything). Posts listed with num_comments == 0 are never
+    fetched, whatever the profile.
+    """
+    def __init__(self, name, post_fields=None, comment_fields=None, comments=True,
+                 limit=None, depth=None, sort=None, expand_more=True):
+        self.name = name
+        self.post_fields = tuple(dict.fromkeys(REQUIRED_POST_FIELDS + tuple(post_fields))) if post_fields else None
+        self.comment_fields = comment_fields
+        self.comments = comments
+        self.limit = limit
+        self.depth = depth
+        self.sort = sort
+        self.expand_more = expand_more
+
+    def wants_comments(self, post):
+        """
+        False if the post's comments should not be requested at all.
+        """
+        return self.comments and post.get("num_comments") != 0
+
+    def comment_params(self):
+        """
+        Query parameters for the comment request ({} = Reddit's defaults).
+        """
+        params = {"limit": self.limit, "depth": self.depth, "sort": self.sort}
+        return {key: value for key, value in params.items() if value is not None}
+
+    def project(self, post, comments):
+        """
+        The output record for a post: its kept fields, plus its comments
+        (or spilled thread file, see comment_tree.with_comments) unless the
+        profile skips them.
+        """
+        if self.post_fields is not None:
+            post = {key: post[key] for key in self.post_fields if key in post}
+        return with_comments(post, comments) if self.comments else dict(post)
+
+PROFILES = {
+    "titles": CrawlProfile("titles", post_fields=TITLE_FIELDS, comments=False),
+    "top": CrawlProfile("top", comment_fields=("id", "author", "content", "score"),
+                        limit=TOP_COMMENTS, depth=TOP_DEPTH, sort="top", expand_more=False),
+    "full": CrawlProfile("full")
+}
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f"Unknown crawl profile {name!r}; expected one of {', '.join(PROFILES)}")
+    return PROFILES[name]
@@ -0,0 +1,285 @@
+# sqlite_store.py
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+import argparse
+from utils import ChunkWriter, iter_saved_posts
+from columnar import iter_comment_rows
+from comment_tree import CommentRecord, CommentBuffer, with_comments
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+BATCH_SIZE = 500             # Posts buffered per transaction
+
+POST_FIELDS = ("created_utc", "score", "num_comments", "author", "title")
+COMMENT_FIELDS = ("parent_id", "depth", "author", "content", "created_utc", "score")
+
+class SQLiteStore:
+    """
+    Posts and comments of one subreddit in a SQLite database ({subreddit}.db),
+    as an alternative to the NDJSON chunks. Posts are keyed by id and
+    comments by (post_id, id), so a re-crawl updates rows in place (score,
+    num_comments, edited text) instead of adding duplicates. Writes are
+    buffered and upserted with executemany, BATCH_SIZE posts per transaction.
+    The database also holds the run state that {subreddit}_state.json holds
+    for chunk output (see load_state / update_high_water_mark).
+    """
+    def __init__(self, filename, batch_size=BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.pending = []
+        self.count = 0
+        self.conn = sqlite3.connect(filename, timeout=60, isolation_level=None)
+        self.thread = threading.get_ident()
+        self.local = threading.local()
+        self.readers = []
+        self.readers_lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS posts (
+                id TEXT PRIMARY KEY,
+                created_utc REAL,
+                score INTEGER,
+                num_comments INTEGER,
+                author TEXT,
+                title TEXT,
+                post TEXT,
+                crawled_at REAL
+            )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS comments (
+                post_id TEXT,
+                id TEXT,
+                position INTEGER,
+                parent_id TEXT,
+                depth INTEGER,
+                author TEXT,
+                content TEXT,
+                created_utc REAL,
+                score INTEGER,
+                PRIMARY KEY (post_id, id)
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS posts_created ON posts (created_utc)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS comments_position ON comments (post_id, position)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+
+    # -------------------------
+    # Writing
+    # -------------------------
+    def write(self, post):
+        self.pending.append(post)
+        self.count += 1
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Upsert every buffered post and its comments in one transaction. A
+        post that comes with its comments replaces its stored thread, so
+        comments deleted on Reddit since the last crawl are dropped too; one
+        whose fetch failed (comments_failed) keeps the stored comments.
+        """
+        if not self.pending:
+            return
+        now = time.time()
+        post_rows = []
+        for post in self.pending:
+            # Comments (inline or in a spilled thread file) go to the comments table
+            fields = {key: value for key, value in post.items() if key not in ("comments", "comments_file", "comments_count")}
+            post_rows.append((post["id"], *(post.get(field) for field in POST_FIELDS),
+                              json.dumps(fields, ensure_ascii=False), now))
+        # A generator, so spilled threads are streamed from disk rather than loaded
+        comment_rows = (
+            (row["post_id"], row["id"], position, *(row.get(field) for field in COMMENT_FIELDS))
+            for post in self.pending
+            for position, row in enumerate(iter_comment_rows(post))
+        )
+        replaced = [(post["id"],) for post in self.pending
+                    if ("comments" in post or post.get("comments_file")) and not post.get("comments_failed")]
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("DELETE FROM comments WHERE post_id = ?", replaced)
+            self.conn.executemany(
+                """INSERT INTO posts (id, created_utc, score, num_comments, author, title, post, crawled_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (id) DO UPDATE SET
+                       score = excluded.score, num_comments = excluded.num_comments, title = excluded.title,
+                       post = excluded.post, crawled_at = excluded.crawled_at""",
+                post_rows
+            )
+            self.conn.executemany(
+                """INSERT INTO comments (post_id, id, position, parent_id, depth, author, content, created_utc, score)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (post_id, id) DO UPDATE SET
+                       position = excluded.position, content = excluded.content, score = excluded.score""",
+                comment_rows
+            )
+        self.pending = []
+
+    def close(self):
+        """
+        Flush, close every connection and fold the WAL back into the
+        database, so no -wal/-shm files are left next to it.
+        """
+        self.flush()
+        self.close_readers()
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.close()
+        logging.info(f"SQLite store saved: {self.filename}")
+
+    def abort(self):
+        """
+        Drop the uncommitted batch; everything flushed before stays stored.
+        """
+        self.pending = []
+        self.close_readers()
+        self.conn.close()
+
+    def close_readers(self):
+        with self.readers_lock:
+            readers, self.readers = self.readers, []
+        for conn in readers:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    # -------------------------
+    # Reading
+    # -------------------------
+    def post_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def reader(self):
+        """
+        A connection for reads on the calling thread. sqlite3 connections
+        cannot be shared between threads, so other threads (the comment
+        fetchers of a refresh run) get one of their own; WAL lets them read
+        while this one writes. They are closed by close() / abort(), from
+        the thread that owns the store, hence check_same_thread=False.
+        """
+        if threading.get_ident() == self.thread:
+            return self.conn
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.filename, timeout=60, check_same_thread=False)
+            with self.readers_lock:
+                self.readers.append(conn)
+        return conn
+
+    def comments(self, post_id, spill_folder=None):
+        """
+        The nested comment tree of one post, as in the chunk files. With
+        spill_folder, a thread too big or too deep to nest is written to a
+        thread file and referenced instead (see comment_tree.CommentBuffer).
+        Safe to call from any thread.
+        """
+        rows = self.reader().execute(
+            f"SELECT id, {', '.join(COMMENT_FIELDS)} FROM comments WHERE post_id = ? ORDER BY position",
+            (post_id,)
+        )
+        buffer = CommentBuffer(post_id, spill_folder)
+        buffer.extend(CommentRecord(*row) for row in rows)
+        return buffer.result()
+
+    def iter_posts(self, spill_folder=None):
+        """
+        Yield every stored post with its comments, newest first.
+        """
+        for post_id, post in self.conn.execute("SELECT id, post FROM posts ORDER BY created_utc DESC"):
+            yield with_comments(json.loads(post), self.comments(post_id, spill_folder))
+
+    def reusable_comments(self, posts, min_age_days=None):
+        """
+        Ids of the posts whose num_comments is unchanged since they were
+        stored, skipping trees that were never fetched and posts younger than
+        min_age_days (see clean_json.reusable_comments). Their trees are read
+        with comments() when needed.
+        """
+        age_cutoff = time.time() - min_age_days * 86400 if min_age_days else None
+        reused = set()
+        for post in posts:
+            if age_cutoff is not None and post["created_utc"] > age_cutoff:
+                continue
+            row = self.conn.execute("SELECT num_comments, post FROM posts WHERE id = ?", (post["id"],)).fetchone()
+            if not row or row[0] != post.get("num_comments") or json.loads(row[1]).get("comments_failed"):
+                continue
+            stored = self.conn.execute("SELECT 1 FROM comments WHERE post_id = ? LIMIT 1", (post["id"],)).fetchone()
+            if stored or not row[0]:
+                reused.add(post["id"])
+        return reused
+
+    # -------------------------
+    # Run state
+    # -------------------------
+    def load_state(self):
+        """
+        The same dict as {subreddit}_state.json: newest, last_run, last_run_posts.
+        """
+        return {key: json.loads(value) for key, value in self.conn.execute("SELECT key, value FROM state")}
+
+    def update_high_water_mark(self, posts):
+        """
+        Record the newest stored post and the size of this run (see utils.update_high_water_mark).
+        """
+        state = {"last_run": int(time.time()), "last_run_posts": len(posts)}
+        row = self.conn.execute("SELECT id, created_utc FROM posts ORDER BY created_utc DESC LIMIT 1").fetchone()
+        if row:
+            state["newest"] = {"id": row[0], "created_utc": row[1]}
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                                  [(key, json.dumps(value)) for key, value in state.items()])
+        return state
+
+    # -------------------------
+    # JSON layout
+    # -------------------------
+    def import_chunks(self, master_file):
+        """
+        Upsert every post of an existing chunk set; overlapping crawls collapse to one row per post.
+        """
+        for post in iter_saved_posts(master_file):
+            self.write(post)
+        self.flush()
+
+    def export(self, output_folder, base_name):
+        """
+        Write the stored posts back out as NDJSON chunks + master JSON. Returns the master file.
+        """
+        master_file = os.path.join(output_folder, f"{base_name}_master.json")
+        with ChunkWriter(output_folder, base_name, master_file) as writer:
+            for post in self.iter_posts(os.path.join(output_folder, f"{base_name}_threads")):
+                writer.write(post)
+        return master_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Import chunk sets into, or export them from, a SQLite store.")
+    parser.add_argument("database", help="{subreddit}.db")
+    parser.add_argument("--import", dest="imports", action="append", default=[], metavar="MASTER_FILE",
+                        help="Upsert the posts of a chunk set (repeatable)")
+    parser.add_argument("--export", metavar="FOLDER", help="Write the stored posts as chunks + master JSON")
+    parser.add_argument("--name", help="Base name of the exported files (default: database name)")
+    args = parser.parse_args()
+
+    with SQLiteStore(args.database) as store:
+        for master_file in args.imports:
+            store.import_chunks(master_file)
+            print(f"Imported {master_file}: {store.post_count()} posts stored.")
+        if args.export:
+            name = args.name or os.path.splitext(os.path.basename(args.database))[0]
+            print(f"Exported to {store.export(args.export, name)}")
+
+if __name__ == "__main__":
+    main()
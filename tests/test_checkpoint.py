@@ -0,0 +1,34 @@
+# test_checkpoint.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import Checkpoint
+
+def test_torn_last_line_is_dropped_on_replay(tmp_path):
+    filename = str(tmp_path / "test_checkpoint.jsonl")
+    checkpoint = Checkpoint(filename)
+    checkpoint.record_posts([{"id": "a"}, {"id": "b"}], "t3_b")
+    checkpoint.record_comments("a", [{"id": "c1", "replies": []}])
+    checkpoint.file.close()
+    good_size = os.path.getsize(filename)
+    with open(filename, "ab") as f:
+        f.write(b'{"event":"comments","id":"b","comm')  # Crash in the middle of a write
+
+    checkpoint = Checkpoint(filename)
+    assert [post["id"] for post in checkpoint.posts] == ["a", "b"]
+    assert checkpoint.after == "t3_b"
+    assert list(checkpoint.comments) == ["a"]
+    assert checkpoint.load_comments("a") == [{"id": "c1", "replies": []}]
+    assert os.path.getsize(filename) == good_size
+
+    # New entries go after the last good line and replay cleanly
+    checkpoint.record_comments("b", [])
+    checkpoint.record_posts_done()
+    checkpoint.file.close()
+    checkpoint = Checkpoint(filename)
+    assert checkpoint.load_comments("a") == [{"id": "c1", "replies": []}]
+    assert checkpoint.load_comments("b") == []
+    assert checkpoint.posts_done
+    checkpoint.remove()
+    assert not os.path.exists(filename)
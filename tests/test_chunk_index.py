@@ -0,0 +1,55 @@
+# test_chunk_index.py
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import utils
+from utils import ChunkWriter, ChunkIndex, index_filename, load_json
+from reader import iter_comments, PostFilter
+
+def post(number):
+    return {"id": f"p{number}", "created_utc": 1700000000 + number, "score": number, "title": "x" * 100}
+
+def check_offsets(index, numbers):
+    assert sorted(index.posts) == sorted(f"p{number}" for number in numbers)
+    for number in numbers:
+        chunk, offset, length = index.posts[f"p{number}"]
+        with open(index.chunks[chunk]["file"], "rb") as f:
+            f.seek(offset)
+            assert json.loads(f.read(length)) == post(number)
+    for stats in index.chunks:
+        assert stats["size"] == os.path.getsize(stats["file"])
+
+def test_offsets_after_rotation_and_append(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CHUNK_SIZE_MB", 500 / (1024 * 1024))  # A new chunk every few posts
+    folder = str(tmp_path)
+    master_file = os.path.join(folder, "test_master.json")
+    with ChunkWriter(folder, "test", master_file) as writer:
+        for number in range(10):
+            writer.write(post(number))
+    index = ChunkIndex(index_filename(master_file))
+    assert len(index.chunks) > 2
+    check_offsets(index, range(10))
+
+    # An append that is only flushed, not closed: the saved index misses its posts until refreshed
+    writer = ChunkWriter(folder, "test", master_file, append=True)
+    for number in range(10, 13):
+        writer.write(post(number))
+    writer.flush()
+    index = ChunkIndex(index_filename(master_file))
+    assert "p12" not in index.posts
+    assert index.refresh(load_json(master_file)["chunks"])
+    check_offsets(index, range(13))
+    writer.close()
+    check_offsets(ChunkIndex(index_filename(master_file)), range(13))
+
+def test_comment_author_filter_matches_comment_authors(tmp_path):
+    folder = str(tmp_path)
+    master_file = os.path.join(folder, "test_master.json")
+    reply = {"id": "t1_b", "author": "spez", "content": "reply", "replies": []}
+    with ChunkWriter(folder, "test", master_file) as writer:
+        writer.write(dict(post(1), author="spez", comments=[{"id": "t1_a", "author": "other", "content": "hi", "replies": []}]))
+        writer.write(dict(post(2), author="other", comments=[{"id": "t1_c", "author": "other", "content": "hi", "replies": [reply]}]))
+    rows = list(iter_comments(master_file, PostFilter(authors=["spez"])))
+    assert [(row["post_id"], row["id"]) for row in rows] == [("p2", "t1_b")]
@@ -0,0 +1,50 @@
+# test_chunk_writer.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import utils
+from utils import ChunkWriter, load_json, iter_saved_posts
+
+def post(number):
+    return {"id": f"p{number}", "created_utc": 1700000000 + number, "title": "x" * 100}
+
+def write_posts(folder, numbers, append=False):
+    master_file = os.path.join(folder, "test_master.json")
+    with ChunkWriter(folder, "test", master_file, append=append) as writer:
+        for number in numbers:
+            writer.write(post(number))
+    return master_file
+
+def saved_ids(master_file):
+    return [saved["id"] for saved in iter_saved_posts(master_file)]
+
+def test_append_continues_the_chunk_set(tmp_path):
+    master_file = write_posts(str(tmp_path), range(3))
+    write_posts(str(tmp_path), range(3, 5), append=True)
+    assert saved_ids(master_file) == ["p0", "p1", "p2", "p3", "p4"]
+    assert load_json(master_file)["count"] == 5
+
+def test_restore_drops_an_interrupted_append(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CHUNK_SIZE_MB", 500 / (1024 * 1024))  # A new chunk every few posts
+    folder = str(tmp_path)
+    master_file = write_posts(folder, range(5))
+    chunks = load_json(master_file)["chunks"]
+
+    writer = ChunkWriter(folder, "test", master_file, append=True)
+    snapshot = writer.snapshot()
+    for number in range(5, 12):
+        writer.write(post(number))
+    writer.flush()
+    writer.abort()  # The run dies after writing into the last chunk and new ones
+    assert len(saved_ids(master_file)) == 12
+
+    writer = ChunkWriter(folder, "test", master_file, append=True)
+    writer.restore(snapshot)
+    writer.write(post(12))
+    writer.close()
+    assert saved_ids(master_file) == ["p0", "p1", "p2", "p3", "p4", "p12"]
+    master = load_json(master_file)
+    assert master["count"] == 6
+    assert master["chunks"][:len(chunks)] == chunks
+    assert sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".jsonl")) == master["chunks"]
@@ -0,0 +1,68 @@
+# test_dedup.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+pytest.importorskip("numpy")
+from dedup import SignatureIndex, Deduplicator
+
+STORY = "my landlord raised the rent again this year and now I cannot afford to stay in the city where I work"
+ADVICE = "always read the whole lease before you sign it and keep a copy of every message you send the landlord"
+
+def comment(comment_id, content, replies=()):
+    return {"id": comment_id, "content": content, "replies": list(replies)}
+
+def first_run(filename):
+    index = SignatureIndex(filename)
+    posts = [{"id": "old", "title": "Rent", "content": STORY, "comments": [comment("c_old", ADVICE)]}]
+    assert list(Deduplicator(index).process(posts)) == posts
+    index.save()
+
+def second_run_posts():
+    return [
+        {"id": "repost", "title": "Rent", "content": STORY + "!", "comments": []},
+        {"id": "new", "title": "Moving out", "content": "we finally found a cheaper flat across the river, moving next month",
+         "comments": [comment("c_copy", ADVICE, [comment("c_reply", "thanks, that is good to know before signing anything")]),
+                      comment("c_short", "same")]},
+    ]
+
+def test_mark_against_saved_index(tmp_path):
+    filename = str(tmp_path / "test_signatures.npz")
+    first_run(filename)
+    deduplicator = Deduplicator(SignatureIndex(filename), "mark")
+    posts = list(deduplicator.process(second_run_posts()))
+    assert [post["id"] for post in posts] == ["repost", "new"]
+    assert posts[0]["duplicate_of"] == "old"
+    assert "duplicate_of" not in posts[1]
+    copied = posts[1]["comments"][0]
+    assert copied["duplicate_of"] == "c_old"
+    assert "duplicate_of" not in copied["replies"][0]
+    assert deduplicator.duplicates == {"post": 1, "comment": 1}
+
+def test_remove_against_saved_index(tmp_path):
+    filename = str(tmp_path / "test_signatures.npz")
+    first_run(filename)
+    index = SignatureIndex(filename)
+    posts = list(Deduplicator(index, "remove").process(second_run_posts()))
+    assert [post["id"] for post in posts] == ["new"]
+    assert [c["id"] for c in posts[0]["comments"]] == ["c_short"]  # The duplicate goes with its replies
+    index.save()
+    assert "new" in SignatureIndex(filename).known
+
+def test_batch_texts_checked_against_every_earlier_bucket_member():
+    # Each version adds a few words: the second is close to the first, the third
+    # only to the second, and the first heads every bucket the third shares
+    words = ("we moved into the flat above the bakery last spring and the smell of bread every morning almost makes up for "
+             "the noise from the street below and the landlord who never answers the phone although the heating broke "
+             "twice in january and nobody came to fix it for weeks").split()
+    versions = [" ".join(words[:length]) for length in (36, 38, 45)]
+    duplicates = SignatureIndex().check([("first", versions[0]), ("second", versions[1]), ("third", versions[2])])
+    assert duplicates == {"second": "first", "third": "first"}
+
+def test_repeated_batch_texts_go_to_the_first_copy():
+    index = SignatureIndex()
+    duplicates = index.check([(f"copy{i}", ADVICE) for i in range(4)] + [("story", STORY)])
+    assert duplicates == {"copy1": "copy0", "copy2": "copy0", "copy3": "copy0"}
+    assert index.known == {"copy0", "story"}
@@ -0,0 +1,48 @@
+# test_deep_threads.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from comment_tree import CommentRecord, CommentBuffer, with_comments, SPILL_COMMENTS, SPILL_DEPTH
+from columnar import iter_comment_rows
+from utils import ChunkWriter, iter_saved_posts
+
+CHAIN_DEPTH = 3000
+
+def reply_chain(depth):
+    parent_id = "t3_post"
+    for i in range(depth):
+        yield CommentRecord(f"t1_{i:x}", parent_id, i, "someone", f"reply {i}", 1700000000 + i, 1)
+        parent_id = f"t1_{i:x}"
+
+def write_post(folder, records, limit=SPILL_COMMENTS, fields=None):
+    buffer = CommentBuffer("post", os.path.join(folder, "test_threads"), limit, fields=fields)
+    buffer.extend(records)
+    master_file = os.path.join(folder, "test_master.json")
+    with ChunkWriter(folder, "test", master_file) as writer:
+        writer.write(with_comments({"id": "post", "created_utc": 1700000000}, buffer.result()))
+    return list(iter_saved_posts(master_file))
+
+def test_deep_chain_is_spilled_and_reads_back(tmp_path):
+    # The count limit alone would keep this thread inline; nested, it is too deep for json.dumps
+    posts = write_post(str(tmp_path), reply_chain(CHAIN_DEPTH), limit=CHAIN_DEPTH)
+    assert len(posts) == 1
+    assert posts[0]["comments"] == []
+    assert posts[0]["comments_count"] == CHAIN_DEPTH
+    rows = list(iter_comment_rows(posts[0]))
+    assert [row["depth"] for row in rows] == list(range(CHAIN_DEPTH))
+    assert all(row["parent_id"] == previous["id"] for previous, row in zip(rows, rows[1:]))
+
+def test_shallow_thread_stays_inline(tmp_path):
+    posts = write_post(str(tmp_path), reply_chain(SPILL_DEPTH))
+    assert "comments_file" not in posts[0]
+    assert len(list(iter_comment_rows(posts[0]))) == SPILL_DEPTH
+
+def test_spilled_thread_keeps_only_profile_fields(tmp_path):
+    fields = ("id", "author", "score")
+    spilled = write_post(str(tmp_path / "spilled"), reply_chain(SPILL_DEPTH + 1), fields=fields)
+    inline = write_post(str(tmp_path / "inline"), reply_chain(3), fields=fields)
+    assert set(inline[0]["comments"][0]) == {"id", "author", "score", "replies"}
+    rows = list(iter_comment_rows(spilled[0]))
+    assert len(rows) == SPILL_DEPTH + 1
+    assert all(set(row) == {"post_id", "id", "parent_id", "depth", "author", "score"} for row in rows)
@@ -0,0 +1,68 @@
+# test_expansion_budget.py
+import os
+import sys
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+pytest.importorskip("praw")
+from fetch_comments import expand_comments, count_request, ExpansionBudget
+
+WORKERS = 3
+RUN_BUDGET = 30
+STUBS = 20
+
+class FakeForest:
+    """
+    Stands in for a CommentForest with `stubs` MoreComments, using `limit`
+    the way PRAW's replace_more does; each expansion makes one request.
+    """
+    def __init__(self, stubs, barrier):
+        self.stubs = stubs
+        self.barrier = barrier
+        self.expanded = 0
+
+    def replace_more(self, limit=32, threshold=0):
+        remaining = limit
+        skipped = []
+        for stub in range(self.stubs):
+            if remaining is not None and remaining <= 0:
+                skipped.append(stub)
+                continue
+            count_request()
+            self.expanded += 1
+            if self.expanded == 1:
+                # Every worker has made its first expansion before any goes on
+                self.barrier.wait()
+            if remaining is not None:
+                remaining -= 1
+        return skipped
+
+def test_run_budget_is_shared_between_workers():
+    run_budget = ExpansionBudget(RUN_BUDGET)
+    barrier = threading.Barrier(WORKERS, timeout=5)
+    forests = [FakeForest(STUBS, barrier) for _ in range(WORKERS)]
+    submissions = [SimpleNamespace(id=f"p{i}", comments=forest) for i, forest in enumerate(forests)]
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        left = list(executor.map(lambda submission: expand_comments(submission, None, run_budget), submissions))
+    assert all(forest.expanded for forest in forests)
+    assert sum(forest.expanded for forest in forests) == RUN_BUDGET
+    assert sum(left) == WORKERS * STUBS - RUN_BUDGET
+    assert run_budget.remaining == 0
+
+def test_post_budget_caps_each_post():
+    run_budget = ExpansionBudget(100)
+    forest = FakeForest(STUBS, threading.Barrier(1))
+    assert expand_comments(SimpleNamespace(id="p", comments=forest), 5, run_budget) == STUBS - 5
+    assert forest.expanded == 5
+    assert run_budget.remaining == 95
+
+def test_only_expansions_made_are_charged():
+    run_budget = ExpansionBudget(100)
+    forest = FakeForest(3, threading.Barrier(1))
+    assert expand_comments(SimpleNamespace(id="p", comments=forest), None, run_budget) == 0
+    assert forest.expanded == 3
+    assert run_budget.remaining == 97
@@ -0,0 +1,81 @@
+# test_more_children.py
+import os
+import sys
+import glob
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+NOAUTH_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "NoCredentials")
+NOAUTH_MODULES = [os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(NOAUTH_FOLDER, "*.py"))]
+
+@pytest.fixture
+def noauth(monkeypatch):
+    """
+    The NoCredentials utils and fetch_comments modules. They share names with
+    the PRAW ones (utils, comment_tree, ...), so they are imported fresh and
+    the modules loaded before are put back afterwards.
+    """
+    pytest.importorskip("requests")
+    saved = dict(sys.modules)
+    monkeypatch.syspath_prepend(NOAUTH_FOLDER)
+    for name in NOAUTH_MODULES:
+        sys.modules.pop(name, None)
+    yield SimpleNamespace(utils=importlib.import_module("utils"), fetch_comments=importlib.import_module("fetch_comments"))
+    sys.modules.clear()
+    sys.modules.update(saved)
+
+def comment(name, parent_id):
+    return {"kind": "t1", "data": {"name": name, "parent_id": parent_id, "author": "a", "body": name, "created_utc": 1, "score": 1}}
+
+def more(*children):
+    return {"kind": "more", "data": {"children": list(children)}}
+
+def serve(noauth, monkeypatch, responses):
+    """
+    Answer morechildren calls from responses ({children: things, or None to fail}); returns the batches asked for.
+    """
+    batches = []
+
+    def make_request(url, params=None, limiter=None, cache=None):
+        batches.append(params["children"])
+        things = responses[params["children"]]
+        return None if things is None else {"json": {"data": {"things": things}}}
+    monkeypatch.setattr(noauth.fetch_comments, "make_request", make_request)
+    return batches
+
+def known_records(noauth):
+    CommentRecord = noauth.fetch_comments.CommentRecord
+    return [CommentRecord("t1_a", "t3_p", 0, "a", "a", 1, 1), CommentRecord("t1_b", "t1_a", 1, "a", "b", 1, 1)]
+
+def test_depths_and_nested_more_stubs(noauth, monkeypatch):
+    batches = serve(noauth, monkeypatch, {
+        # t1_e is listed before its parent t1_c; the nested stub's ids come back in a later batch
+        "c,d": [comment("t1_e", "t1_c"), comment("t1_c", "t1_b"), comment("t1_d", "t3_p"), more("f")],
+        "f": [comment("t1_f", "t1_d")]
+    })
+    records = known_records(noauth)
+    noauth.fetch_comments.expand_more_children("p", ["c", "d"], records)
+    assert batches == ["c,d", "f"]
+    assert {record.id: record.depth for record in records[2:]} == {"t1_e": 3, "t1_c": 2, "t1_d": 0, "t1_f": 1}
+
+def test_failed_batch_is_skipped(noauth, monkeypatch):
+    monkeypatch.setattr(noauth.fetch_comments, "MORE_CHILDREN_BATCH", 1)
+    batches = serve(noauth, monkeypatch, {"c": None, "d": [comment("t1_d", "t1_a")]})
+    records = known_records(noauth)
+    noauth.fetch_comments.expand_more_children("p", ["c", "d"], records)
+    assert batches == ["c", "d"]
+    assert [(record.id, record.depth) for record in records[2:]] == [("t1_d", 1)]
+
+def test_every_request_asks_for_raw_json(noauth, monkeypatch):
+    sent = []
+
+    class Session:
+        def get(self, url, headers=None, params=None, timeout=None):
+            sent.append(params)
+            return SimpleNamespace(status_code=200, headers={}, content=b"{}", json=lambda: {})
+    monkeypatch.setattr(noauth.utils, "get_session", Session)
+    noauth.utils.make_request("https://www.reddit.com/r/test/new.json", {"limit": 100})
+    noauth.utils.make_request("https://www.reddit.com/r/test/about.json")
+    assert [params.get("raw_json") for params in sent] == [1, 1]
@@ -0,0 +1,93 @@
+# test_resume.py
+import os
+import sys
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+pytest.importorskip("praw")
+import discovery
+from fetch_posts import iter_posts, PAGE_SIZE
+from utils import Checkpoint
+
+class FakeSubreddit:
+    def __init__(self, submissions, calls):
+        self.submissions = submissions
+        self.calls = calls
+
+    def new(self, limit, params):
+        self.calls.append(params)
+        start = 0
+        if params.get("after"):
+            start = next(i for i, s in enumerate(self.submissions) if s.fullname == params["after"]) + 1
+        return self.submissions[start:start + limit]
+
+class FakePool:
+    def __init__(self, post_count):
+        now = time.time()
+        self.submissions = [
+            SimpleNamespace(id=f"p{i}", fullname=f"t3_p{i}", title="t", selftext="", author="a",
+                            created_utc=now - i, score=1, url="", num_comments=0)
+            for i in range(post_count)
+        ]
+        self.calls = []
+
+    def __len__(self):
+        return 1
+
+    @contextmanager
+    def lease(self):
+        yield SimpleNamespace(reddit=SimpleNamespace(subreddit=lambda name: FakeSubreddit(self.submissions, self.calls)))
+
+def test_killed_after_last_page_resumes_without_relisting(tmp_path):
+    filename = str(tmp_path / "test_checkpoint.jsonl")
+    pool = FakePool(PAGE_SIZE + 50)
+    checkpoint = Checkpoint(filename)
+    listing = iter_posts(pool, "test", 2000, checkpoint)
+    # The consumer takes every post but is killed before asking for more
+    first = [next(listing)["id"] for _ in range(PAGE_SIZE + 50)]
+    checkpoint.file.close()
+
+    resumed = Checkpoint(filename)
+    assert resumed.posts_done
+    calls = len(pool.calls)
+    second = [post["id"] for post in iter_posts(pool, "test", 2000, resumed)]
+    assert second == first
+    assert len(pool.calls) == calls
+
+def test_failed_discovery_resumes_only_unfinished_sources(tmp_path, monkeypatch):
+    now = time.time()
+    failing = {"hot"}
+    calls = []
+
+    def fetch_listing_page(pool, subreddit_name, source):
+        # Two pages per listing, each with posts no other listing has
+        calls.append(source.name)
+        if source.name in failing:
+            return None
+        page = 2 if source.after else 1
+        posts = [{"id": f"{source.name}-{page}-{i}", "created_utc": now - i} for i in range(10)]
+        return posts, "next" if page == 1 else None
+
+    monkeypatch.setattr(discovery, "fetch_listing_page", fetch_listing_page)
+    monkeypatch.setattr(discovery, "RETRY_SECONDS", 0)
+    filename = str(tmp_path / "test_checkpoint.jsonl")
+    checkpoint = Checkpoint(filename)
+    first = []
+    with pytest.raises(RuntimeError):
+        for post in discovery.iter_discovered_posts(FakePool(0), "test", 2000, checkpoint, min_yield=0):
+            first.append(post["id"])
+    checkpoint.file.close()
+    assert calls.count("hot") == discovery.PAGE_RETRIES + 1
+
+    failing.clear()
+    calls.clear()
+    resumed = Checkpoint(filename)
+    second = [post["id"] for post in discovery.iter_discovered_posts(FakePool(0), "test", 2000, resumed, min_yield=0)]
+    assert calls == ["hot", "hot"]
+    assert second[:len(first)] == first
+    assert sorted(second[len(first):]) == sorted(f"hot-{page}-{i}" for page in (1, 2) for i in range(10))
+    assert resumed.posts_done
@@ -0,0 +1,26 @@
+# test_smoke.py
+import os
+import sys
+
+import pytest
+
+BENCH_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+sys.path.insert(0, BENCH_FOLDER)
+from mock_reddit import MockReddit, start_server
+from bench_crawl import bench_backend
+
+POSTS = 30
+
+@pytest.mark.parametrize("backend", ["praw", "noauth"])
+def test_run_job_against_mock_server(backend):
+    # Each crawl imports its backend's master.py in a subprocess and runs run_job end to end
+    pytest.importorskip("praw" if backend == "praw" else "requests")
+    mock = MockReddit(POSTS, comments=5, depth=2, more=1)
+    server, base_url = start_server(mock)
+    try:
+        options = {"workers": 2} if backend == "praw" else {}
+        result = bench_backend(backend, mock, base_url, options)
+    finally:
+        server.shutdown()
+    assert result["posts"] == POSTS
+    assert result["requests_by_endpoint"]
@@ -0,0 +1,71 @@
+# test_sqlite_resume.py
+import os
+import sys
+import sqlite3
+import subprocess
+
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+pytest.importorskip("praw")
+from mock_reddit import MockReddit, start_server
+from bench_crawl import PRAW_INI
+
+POSTS = 40
+KILL_AFTER = 23
+
+# Commits every 5 posts, so the database holds part of the run, then dies without any cleanup
+CRAWL = """
+import os, sys
+sys.path.insert(0, {repo_root!r})
+import master
+from sqlite_store import SQLiteStore
+kill_after = int(sys.argv[1])
+write = SQLiteStore.write
+
+def write_and_die(self, post):
+    write(self, post)
+    if self.count % 5 == 0:
+        self.flush()
+    if self.count == kill_after:
+        os._exit(1)
+SQLiteStore.write = write_and_die
+master.run_job("bench", 2000, {{"praw_sites": ["bench", "bench"], "output_format": "sqlite", "output_root": os.getcwd()}})
+"""
+
+def crawl(folder, base_url, kill_after=0):
+    with open(os.path.join(folder, "praw.ini"), "w") as f:
+        f.write(PRAW_INI.format(base_url=base_url))
+    script = CRAWL.format(repo_root=os.path.abspath(REPO_ROOT))
+    return subprocess.run([sys.executable, "-c", script, str(kill_after)], cwd=folder, capture_output=True, text=True)
+
+def stored(folder):
+    conn = sqlite3.connect(os.path.join(folder, "bench_data", "bench.db"))
+    try:
+        posts = [row[0] for row in conn.execute("SELECT id FROM posts")]
+        comments = sorted(conn.execute("SELECT post_id, id, parent_id, depth FROM comments"))
+    finally:
+        conn.close()
+    return posts, comments
+
+def test_killed_sqlite_run_resumes_without_duplicates(tmp_path):
+    mock = MockReddit(POSTS, comments=5, depth=2, more=1)
+    server, base_url = start_server(mock)
+    try:
+        killed, clean = str(tmp_path / "killed"), str(tmp_path / "clean")
+        os.makedirs(killed)
+        os.makedirs(clean)
+        assert crawl(killed, base_url, KILL_AFTER).returncode == 1
+        assert os.path.exists(os.path.join(killed, "bench_data", "bench_checkpoint.jsonl"))
+        assert 0 < len(stored(killed)[0]) < POSTS
+        resumed = crawl(killed, base_url)
+        assert resumed.returncode == 0, resumed.stderr[-2000:]
+        assert "Resuming previous run" in resumed.stdout
+        assert crawl(clean, base_url).returncode == 0
+    finally:
+        server.shutdown()
+    posts, comments = stored(killed)
+    assert len(posts) == len(set(posts)) == POSTS
+    assert comments == stored(clean)[1]
+    assert not os.path.exists(os.path.join(killed, "bench_data", "bench_checkpoint.jsonl"))
@@ -0,0 +1,43 @@
+# test_work_queue.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from work_queue import WorkQueue, MAX_ATTEMPTS
+
+def make_queue(folder, count=3):
+    queue = WorkQueue(os.path.join(folder, "test_queue.db"))
+    queue.record_posts([{"id": f"p{i}"} for i in range(count)], None)
+    queue.record_posts_done()
+    return queue
+
+def test_expired_lease_is_handed_out_again(tmp_path):
+    queue = make_queue(str(tmp_path))
+    assert [post["id"] for post in queue.lease("a", lease_seconds=-1)] == ["p0", "p1", "p2"]
+    assert queue.lease("b", batch_size=2) == [{"id": "p0"}, {"id": "p1"}]
+    queue.complete(["p0", "p1"])
+    assert queue.lease("b") == [{"id": "p2"}]
+    assert not queue.finished()
+    queue.complete(["p2"])
+    assert queue.finished()
+
+def test_live_lease_is_not_handed_out(tmp_path):
+    queue = make_queue(str(tmp_path))
+    assert len(queue.lease("a")) == 3
+    assert queue.lease("b") == []
+
+def test_expired_leases_fail_after_max_attempts(tmp_path):
+    queue = make_queue(str(tmp_path), count=1)
+    for _ in range(MAX_ATTEMPTS):
+        assert queue.lease("a", lease_seconds=-1) == [{"id": "p0"}]
+    assert queue.lease("a") == []
+    assert queue.counts() == {"failed": 1}
+    assert queue.finished()
+
+def test_released_posts_fail_after_max_attempts(tmp_path):
+    queue = make_queue(str(tmp_path), count=1)
+    for _ in range(MAX_ATTEMPTS):
+        assert queue.lease("a") == [{"id": "p0"}]
+        queue.release("a", ["p0"])
+    assert queue.counts() == {"failed": 1}
+    assert queue.finished()
@@ -0,0 +1,140 @@
+# work_queue.py
+import json
+import time
+import sqlite3
+
+# -------------------------
+# CONFIGURATION
+# -------------------------
+LEASE_SECONDS = 600          # A leased batch is handed out again if not completed in time
+BATCH_SIZE = 10              # Posts per lease
+MAX_ATTEMPTS = 5             # Leases per post before it is marked failed
+
+class WorkQueue:
+    """
+    Durable queue of posts waiting for their comments, stored in SQLite
+    ({subreddit}_queue.db). Any number of worker processes, on one machine or
+    on several machines sharing a filesystem with working file locks, lease
+    batches of posts; a lease that is not completed before it expires is
+    handed out again, so a dead worker never loses work.
+
+    During discovery it also stands in for a Checkpoint (record_posts /
+    record_posts_done / posts / after), so fetch_posts enqueues every page
+    as soon as it is listed and an interrupted discovery resumes.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        # Default rollback journal: WAL needs shared memory and does not work on network filesystems
+        self.conn = sqlite3.connect(filename, timeout=60, isolation_level=None)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                post_id TEXT PRIMARY KEY,
+                seq INTEGER,
+                post TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, seq)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    # -------------------------
+    # Discovery side
+    # -------------------------
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def enqueue(self, posts):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM tasks").fetchone()[0]
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (post_id, seq, post) VALUES (?, ?, ?)",
+                [(post["id"], seq + i + 1, json.dumps(post, ensure_ascii=False)) for i, post in enumerate(posts)]
+            )
+
+    @property
+    def posts(self):
+        rows = self.conn.execute("SELECT post FROM tasks ORDER BY seq")
+        return [json.loads(row[0]) for row in rows]
+
+    @property
+    def after(self):
+        return self.get_meta("after")
+
+    @property
+    def posts_done(self):
+        return self.get_meta("discovery_done", False)
+
+    def record_posts(self, posts, after):
+        self.enqueue(posts)
+        self.set_meta("after", after)
+
+    def record_posts_done(self):
+        self.set_meta("discovery_done", True)
+
+    # -------------------------
+    # Worker side
+    # -------------------------
+    def lease(self, worker, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS):
+        """
+        Atomically take up to batch_size pending (or expired) posts. Returns post dicts.
+        An expired lease that already used MAX_ATTEMPTS is marked failed instead.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                """UPDATE tasks SET status = 'failed', lease_expires = NULL
+                   WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?""",
+                (now, MAX_ATTEMPTS)
+            )
+            rows = self.conn.execute(
+                """SELECT post_id, post FROM tasks
+                   WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ? AND attempts < ?)
+                   ORDER BY seq LIMIT ?""",
+                (now, MAX_ATTEMPTS, batch_size)
+            ).fetchall()
+            self.conn.executemany(
+                """UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1
+                   WHERE post_id = ?""",
+                [(worker, now + lease_seconds, row[0]) for row in rows]
+            )
+        return [json.loads(row[1]) for row in rows]
+
+    def complete(self, post_ids):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("UPDATE tasks SET status = 'done', lease_expires = NULL WHERE post_id = ?",
+                                  [(post_id,) for post_id in post_ids])
+
+    def release(self, worker, post_ids):
+        """
+        Give failed posts back to the queue (or mark them failed after MAX_ATTEMPTS).
+        """
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                """UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                   lease_expires = NULL WHERE post_id = ? AND worker = ? AND status = 'leased'""",
+                [(MAX_ATTEMPTS, post_id, worker) for post_id in post_ids]
+            )
+
+    def counts(self):
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        return dict(rows.fetchall())
+
+    def finished(self):
+        """
+        True once discovery is done and no post is pending or leased.
+        """
+        counts = self.counts()
+        return self.posts_done and not counts.get("pending") and not counts.get("leased")
+
+    def close(self):
+        self.conn.close()